@@ -1,134 +1,312 @@
+import argparse
+import os
 import sys
-from calyx.builder import Builder, while_, if_, invoke, const
+from calyx.builder import Builder, if_, invoke, const
 from calyx import py_ast as ast
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "common"))
+from kernels import (  # noqa: E402
+    SHAPES, Accumulator, build_count, build_map_reduce, build_mem,
+    build_reduce, build_tree, summer,
+)
+from multi import build_batch  # noqa: E402
+from parallelize import parallelize  # noqa: E402
+from readyvalid import build_stream  # noqa: E402
+from static import infer_static  # noqa: E402
+from tracing import build_trace, check_arguments  # noqa: E402
+from widths import bits, fit  # noqa: E402
+
 WIDTH = 32
 MAX_SIZE = 4096
 IDX_WIDTH = MAX_SIZE.bit_length()
 
-
-def build_mem(comp, name, width, size):
-    idx_width = size.bit_length()
-    comp.prog.import_("primitives/memories.futil")
-    inst = ast.CompInst("seq_mem_d1", [width, size, idx_width])
-    return comp.cell(name, inst, is_external=True)
+# Options that change how a design works but not what it computes, for
+# `common/tune.py` to explore. Each knob is a list of alternatives, which
+# can use the value ranges from `convert.py --meta`.
+TUNING_SPACE = [
+    ["", "--parallelize"],
+    ["", "--static"],
+    ["", "--max-total {max_total}"],
+]
 
 
-def build(num_elves):
+def build(num_elves, resumable=False, stream=False, both=False,
+          max_total=None, batch=None, trace=None, shape="balanced"):
     """Build the `main` function for AOC day 1.
 
     `num_elves` is the number of elves whose total calorie count we will
     maximize. Set to 1 for part 1 of the puzzle and 3 for part 2.
+
+    With `resumable`, the accelerator can process an input in chunks.
+    It loads the running state (the calories for the current elf so far
+    and the top K values) from extra interface memories at the start and
+    saves it back at the end. A one-bit `last` memory says whether this
+    is the final chunk, i.e., whether to count the current elf.
+
+    With `stream`, the accelerator receives its input through a
+    ready/valid stream called `elem` instead of preloaded memories.
+
+    With `both`, the accelerator solves both parts of the puzzle in one
+    pass: the top K structure also produces its largest value, which is
+    the part 1 answer. The two answers go in a two-entry `answer`
+    memory.
+
+    With `max_total`, a bound on every elf's total calories, the
+    registers and adders are only as wide as those totals (and their
+    sum) need to be, instead of `WIDTH` bits.
+
+    With `batch`, the accelerator solves that many independent inputs in
+    one run (see `common/multi.py`). Their values go one after another
+    in the `calories` and `markers` memories, `count` has an entry for
+    each input, and each input's answers go in the next entries of
+    `answer`. We clear the accumulator and the top K between inputs.
+
+    With `trace`, the accelerator records the start and end cycles of
+    each element's iteration in a ring buffer of that many entries (see
+    `common/tracing.py`). An iteration that starts a new elf includes
+    pushing the last elf's total into the top K.
+
+    The loop over the input memories is a map/reduce kernel (see
+    `common/kernels.py`) that adds each value to the accumulator. The
+    top K structure combines its registers with reduction trees of the
+    given `shape`.
     """
+    assert not (resumable and stream), "streams are already unbounded"
+    assert not (resumable and both), "fused designs are not resumable"
+    assert not (batch and (resumable or stream)), \
+        "batches hold whole inputs in memory"
     prog = Builder()
     main = prog.component("main")
 
-    # Interface memories.
-    calories = build_mem(main, "calories", WIDTH, MAX_SIZE)
-    markers = build_mem(main, "markers", 1, MAX_SIZE)
-    count = build_mem(main, "count", WIDTH, 1)
-    answer = build_mem(main, "answer", WIDTH, 1)
+    # Output memory.
+    answers = (2 if both else 1) * (batch or 1)
+    answer = build_mem(main, "answer", WIDTH, answers)
 
-    # Temporaries.
-    index = main.reg("index", IDX_WIDTH)
-    count_reg = main.reg("count_reg", IDX_WIDTH)
-
-    # Initialize count register for convenient access.
-    slice = main.cell("slice", ast.Stdlib().slice(WIDTH, IDX_WIDTH))
-    with main.group("init_count") as init_count:
-        count.addr0 = 0
-        count.read_en = 1
-
-        count_reg.write_en = count.read_done
-        slice.in_ = count.out
-        count_reg.in_ = slice.out
-        init_count.done = count_reg.done
-
-    # Initialize index counter to zero. (Maybe this is unnecessary.)
-    with main.group("init_index") as init_index:
-        index.in_ = 0
-        index.write_en = 1
-        init_index.done = index.done
-
-    # Loop control comparison.
-    lt = main.cell("lt", ast.Stdlib().op("lt", IDX_WIDTH, signed=False))
-    with main.comb_group("cmp") as cmp:
-        lt.left = index.out
-        lt.right = count_reg.out
-
-    # Loop control increment.
-    incr_add = main.add("incr_add", IDX_WIDTH)
-    with main.group("incr") as incr:
-        incr_add.left = index.out
-        incr_add.right = 1
-        index.in_ = incr_add.out
-        index.write_en = 1
-        incr.done = index.done
-
-    # Reset calorie accumulator.
-    accum = main.reg("accum", WIDTH)
-    with main.group("clear_accum") as clear_accum:
-        accum.in_ = 0
-        accum.write_en = 1
-        clear_accum.done = accum.done
+    # Datapath widths for a single elf's total and the sum of the top K.
+    if max_total:
+        width = bits(max_total)
+        total_width = bits(num_elves * max_total)
+    else:
+        width = total_width = WIDTH
 
-    # Accumulate calories.
-    add = main.add("add", WIDTH)
-    with main.group("accum_calories") as accum_calories:
-        calories.read_en = 1
-        calories.addr0 = index.out
-
-        add.left = calories.out
-        add.right = accum.out
-
-        accum.in_ = add.out
-        accum.write_en = calories.read_done
-        accum_calories.done = accum.done
-
-    # Check whether we're looking at a new elf. We have to register the
-    # result of the (sequential) check so we can use it in an `if`.
-    eq = main.cell("eq", ast.Stdlib().op("eq", 1, signed=False))
-    new_elf_reg = main.reg("new_elf_reg", 1)
-    with main.group("new_elf_check") as new_elf_check:
-        markers.read_en = 1
-        markers.addr0 = index.out
-        eq.left = markers.out
-        eq.right = 1
-        new_elf_reg.write_en = markers.read_done
-        new_elf_reg.in_ = eq.out
-        new_elf_check.done = new_elf_reg.done
+    # Calorie accumulator, and a group to reset it.
+    accum = Accumulator(main, "accum", width)
+    clear_accum = accum.clear()
 
     # Machinery to track the top K elves.
-    topk_def = build_topk(prog, num_elves)
+    topk_def = build_topk(prog, num_elves, expose=resumable, largest=both,
+                          width=width, total_width=total_width,
+                          clearable=bool(batch), shape=shape)
     topk = main.cell("topk", topk_def)
 
+    def push(value, clear=0):
+        if batch:
+            return invoke(topk, in_value=value, in_clear=const(1, clear))
+        return invoke(topk, in_value=value)
+    count_last = push(accum.out)
+
+    # The loop over the inputs in a batch, which prefetches each input's
+    # count.
+    if batch:
+        count = build_mem(main, "count", WIDTH, batch)
+        inputs = build_batch(main, batch, count, WIDTH,
+                             answers.bit_length())
+    else:
+        inputs = None
+
+    # Per-iteration latency tracing.
+    tracer = build_trace(main, trace) if trace else None
+
+    # The main loop, which runs `new_elf` whenever an elf starts.
+    new_elf = [
+        push(accum.out),
+        clear_accum,
+    ]
+    if stream:
+        setup, loop = build_stream_loop(main, accum, new_elf, tracer)
+    else:
+        setup, loop = build_mem_loop(main, accum, new_elf, inputs, tracer)
+
     # Publish the answer back to an interface memory.
     with main.group("finish") as finish:
         answer.write_en = 1
-        answer.addr0 = 0
-        answer.in_ = topk.total
+        answer.addr0 = inputs.answer_idx.out if batch else 1 if both else 0
+        answer.in_ = fit(main, "total_pad", topk.total, total_width, WIDTH)
         finish.done = answer.write_done
 
+    # The fused design also publishes the part 1 answer.
+    if both:
+        with main.group("finish_max") as finish_max:
+            answer.write_en = 1
+            answer.addr0 = inputs.answer_idx.out if batch else 0
+            answer.in_ = fit(main, "max_pad", topk.max, width, WIDTH)
+            finish_max.done = answer.write_done
+        finish = [finish_max, finish]
+    else:
+        finish = [finish]
+
+    # Carry state between chunks.
+    if resumable:
+        load_state, save_state = build_state(main, num_elves, accum, width,
+                                             topk, count_last)
+    else:
+        load_state, save_state = [], [count_last]  # Count last elf.
+
+    # Save the trace's iteration count at the very end.
+    trace_end = [tracer.save_count] if tracer else []
+
     # The control program.
-    main.control += [
-        {init_count, init_index},
-        while_(lt.out, cmp, [
-            new_elf_check,
-            if_(new_elf_reg.out, None, [
-                invoke(topk, in_value=accum.out),
-                clear_accum,
-            ]),
-            accum_calories,
-            incr,
-        ]),
-        invoke(topk, in_value=accum.out),  # Count last elf.
-        finish,
-    ]
+    if batch:
+        # Start each input from scratch.
+        main.control += [
+            inputs.control([
+                {clear_accum, push(const(width, 0), clear=1)},
+                *setup,
+                loop,
+                *save_state,
+            ], finish),
+            *trace_end,
+        ]
+    else:
+        main.control += [
+            *setup,
+            *load_state,
+            loop,
+            *save_state,
+            *finish,
+            *trace_end,
+        ]
 
     return prog.program
 
 
-def build_topk(prog: Builder, k: int):
+def build_mem_loop(main, accum, new_elf, inputs=None, tracer=None):
+    """Build a loop over the calorie values in the interface memories.
+
+    With `inputs`, the loop over a batch, the loop covers the current
+    input, and the next loop picks up where this one left off in the
+    memories. With `tracer`, we trace every iteration. Return the
+    control statements to set up the loop and the loop itself.
+
+    The loop is a one-lane map/reduce kernel: the elf boundaries make
+    each value depend on the previous ones, so the lanes of an unrolled
+    kernel could not add up their values independently.
+    """
+    # Initialize count register for convenient access.
+    if inputs:
+        count_reg, init_count = build_count(
+            main, "count", IDX_WIDTH, port=inputs.loop.regs["count"].out,
+            src_width=WIDTH,
+        )
+    else:
+        count = build_mem(main, "count", WIDTH, 1)
+        count_reg, init_count = build_count(main, "count", IDX_WIDTH,
+                                            mem=count, src_width=WIDTH)
+
+    # Walk both memories, prefetching each element while we work on the
+    # previous one.
+    elem = build_map_reduce(main, "elem", count_reg.out, IDX_WIDTH, [
+        ("calories", WIDTH),
+        ("markers", 1),
+    ], MAX_SIZE, consecutive=bool(inputs))
+    lane = elem.lanes[0]
+
+    # Accumulate calories.
+    accum_calories = elem.reduce("accum_calories", accum,
+                                 [lane["calories"].out], WIDTH)
+
+    body = [
+        if_(lane["markers"].out, None, new_elf),
+        accum_calories,
+    ]
+    if tracer:
+        body = tracer.wrap(body)
+    return [init_count], elem.control(body)
+
+
+def build_stream_loop(main, accum, new_elf, tracer=None):
+    """Build a loop over the calorie values arriving on a stream.
+
+    The `elem` stream carries the same calorie values and new-elf
+    markers that the memories would otherwise hold. We loop until we
+    have processed the element marked as the last one, receiving each
+    element while we process the one before it. With `tracer`, we trace
+    the work on every element.
+    """
+    elem = build_stream(main, "elem", [("calories", WIDTH), ("markers", 1)],
+                        prefetch=True)
+
+    # Accumulate calories.
+    accum_calories = build_reduce(main, "accum_calories", accum,
+                                  [elem.regs["calories"].out], WIDTH)
+
+    body = [
+        if_(elem.regs["markers"].out, None, new_elf),
+        accum_calories,
+    ]
+    if tracer:
+        body = tracer.wrap(body)
+    return [], elem.control(body)
+
+
+def build_state(main, k, accum, width, topk, count_last):
+    """Build the machinery for carrying state between chunks.
+
+    Return two lists of control statements: one that restores the state
+    at the beginning and one that saves it at the end. We restore the
+    top K values by simply pushing the saved values into the (empty)
+    `topk` component, which saves us from adding a way to write its
+    registers directly.
+    """
+    state_accum = build_mem(main, "state_accum", WIDTH, 1)
+    state_topk = build_mem(main, "state_topk", WIDTH, k)
+    last = build_mem(main, "last", 1, 1)
+
+    # Restore (and save) the calorie count for an elf that spans chunks.
+    load_accum, save_accum = accum.state(state_accum, WIDTH)
+
+    # Check whether this is the final chunk.
+    last_reg = main.reg("last_reg", 1)
+    with main.group("load_last") as load_last:
+        last.addr0 = 0
+        last.read_en = 1
+        last_reg.write_en = last.read_done
+        last_reg.in_ = last.out
+        load_last.done = last_reg.done
+
+    # Restore and save each of the top K values.
+    carried = main.reg("carried", width)
+    load_state = [{load_accum, load_last}]
+    save_state = [
+        if_(last_reg.out, None, count_last),  # Count last elf.
+        save_accum,
+    ]
+    for i in range(k):
+        with main.group(f"load_top{i}") as load_top:
+            state_topk.addr0 = i
+            state_topk.read_en = 1
+            carried.write_en = state_topk.read_done
+            carried.in_ = fit(main, f"top{i}_slice", state_topk.out, WIDTH,
+                              width)
+            load_top.done = carried.done
+        load_state += [load_top, invoke(topk, in_value=carried.out)]
+
+        with main.group(f"save_top{i}") as save_top:
+            state_topk.addr0 = i
+            state_topk.write_en = 1
+            state_topk.in_ = fit(main, f"top{i}_pad",
+                                 getattr(topk, f"top{i}"), width, WIDTH)
+            save_top.done = state_topk.write_done
+        save_state.append(save_top)
+
+    return load_state, save_state
+
+
+def build_topk(prog: Builder, k: int, expose: bool = False,
+               largest: bool = False, width: int = WIDTH,
+               total_width: int = WIDTH, clearable: bool = False,
+               shape: str = "balanced"):
     """Build a component that tracks the largest K values it sees.
 
     The strategy is that we keep the current "running" top K in K
@@ -140,66 +318,96 @@ def build_topk(prog: Builder, k: int):
     probably acceptable for small K and admits reasonable parallelism;
     for larger K, you might want to store state about the order of the
     current top K.
+
+    With `expose`, the component also has `top0` through `top{K-1}`
+    outputs with the raw register values. With `largest`, it has a `max`
+    output with the largest of the values. The values are `width` bits
+    wide and their sum is `total_width` bits wide. With `clearable`, it
+    has a `clear` input that forgets all the values instead of pushing
+    one. The sum, maximum, and minimum come from reduction trees of the
+    given `shape` (see `common/kernels.py`).
     """
     topk = prog.component(f"top{k}")
 
     # You invoke the component with a new value to "push" into the set,
     # and you get the sum of the top K values you have ever pushed in
     # the past.
-    topk.input("value", WIDTH)
-    topk.output("total", WIDTH)
+    topk.input("value", width)
+    if clearable:
+        topk.input("clear", 1)
+    topk.output("total", total_width)
+    if expose:
+        for i in range(k):
+            topk.output(f"top{i}", width)
+    if largest:
+        topk.output("max", width)
 
     # We keep track of the top K values in K registers.
     regs = [
-        topk.reg(f"reg{i}", WIDTH)
+        topk.reg(f"reg{i}", width)
         for i in range(k)
     ]
 
-    # Continuously produce the sum of these registers. This could be a
-    # reduction tree, but for now it's just a reduction "stick."
+    # Continuously produce the sum of these registers.
     with topk.continuous:
-        last_add = regs[0].out
-        for i in range(1, k):
-            add = topk.add(f"sum{i}", WIDTH)
-            add.left = last_add
-            add.right = regs[i].out
-            last_add = add.out
-        topk.this().total = last_add
+        pads = [
+            fit(topk, f"pad{i}", reg.out, width, total_width)
+            for i, reg in enumerate(regs)
+        ]
+        topk.this().total = build_tree(pads, summer(topk, "sum",
+                                                    total_width), shape)
+        if expose:
+            for i in range(k):
+                setattr(topk.this(), f"top{i}", regs[i].out)
+
+        # Another tree of comparisons for the largest value.
+        if largest:
+            def larger(i, left, right):
+                max_gt = topk.cell(f"max_gt{i}",
+                                   ast.Stdlib().op("gt", width, signed=False))
+                max_gt.left = left
+                max_gt.right = right
+                max_val = topk.cell(f"max_val{i}",
+                                    ast.Stdlib().op("wire", width,
+                                                    signed=False))
+                max_val.in_ = max_gt.out @ left
+                max_val.in_ = ~max_gt.out @ right
+                return max_val.out
+            topk.this().max = build_tree([reg.out for reg in regs], larger,
+                                         shape)
 
     # Similarly, continuously compute the min and argmin of all our
     # current values. There's a chance it would be better to wrap this
     # up in a `comb group`, but it's not clear exactly where we would
     # `with` it.
     idx_width = k.bit_length()
+
+    def smaller(i, left, right):
+        (left_val, left_idx), (right_val, right_idx) = left, right
+
+        # Compare the two candidates.
+        lt = topk.cell(f"lt{i}", ast.Stdlib().op("lt", width, signed=False))
+        lt.left = left_val
+        lt.right = right_val
+
+        # Produce the resulting min and argmin.
+        val = topk.cell(f"val{i}",
+                        ast.Stdlib().op("wire", width, signed=False))
+        idx = topk.cell(f"idx{i}",
+                        ast.Stdlib().op("wire", idx_width, signed=False))
+        val.in_ = lt.out @ left_val
+        val.in_ = ~lt.out @ right_val
+        idx.in_ = lt.out @ left_idx
+        idx.in_ = ~lt.out @ right_idx
+        return val.out, idx.out
+
     with topk.group("argmin") as argmin:
-        last_val = regs[0].out
-        last_idx = 0
-        for i in range(1, k):
-            left_val = last_val
-            left_idx = last_idx
-
-            # Compare with the next register.
-            lt = topk.cell(f"lt{i}",
-                           ast.Stdlib().op("lt", WIDTH, signed=False))
-            lt.left = left_val
-            lt.right = regs[i].out
-
-            # Produce the resulting min and argmin.
-            val = topk.cell(f"val{i}",
-                            ast.Stdlib().op("wire", WIDTH, signed=False))
-            idx = topk.cell(f"idx{i}",
-                            ast.Stdlib().op("wire", idx_width, signed=False))
-            val.in_ = lt.out @ left_val
-            val.in_ = ~lt.out @ regs[i].out
-            idx.in_ = lt.out @ left_idx
-            idx.in_ = ~lt.out @ i
-
-            # Record the current wires for the next comparison.
-            last_val = val.out
-            last_idx = idx.out
+        last_val, last_idx = build_tree(
+            [(reg.out, i) for i, reg in enumerate(regs)], smaller, shape,
+        )
 
         # Write the results into registers.
-        min_val_reg = topk.reg("min_val_reg", WIDTH)
+        min_val_reg = topk.reg("min_val_reg", width)
         min_val_reg.write_en = 1
         min_val_reg.in_ = last_val
         min_idx_reg = topk.reg("min_idx_reg", idx_width)
@@ -210,7 +418,7 @@ def build_topk(prog: Builder, k: int):
 
     # Check whether the input value is bigger than the smallest stored
     # value.
-    gt = topk.cell("gt", ast.Stdlib().op("gt", WIDTH, signed=False))
+    gt = topk.cell("gt", ast.Stdlib().op("gt", width, signed=False))
     with topk.comb_group("check") as check:
         gt.left = topk.this().value
         gt.right = min_val_reg.out
@@ -233,15 +441,62 @@ def build_topk(prog: Builder, k: int):
         upd.done = done_expr @ 1
 
     # The control program.
-    topk.control += [
+    push = [
         argmin,
         if_(gt.out, check, upd),
     ]
+    if clearable:
+        with topk.group("clear") as clear:
+            for reg in regs:
+                reg.write_en = 1
+                reg.in_ = 0
+            clear.done = regs[0].done
+        topk.control += if_(topk.this().clear, None, clear, push)
+    else:
+        topk.control += push
 
     return topk
 
 
+def args_parser():
+    """Get the command-line interface, which host-side drivers also use
+    to find out how a design was configured.
+    """
+    parser = argparse.ArgumentParser(
+        description="Generate the AOC day 1 accelerator.",
+    )
+    parser.add_argument("num_elves", nargs="?", type=int, default=1)
+    parser.add_argument("--resumable", action="store_true",
+                        help="carry state across chunks of the input")
+    parser.add_argument("--stream", action="store_true",
+                        help="receive the input on a ready/valid stream")
+    parser.add_argument("--both", action="store_true",
+                        help="solve both parts, with num_elves for part 2")
+    parser.add_argument("--parallelize", action="store_true",
+                        help="run independent control statements in parallel")
+    parser.add_argument("--static", action="store_true",
+                        help="mark fixed-latency groups for static timing")
+    parser.add_argument("--max-total", type=int,
+                        help="size the datapath for elf totals up to this")
+    parser.add_argument("--batch", type=int,
+                        help="solve this many inputs in each run")
+    parser.add_argument("--trace", type=int, metavar="N",
+                        help="record the last N iterations' latencies")
+    parser.add_argument("--shape", choices=SHAPES, default="balanced",
+                        help="shape of the top K's reduction trees")
+    return parser
+
+
 if __name__ == '__main__':
-    build(
-        int(sys.argv[1]) if len(sys.argv) > 1 else 1
-    ).emit()
+    parser = args_parser()
+    opts = parser.parse_args()
+    check_arguments(parser, opts)
+    program = build(opts.num_elves, resumable=opts.resumable,
+                    stream=opts.stream, both=opts.both,
+                    max_total=opts.max_total, batch=opts.batch,
+                    trace=opts.trace, shape=opts.shape)
+    if opts.parallelize:
+        parallelize(program)
+    if opts.static:
+        infer_static(program)
+    program.emit()
@@ -5,35 +5,60 @@ calorie values strung together. A second `markers` memory of the same
 length holds a 1-bit value that indicates whether a given index is the
 beginning of a new elf. Finally, a one-entry `count` memory holds the
 number of calorie numbers.
+
+For a `--batch` design, several inputs go one after another in the
+`calories` and `markers` memories, and `count` has one entry per input.
 """
-import sys
+import argparse
+import contextlib
 import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "common"))
+import bulk  # noqa: E402
+import memfmt  # noqa: E402
 
 WIDTH = 32
 MAX_SIZE = 4096
 
+# Generator options that change the layout of the memories, which
+# `convert` takes as keyword arguments.
+OPTIONS = ("both", "batch")
 
-def convert(infile):
-    calories = []
-    markers = []
 
-    is_first = True
-    for line in infile:
-        line = line.strip()
-        if line:
-            calories.append(int(line))
-            markers.append(int(is_first))
-            is_first = False
-        else:
-            is_first = True
+def parse(infile):
+    """Read the calorie values and new-elf markers from the input text.
+
+    Return them as NumPy arrays. A value starts a new elf when it's the
+    first line or comes right after a blank line.
+    """
+    buf = bulk.read(infile)
+    starts, ends = bulk.lines(buf)
+    blank = starts == ends
+
+    calories = bulk.integers(buf, starts[~blank], ends[~blank])
+    markers = np.concatenate(([True], blank[:-1]))[~blank].astype(np.int64)
 
     assert len(calories) == len(markers)
+    return calories, markers
+
+
+def memories(calories, markers, both=False):
+    """Pad the data and wrap it up in memory descriptions.
+
+    With `both`, the `answer` memory has room for the answers to both
+    parts of the puzzle.
+    """
     assert len(calories) <= MAX_SIZE
-    padding = [0] * (MAX_SIZE - len(calories))
+    padding = (0, MAX_SIZE - len(calories))
 
     return {
         "calories": {
-            "data": calories + padding,
+            "data": np.pad(calories, padding),
             "format": {
                 "numeric_type": "bitnum",
                 "is_signed": False,
@@ -41,7 +66,7 @@ def convert(infile):
             }
         },
         "markers": {
-            "data": markers + padding,
+            "data": np.pad(markers, padding),
             "format": {
                 "numeric_type": "bitnum",
                 "is_signed": False,
@@ -57,7 +82,7 @@ def convert(infile):
             },
         },
         "answer": {
-            "data": [0],
+            "data": [0, 0] if both else [0],
             "format": {
                 "numeric_type": "bitnum",
                 "is_signed": False,
@@ -67,6 +92,147 @@ def convert(infile):
     }
 
 
+def convert(infile, both=False, batch=None):
+    if batch:
+        return convert_batch([infile], batch, both=both)
+    return memories(*parse(infile), both=both)
+
+
+def convert_batch(infiles, size, both=False):
+    """Lay out several inputs for a design generated with `--batch`.
+
+    `size` is the design's batch size, which must be at least the number
+    of inputs. Each input's answers go in consecutive entries of the
+    `answer` memory.
+    """
+    assert 0 < len(infiles) <= size, "the inputs do not fit in the batch"
+    parsed = [parse(infile) for infile in infiles]
+    data = memories(*map(np.concatenate, zip(*parsed)), both=both)
+    data["count"]["data"] = np.pad([len(c) for c, _ in parsed],
+                                   (0, size - len(parsed)))
+    data["answer"]["data"] = data["answer"]["data"] * size
+    return data
+
+
+def meta(infile):
+    """Measure the ranges of the values in the input.
+
+    A design generated with `--max-total` set to our `max_total` has a
+    datapath that is just wide enough for this input.
+    """
+    calories, markers = parse(infile)
+    if len(calories):
+        totals = np.add.reduceat(calories, np.flatnonzero(markers))
+    else:
+        totals = calories
+    return {
+        "count": len(calories),
+        "max_calories": int(calories.max(initial=0)),
+        "max_total": int(totals.max(initial=0)),
+    }
+
+
+def streams(infile):
+    """Arrange the data as input streams for a `--stream` accelerator.
+
+    There is a single stream, `elem`, whose elements are pairs of a
+    calorie value and its new-elf marker.
+    """
+    calories, markers = parse(infile)
+    assert len(calories), "streams must have at least one element"
+
+    return {
+        "elem": {
+            "calories": {
+                "data": calories,
+                "format": {
+                    "numeric_type": "bitnum",
+                    "is_signed": False,
+                    "width": WIDTH,
+                }
+            },
+            "markers": {
+                "data": markers,
+                "format": {
+                    "numeric_type": "bitnum",
+                    "is_signed": False,
+                    "width": 1,
+                }
+            },
+        },
+    }
+
+
+def chunks(infile, design, size=MAX_SIZE):
+    """Split the input into chunks for a `--resumable` accelerator.
+
+    `design` holds the generator's options. Produce the memories for
+    each chunk in order, including the state memories (initially zero)
+    and the `last` flag. Chunks can split an elf's food list anywhere
+    because the running calorie count is part of the carried state.
+    """
+    calories, markers = parse(infile)
+    for start in range(0, max(len(calories), 1), size):
+        data = memories(calories[start:start + size],
+                        markers[start:start + size])
+        data["state_accum"] = {
+            "data": [0],
+            "format": data["answer"]["format"],
+        }
+        data["state_topk"] = {
+            "data": [0] * design.num_elves,
+            "format": data["answer"]["format"],
+        }
+        data["last"] = {
+            "data": [int(start + size >= len(calories))],
+            "format": data["markers"]["format"],
+        }
+        yield data
+
+
+def boundaries(lines, design):
+    """Find the lines where a piece of the input can safely start.
+
+    Pieces must contain whole elves, so each piece's top K values are
+    exact and can be merged.
+    """
+    return [
+        i for i, line in enumerate(lines)
+        if line.strip() and (i == 0 or not lines[i - 1].strip())
+    ]
+
+
+def merge(results, design):
+    """Combine the final memories from independent pieces of the input.
+
+    We take the top K values over all of the pieces' top K values.
+    """
+    tops = sorted((v for r in results for v in r["state_topk"]),
+                  reverse=True)
+    return sum(tops[:design.num_elves])
+
+
 if __name__ == "__main__":
-    json.dump(convert(sys.stdin), sys.stdout,
-              indent=2, sort_keys=True)
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    memfmt.add_arguments(parser)
+    parser.add_argument("--both", action="store_true",
+                        help="for a design that solves both parts")
+    parser.add_argument("--batch", type=int,
+                        help="for a design that solves a batch of inputs")
+    parser.add_argument("--meta", action="store_true",
+                        help="print the value ranges in the input instead")
+    parser.add_argument("inputs", nargs="*",
+                        help="input files for a batch (default: stdin)")
+    opts = parser.parse_args()
+    memfmt.check_arguments(parser, opts)
+    if opts.meta:
+        print(json.dumps(meta(sys.stdin), sort_keys=True))
+    elif opts.inputs:
+        with contextlib.ExitStack() as stack:
+            infiles = [stack.enter_context(open(p)) for p in opts.inputs]
+            data = convert_batch(infiles, opts.batch or len(infiles),
+                                 opts.both)
+        memfmt.dump(data, opts.format, opts.output)
+    else:
+        memfmt.dump(convert(sys.stdin, opts.both, opts.batch), opts.format,
+                    opts.output)
@@ -0,0 +1,63 @@
+"""Generate a synthetic puzzle input with its expected answers.
+
+Elves carry a uniformly random number of food items, each with a
+uniformly random calorie value. A real input has about 250 elves.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "common"))
+import synth  # noqa: E402
+
+REAL_ELVES = 250
+
+
+def generate(rng, elves, items=(1, 15), calories=(1000, 60000)):
+    """Generate the items for each elf.
+
+    Return the number of items for each elf and all the calorie values
+    strung together.
+    """
+    sizes = rng.integers(items[0], items[1] + 1, elves)
+    values = rng.integers(calories[0], calories[1] + 1, sizes.sum())
+    return sizes, values
+
+
+def answers(sizes, values):
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    totals = np.sort(np.add.reduceat(values, starts))
+    return {
+        "part1": int(totals[-1]),
+        "part2": int(totals[-3:].sum()),
+    }
+
+
+def lines(sizes, values):
+    pos = 0
+    for i, size in enumerate(sizes):
+        if i:
+            yield ""
+        yield from map(str, values[pos:pos + size])
+        pos += size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    synth.add_arguments(parser)
+    parser.add_argument("--items", type=int, nargs=2, default=(1, 15),
+                        metavar=("MIN", "MAX"),
+                        help="range of food items per elf")
+    parser.add_argument("--calories", type=int, nargs=2,
+                        default=(1000, 60000), metavar=("MIN", "MAX"),
+                        help="range of calories per item")
+    opts = parser.parse_args()
+    assert opts.items[0] >= 1, "every elf needs at least one item"
+
+    sizes, values = generate(synth.rng(opts),
+                             synth.count(REAL_ELVES, opts.scale),
+                             opts.items, opts.calories)
+    synth.write(lines(sizes, values), answers(sizes, values), opts.output)
@@ -0,0 +1,54 @@
+"""A vectorized host-side reference solution.
+
+This works on the same memories that `convert.py` produces, so it can
+check the accelerator's answers and give us a software baseline for its
+throughput. It only needs NumPy, not the Calyx builder: the command line
+takes a design's generator arguments but only reads the options that
+change the answer.
+"""
+import argparse
+import sys
+
+import numpy as np
+
+import convert
+
+
+def elements(data):
+    """Count the input elements (calorie values) in the memories.
+    """
+    return data["count"]["data"][0]
+
+
+def solve(data, design):
+    """Compute the answer from the memories for a design's options.
+
+    We get each elf's total with a segmented sum that starts a new
+    segment at every marker, and then partition the totals to find the
+    top `num_elves` of them. For a fused (`--both`) design, return the
+    answers to both parts.
+    """
+    count = elements(data)
+    if not count:
+        return [0, 0] if design.both else 0
+    calories = np.asarray(data["calories"]["data"][:count], dtype=np.int64)
+    markers = np.asarray(data["markers"]["data"][:count], dtype=bool)
+
+    totals = np.add.reduceat(calories, np.flatnonzero(markers))
+    k = min(design.num_elves, len(totals))
+    top = int(np.partition(totals, len(totals) - k)[-k:].sum())
+    return [int(totals.max()), top] if design.both else top
+
+
+def args_parser():
+    """Get a parser for the generator options that change the answer.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("num_elves", nargs="?", type=int, default=1)
+    parser.add_argument("--both", action="store_true")
+    return parser
+
+
+if __name__ == "__main__":
+    design, _ = args_parser().parse_known_args()
+    print(solve(convert.convert(sys.stdin), design))
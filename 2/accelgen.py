@@ -1,119 +1,292 @@
+import argparse
+import os
 import sys
-from calyx.builder import Builder, while_, invoke, const
+from calyx.builder import Builder, invoke, const
 from calyx import py_ast as ast
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "common"))
+from kernels import (  # noqa: E402
+    SHAPES, Accumulator, build_count, build_map_reduce, build_mem,
+    build_reduce, lane_name,
+)
+from multi import build_batch  # noqa: E402
+from parallelize import parallelize  # noqa: E402
+from readyvalid import build_stream  # noqa: E402
+from static import infer_static  # noqa: E402
+from tracing import build_trace, check_arguments  # noqa: E402
+from widths import bits, fit  # noqa: E402
+
+from scoring import (  # noqa: E402
+    DRAW_SCORE, LOSE_SCORE, SHAPE_SCORE, WIN_SCORE, gen_outcome_table,
+    gen_part2_table,
+)
+
 WIDTH = 32
 MAX_SIZE = 4096
 IDX_WIDTH = MAX_SIZE.bit_length()
 
-ROCK = LOSE = 0  # A, X
-PAPER = DRAW = 1  # B, Y
-SCISSORS = WIN = 2  # C, Z
-
-WINS = {
-    (ROCK, SCISSORS),
-    (PAPER, ROCK),
-    (SCISSORS, PAPER),
-}
-SHAPE_SCORE = [1, 2, 3]
-LOSE_SCORE = 0
-DRAW_SCORE = 3
-WIN_SCORE = 6
-
+# The scorers only ever produce a single round's score.
+ROUND_WIDTH = bits(max(SHAPE_SCORE) + WIN_SCORE)
 
-def build_mem(comp, name, width, size, is_external=True, is_ref=False):
-    idx_width = size.bit_length()
-    comp.prog.import_("primitives/memories.futil")
-    inst = ast.CompInst("seq_mem_d1", [width, size, idx_width])
-    return comp.cell(name, inst, is_external=is_external, is_ref=is_ref)
+# Options that change how a design works but not what it computes, for
+# `common/tune.py` to explore. Each knob is a list of alternatives, which
+# can use the value ranges from `convert.py --meta`.
+TUNING_SPACE = [
+    ["", "--parallelize"],
+    ["", "--static"],
+    ["", "--max-rounds {rounds}"],
+    ["", "--rle"],
+    ["", "--unroll 2", "--unroll 4 --banks 2", "--unroll 4 --banks 4"],
+]
 
 
-def build(part2):
+def build(part2, resumable=False, stream=False, both=False,
+          max_rounds=None, rle=False, batch=None, trace=None, unroll=1,
+          banks=1, shape="balanced"):
     """Build the `main` component for AOC day 2.
 
     `part` is a flag indicating whether we're doing Part 2, with the
     revised strategy guide interpretation. Otherwise, we're doing Part
     1, with the original/straightforward interpretation.
+
+    With `resumable`, the running score is loaded from and saved to a
+    `state_accum` interface memory so a host can feed the input through
+    in chunks.
+
+    With `stream`, the accelerator receives the moves through a
+    ready/valid stream called `move` instead of preloaded memories.
+
+    With `both`, the accelerator solves both parts of the puzzle in one
+    pass (and `part2` is ignored). A scorer for each part looks up its
+    tables using the same pair of moves, and the two answers go in a
+    two-entry `answer` memory.
+
+    With `max_rounds`, a bound on the number of rounds in the input, the
+    accumulators are only as wide as the total score needs to be,
+    instead of `WIDTH` bits.
+
+    With `rle`, the input is run-length encoded: the memories hold runs
+    of identical rounds, and a third `run_length` memory says how many
+    rounds are in each run. We score each run once and add the score
+    times the run's length, so the loop takes one iteration per run
+    instead of one per round.
+
+    With `batch`, the accelerator solves that many independent inputs in
+    one run (see `common/multi.py`). Their moves go one after another in
+    the memories, `count` has an entry for each input, and each input's
+    answers go in the next entries of `answer`. We clear the
+    accumulators between inputs.
+
+    With `trace`, the accelerator records the start and end cycles of
+    scoring each round (or run) in a ring buffer of that many entries
+    (see `common/tracing.py`).
+
+    `unroll`, `banks`, and `shape` configure the map/reduce kernel that
+    walks the memories (see `common/kernels.py`). Each iteration scores
+    `unroll` rounds (or runs) at once, with a scorer for each, from
+    `banks` banks of the memories, and sums their scores with adder
+    trees of the given `shape`.
     """
+    assert not (resumable and stream), "streams are already unbounded"
+    assert not (resumable and both), "fused designs are not resumable"
+    assert not (rle and stream), "streams are not run-length encoded"
+    assert not (batch and (resumable or stream)), \
+        "batches hold whole inputs in memory"
+    assert not ((stream or batch) and (unroll > 1 or banks > 1)), \
+        "streams and batches deliver one round at a time"
     prog = Builder()
     main = prog.component("main")
 
-    # Inputs & outputs.
-    them_mem = build_mem(main, "them", 2, MAX_SIZE)
-    us_mem = build_mem(main, "us", 2, MAX_SIZE)
-    count = build_mem(main, "count", IDX_WIDTH, 1)
-    answer = build_mem(main, "answer", WIDTH, 1)
-
-    # Scoring subcomponent.
-    scorer_def = build_scorer(prog, part2)
-    scorer = main.cell("scorer", scorer_def)
-
-    # Load the pair of moves at `index`.
-    idx = main.reg("idx", IDX_WIDTH)
-    with main.group("get_a_move") as get_a_move:
-        them_mem.read_en = 1
-        them_mem.addr0 = idx.out
-        us_mem.read_en = 1
-        us_mem.addr0 = idx.out
-        get_a_move.done = (them_mem.read_done & us_mem.read_done) @ 1
-
-    # Store the score for this move.
-    accum = main.reg("accum", WIDTH)
-    add = main.add("add", WIDTH)
-    with main.group("accum_score") as accum_score:
-        add.left = accum.out
-        add.right = scorer.score
-
-        accum.write_en = 1
-        accum.in_ = add.out
-        accum_score.done = accum.done
-
-    # Publish the answer back to an interface memory.
-    with main.group("finish") as finish:
-        answer.write_en = 1
-        answer.addr0 = 0
-        answer.in_ = accum.out
-        finish.done = answer.write_done
-
-    # Loop increment.
-    incr_add = main.add("incr_add", IDX_WIDTH)
-    with main.group("incr") as incr:
-        incr_add.left = idx.out
-        incr_add.right = 1
-        idx.write_en = 1
-        idx.in_ = incr_add.out
-        incr.done = idx.done
-
-    # Load the loop maximum for convenient access.
-    count_reg = main.reg("count_reg", IDX_WIDTH)
-    with main.group("init") as init:
-        count.read_en = 1
-        count.addr0 = 0
-        count_reg.write_en = count.read_done
-        count_reg.in_ = count.out
-        init.done = count_reg.done
-
-    # Loop control comparator.
-    lt = main.cell("lt", ast.Stdlib().op("lt", IDX_WIDTH, signed=False))
-    with main.comb_group("check") as check:
-        lt.left = idx.out
-        lt.right = count_reg.out
+    # Output.
+    parts = [False, True] if both else [part2]
+    answers = len(parts) * (batch or 1)
+    answer = build_mem(main, "answer", WIDTH, answers)
+
+    # The loop over the inputs in a batch, which prefetches each input's
+    # count.
+    if batch:
+        count = build_mem(main, "count", IDX_WIDTH, batch)
+        inputs = build_batch(main, batch, count, IDX_WIDTH,
+                             answers.bit_length())
+    else:
+        inputs = None
+
+    # The widest a total score can get.
+    if max_rounds:
+        width = bits(max_rounds * (max(SHAPE_SCORE) + WIN_SCORE))
+    else:
+        width = WIDTH
+
+    # The moves to score, either from memories or from a stream. Each
+    # lane holds a move (or run of moves).
+    if stream:
+        move = build_stream(main, "move", [("them", 2), ("us", 2)],
+                            prefetch=True)
+        kernel = None
+        lanes = [move.regs]
+    else:
+        init, kernel = build_mem_loop(main, rle, inputs, unroll, banks,
+                                      shape)
+        lanes = kernel.lanes
+
+    # Scoring subcomponents for every lane, with an accumulator for each
+    # part.
+    scorers = []
+    weighs = []
+    accum_scores = []
+    clear_accums = []
+    finish = []
+    for i, part in enumerate(parts):
+        suffix = str(i + 1) if both else ""
+        scorer_def = build_scorer(prog, part, f"scorer{suffix}")
+        scores = []
+        for j, lane in enumerate(lanes):
+            scorer = main.cell(lane_name(f"scorer{suffix}", j, len(lanes)),
+                               scorer_def)
+            scorers.append((scorer, lane))
+
+            # Weigh the score for a run of moves by its length.
+            if rle:
+                weigh, mult = build_weigh(main,
+                                          lane_name(suffix, j, len(lanes)),
+                                          scorer.score,
+                                          lane["run_length"].out, width)
+                weighs.append(weigh)
+                scores.append(mult.out)
+            else:
+                scores.append(scorer.score)
+
+        # Add up the lanes' scores.
+        accum = Accumulator(main, f"accum{suffix}", width)
+        score_width = width if rle else ROUND_WIDTH
+        if kernel:
+            accum_score = kernel.reduce(f"accum_score{suffix}", accum,
+                                        scores, score_width)
+        else:
+            accum_score = build_reduce(main, f"accum_score{suffix}", accum,
+                                       scores, score_width)
+        accum_scores.append(accum_score)
+
+        # Start over for each input in a batch.
+        if batch:
+            clear_accums.append(accum.clear())
+
+        # Publish the answer back to an interface memory.
+        finish.append(accum.publish(
+            f"finish{suffix}", answer,
+            inputs.answer_idx.out if batch else i, WIDTH,
+        ))
+
+    # Score each move and update all the accumulators at once.
+    body = [invoke_scorers(scorers)]
+    if weighs:
+        body.append(set(weighs) if len(weighs) > 1 else weighs[0])
+    body.append(set(accum_scores) if both else accum_scores[0])
+
+    # Per-iteration latency tracing.
+    if trace:
+        tracer = build_trace(main, trace)
+        body = tracer.wrap(body)
+        trace_end = [tracer.save_count]
+    else:
+        trace_end = []
+
+    # The loop over all the moves.
+    if stream:
+        setup, loop = [], move.control(body)
+    else:
+        setup, loop = [init], kernel.control(body)
+
+    # Carry the score between chunks.
+    if resumable:
+        state_accum = build_mem(main, "state_accum", WIDTH, 1)
+        load_accum, save_accum = accum.state(state_accum, WIDTH)
+        setup = [{*setup, load_accum}]
+        teardown = [*finish, save_accum]
+    else:
+        teardown = finish
 
     # Control program.
-    main.control += [
-        init,
-        while_(lt.out, check, [
-            get_a_move,
-            invoke(scorer, in_them=them_mem.out, in_us=us_mem.out),
-            accum_score,
-            incr,
-        ]),
-        finish,
-    ]
+    if batch:
+        main.control += [
+            inputs.control([
+                {*clear_accums, *setup},
+                loop,
+            ], finish),
+            *trace_end,
+        ]
+    else:
+        main.control += [
+            *setup,
+            loop,
+            *teardown,
+            *trace_end,
+        ]
 
     return prog.program
 
 
+def invoke_scorers(scorers):
+    """Invoke every scorer (in parallel) on its lane's pair of moves.
+
+    `scorers` is a list of scorer cells and the lanes they score.
+    """
+    invokes = [
+        invoke(s, in_them=lane["them"].out, in_us=lane["us"].out)
+        for s, lane in scorers
+    ]
+    return invokes[0] if len(invokes) == 1 else ast.ParComp(invokes)
+
+
+def build_weigh(main, suffix, score, run_length, width):
+    """Build a group that multiplies a run's score by its length.
+
+    Return the group and the multiplier, whose `out` holds the run's
+    total score.
+    """
+    main.prog.import_("primitives/binary_operators.futil")
+    mult = main.cell(f"mult{suffix}", ast.CompInst("std_mult_pipe", [width]))
+    with main.group(f"weigh{suffix}") as weigh:
+        mult.left = fit(main, f"round_pad{suffix}", score, ROUND_WIDTH,
+                        width)
+        mult.right = fit(main, f"run_length_fit{suffix}", run_length,
+                         WIDTH, width)
+        mult.go = ~mult.done @ 1
+        weigh.done = mult.done
+    return weigh, mult
+
+
+def build_mem_loop(main, rle=False, inputs=None, unroll=1, banks=1,
+                   shape="balanced"):
+    """Build a map/reduce kernel over the moves in the interface
+    memories.
+
+    With `rle`, each element is a run of identical moves, and the lanes
+    also hold the run's length in `run_length`. With `inputs`, the loop
+    over a batch, the loop covers the current input, and the next loop
+    picks up where this one left off in the memories. Return the group
+    that sets up the loop and the `MapReduce` kernel itself.
+    """
+    fields = [("them", 2), ("us", 2)]
+    if rle:
+        fields.append(("run_length", WIDTH))
+
+    # Load the loop maximum for convenient access.
+    if inputs:
+        count_reg, init = build_count(main, "count", IDX_WIDTH,
+                                      port=inputs.loop.regs["count"].out)
+    else:
+        count = build_mem(main, "count", IDX_WIDTH, 1)
+        count_reg, init = build_count(main, "count", IDX_WIDTH, mem=count)
+
+    # Walk the pairs of moves, prefetching the next iteration's pairs
+    # while we score the current ones.
+    return init, build_map_reduce(main, "move", count_reg.out, IDX_WIDTH,
+                                  fields, MAX_SIZE, unroll, banks, shape,
+                                  consecutive=bool(inputs))
+
+
 def build_cat(comp, left, right, left_size, right_size):
     """Build a `std_cat` component for concatenation.
     """
@@ -127,14 +300,14 @@ def build_cat(comp, left, right, left_size, right_size):
     return cat
 
 
-def build_scorer(prog, part2):
-    scorer = prog.component("scorer")
+def build_scorer(prog, part2, name="scorer"):
+    scorer = prog.component(name)
     scorer.input("them", 2)
     scorer.input("us", 2)
-    scorer.output("score", WIDTH)
+    scorer.output("score", ROUND_WIDTH)
 
     # Look up shape score.
-    shape_score = scorer.reg("shape_score", WIDTH)
+    shape_score = scorer.reg("shape_score", ROUND_WIDTH)
     with scorer.group("get_shape_score") as get_shape_score:
         if not part2:
             shape_score_wire = build_lut(
@@ -157,7 +330,7 @@ def build_scorer(prog, part2):
         get_shape_score.done = shape_score.done
 
     # Same for outcome score.
-    outcome_score = scorer.reg("outcome_score", WIDTH)
+    outcome_score = scorer.reg("outcome_score", ROUND_WIDTH)
     with scorer.group("get_outcome_score") as get_outcome_score:
         if not part2:
             outcome_score_wire = build_lut(
@@ -181,7 +354,7 @@ def build_scorer(prog, part2):
         get_outcome_score.done = outcome_score.done
 
     # Continuously produce the total score.
-    add = scorer.add("add", WIDTH)
+    add = scorer.add("add", ROUND_WIDTH)
     with scorer.continuous:
         add.left = shape_score.out
         add.right = outcome_score.out
@@ -193,58 +366,16 @@ def build_scorer(prog, part2):
     return scorer
 
 
-def gen_outcome_table():
-    """Generate a look-up table for outcome scores.
-
-    The table is indexed by the 4-bit *concatenated pair* of "their"
-    move and "our" move.
-    """
-    table = [0] * (2 ** 4)
-    for them in (ROCK, PAPER, SCISSORS):
-        for us in (ROCK, PAPER, SCISSORS):
-            idx = (them << 2) | us
-            if us == them:
-                score = DRAW_SCORE
-            elif (us, them) in WINS:
-                score = WIN_SCORE
-            else:
-                score = LOSE_SCORE
-            table[idx] = score
-    return table
-
-
-def gen_part2_table():
-    """Generate a look-up table for shape scores in part 2.
-
-    The key is the 4-bit pair of "their" move and the desired outcome
-    (LOSE, DRAW, or WIN). We pick the appropriate move and look up its
-    score value.
-    """
-    table = [0] * (2 ** 4)
-    for them in (ROCK, PAPER, SCISSORS):
-        for outcome in (LOSE, DRAW, WIN):
-            if outcome == DRAW:
-                us = them
-            elif outcome == WIN:
-                us = (them + 1) % 3
-            elif outcome == LOSE:
-                us = (them - 1) % 3
-            else:
-                assert False, "unknown outcome"
-            idx = (them << 2) | outcome
-            table[idx] = SHAPE_SCORE[us]
-    return table
-
-
 def build_lut(comp, name, table, inport):
     """Generate assignments to implement a look-up table.
 
     Return a wire component that has been assigned to produce the LUT's
-    output based on the value of `outport`.
+    output based on the value of `outport`. All our tables hold parts of
+    a single round's score, so the wire is `ROUND_WIDTH` bits wide.
     """
     outwire = comp.cell(
         f"{name}_lut",
-        ast.Stdlib().op("wire", WIDTH, signed=False),
+        ast.Stdlib().op("wire", ROUND_WIDTH, signed=False),
     )
     key_size = (len(table) - 1).bit_length()
     for (key, value) in enumerate(table):
@@ -252,7 +383,53 @@ def build_lut(comp, name, table, inport):
     return outwire
 
 
+def args_parser():
+    """Get the command-line interface, which host-side drivers also use
+    to find out how a design was configured.
+    """
+    parser = argparse.ArgumentParser(
+        description="Generate the AOC day 2 accelerator.",
+    )
+    parser.add_argument("part", nargs="?", default="part1",
+                        choices=["part1", "part2"])
+    parser.add_argument("--resumable", action="store_true",
+                        help="carry state across chunks of the input")
+    parser.add_argument("--stream", action="store_true",
+                        help="receive the input on a ready/valid stream")
+    parser.add_argument("--both", action="store_true",
+                        help="solve both parts (ignoring `part`)")
+    parser.add_argument("--parallelize", action="store_true",
+                        help="run independent control statements in parallel")
+    parser.add_argument("--static", action="store_true",
+                        help="mark fixed-latency groups for static timing")
+    parser.add_argument("--max-rounds", type=int,
+                        help="size the datapath for up to this many rounds")
+    parser.add_argument("--rle", action="store_true",
+                        help="read run-length encoded rounds")
+    parser.add_argument("--batch", type=int,
+                        help="solve this many inputs in each run")
+    parser.add_argument("--trace", type=int, metavar="N",
+                        help="record the last N iterations' latencies")
+    parser.add_argument("--unroll", type=int, default=1,
+                        help="score this many rounds in each iteration")
+    parser.add_argument("--banks", type=int, default=1,
+                        help="split the move memories into this many banks")
+    parser.add_argument("--shape", choices=SHAPES, default="balanced",
+                        help="shape of the trees that add up the scores")
+    return parser
+
+
 if __name__ == '__main__':
-    build(
-        sys.argv[1] == 'part2' if len(sys.argv) > 1 else False
-    ).emit()
+    parser = args_parser()
+    opts = parser.parse_args()
+    check_arguments(parser, opts)
+    program = build(opts.part == "part2", resumable=opts.resumable,
+                    stream=opts.stream, both=opts.both,
+                    max_rounds=opts.max_rounds, rle=opts.rle,
+                    batch=opts.batch, trace=opts.trace,
+                    unroll=opts.unroll, banks=opts.banks, shape=opts.shape)
+    if opts.parallelize:
+        parallelize(program)
+    if opts.static:
+        infer_static(program)
+    program.emit()
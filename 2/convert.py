@@ -1,18 +1,43 @@
-"""Generate memories for the strategy guide and score tables.
+"""Generate memories for the strategy guide.
 
 We encode Rock (A & X), Paper (B & Y), and Scissors (C & Z) into 2-bit
 numbers (0, 1, and 2). Then there are just two memories of equal length:
 "them" moves and "us" moves.
+
+With `--rle`, consecutive identical rounds collapse into runs: the two
+move memories hold one entry per run, and a third `run_length` memory
+holds the number of rounds in each run.
+
+For a `--batch` design, several inputs go one after another in the
+memories, and `count` has one entry per input.
+
+For a design with `--banks B`, each of those memories is split into B
+banks (`them0` through `them{B-1}`, and so on), where round i is entry
+i // B of bank i % B.
 """
-import sys
+import argparse
+import contextlib
 import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "common"))
+import bulk  # noqa: E402
+import memfmt  # noqa: E402
+from scoring import ROCK, PAPER, SCISSORS  # noqa: E402
 
 MAX_SIZE = 4096
 WIDTH = 32
 
-ROCK = 0
-PAPER = 1
-SCISSORS = 2
+# Generator options that change the layout of the memories, which
+# `convert` takes as keyword arguments.
+OPTIONS = ("both", "rle", "batch", "banks")
+
+# The memories that `--banks` designs split into banks.
+BANKED = ("them", "us", "run_length")
 
 THEM_NUMS = {
     "A": ROCK,
@@ -26,25 +51,70 @@ US_NUMS = {
 }
 
 
-def convert(infile):
-    them_moves = []
-    us_moves = []
+def byte_table(nums):
+    """Make a table that maps bytes to move numbers (or -1).
+    """
+    table = np.full(256, -1, dtype=np.int64)
+    for char, num in nums.items():
+        table[ord(char)] = num
+    return table
+
+
+THEM_TABLE = byte_table(THEM_NUMS)
+US_TABLE = byte_table(US_NUMS)
+
 
-    for line in infile:
-        line = line.strip()
-        if line:
-            them, us = line.split()
-            them_moves.append(THEM_NUMS[them])
-            us_moves.append(US_NUMS[us])
+def parse(infile):
+    """Read the pairs of moves from the strategy guide.
+
+    Every nonblank line looks like `A X`, so the moves are always at the
+    same offsets from the start of the line.
+    """
+    buf = bulk.read(infile)
+    starts, ends = bulk.lines(buf)
+    nonblank = starts != ends
+    starts, ends = starts[nonblank], ends[nonblank]
+    assert (ends - starts == 3).all(), "malformed line"
+
+    them_moves = THEM_TABLE[buf[starts]]
+    us_moves = US_TABLE[buf[starts + 2]]
+    assert (them_moves >= 0).all() and (us_moves >= 0).all(), \
+        "unknown move"
 
     assert len(them_moves) == len(us_moves)
+    return them_moves, us_moves
+
+
+def runs(them_moves, us_moves):
+    """Run-length encode the rounds.
+
+    Return the pair of moves for each run of identical rounds and the
+    number of rounds in each run.
+    """
+    new = np.ones(len(them_moves), dtype=bool)
+    new[1:] = (them_moves[1:] != them_moves[:-1]) | \
+        (us_moves[1:] != us_moves[:-1])
+    starts = np.flatnonzero(new)
+    lengths = np.diff(np.append(starts, len(them_moves)))
+    return them_moves[starts], us_moves[starts], lengths
+
+
+def memories(them_moves, us_moves, run_lengths=None, both=False,
+             banks=1):
+    """Pad the data and wrap it up in memory descriptions.
+
+    With `run_lengths`, the moves are for runs of rounds, and there is
+    a `run_length` memory too. With `both`, the `answer` memory has room
+    for the answers to both parts of the puzzle. The move memories are
+    split into `banks` banks.
+    """
     assert len(them_moves) <= MAX_SIZE
-    padding = [0] * (MAX_SIZE - len(them_moves))
+    padding = (0, MAX_SIZE - len(them_moves))
 
-    return {
+    data = {
         # Inputs.
         "them": {
-            "data": them_moves + padding,
+            "data": np.pad(them_moves, padding),
             "format": {
                 "numeric_type": "bitnum",
                 "is_signed": False,
@@ -52,7 +122,7 @@ def convert(infile):
             }
         },
         "us": {
-            "data": us_moves + padding,
+            "data": np.pad(us_moves, padding),
             "format": {
                 "numeric_type": "bitnum",
                 "is_signed": False,
@@ -70,16 +140,159 @@ def convert(infile):
 
         # Output.
         "answer": {
-            "data": [0],
+            "data": [0, 0] if both else [0],
+            "format": {
+                "numeric_type": "bitnum",
+                "is_signed": False,
+                "width": WIDTH,
+            },
+        },
+    }
+    if run_lengths is not None:
+        data["run_length"] = {
+            "data": np.pad(run_lengths, padding),
             "format": {
                 "numeric_type": "bitnum",
                 "is_signed": False,
                 "width": WIDTH,
+            }
+        }
+    return memfmt.split_banks(data, BANKED, banks)
+
+
+def convert(infile, both=False, rle=False, batch=None, banks=1):
+    if batch:
+        return convert_batch([infile], batch, both=both, rle=rle,
+                             banks=banks)
+    moves = parse(infile)
+    if rle:
+        return memories(*runs(*moves), both=both, banks=banks)
+    return memories(*moves, both=both, banks=banks)
+
+
+def convert_batch(infiles, size, both=False, rle=False, banks=1):
+    """Lay out several inputs for a design generated with `--batch`.
+
+    `size` is the design's batch size, which must be at least the number
+    of inputs. Each input's answers go in consecutive entries of the
+    `answer` memory. Batched designs don't support banks.
+    """
+    assert banks == 1, "batched designs read unbanked memories"
+    assert 0 < len(infiles) <= size, "the inputs do not fit in the batch"
+    parsed = [parse(infile) for infile in infiles]
+    if rle:
+        parsed = [runs(*moves) for moves in parsed]
+    data = memories(*map(np.concatenate, zip(*parsed)), both=both)
+    data["count"]["data"] = np.pad([len(p[0]) for p in parsed],
+                                   (0, size - len(parsed)))
+    data["answer"]["data"] = data["answer"]["data"] * size
+    return data
+
+
+def meta(infile):
+    """Measure the size of the input.
+
+    A design generated with `--max-rounds` set to our `rounds` has a
+    datapath that is just wide enough for this input. `runs` is the
+    number of elements in the run-length encoded (`--rle`) memories.
+    """
+    them_moves, us_moves = parse(infile)
+    return {
+        "rounds": len(them_moves),
+        "runs": len(runs(them_moves, us_moves)[0]),
+    }
+
+
+def streams(infile):
+    """Arrange the data as input streams for a `--stream` accelerator.
+
+    There is a single stream, `move`, whose elements are pairs of moves.
+    """
+    them_moves, us_moves = parse(infile)
+    assert len(them_moves), "streams must have at least one element"
+
+    return {
+        "move": {
+            "them": {
+                "data": them_moves,
+                "format": {
+                    "numeric_type": "bitnum",
+                    "is_signed": False,
+                    "width": 2,
+                }
+            },
+            "us": {
+                "data": us_moves,
+                "format": {
+                    "numeric_type": "bitnum",
+                    "is_signed": False,
+                    "width": 2,
+                }
             },
         },
     }
 
 
+def chunks(infile, design, size=MAX_SIZE):
+    """Split the input into chunks for a `--resumable` accelerator.
+
+    Every game is independent, so the chunks can split anywhere. The
+    carried `state_accum` memory starts at zero. For an `--rle` design,
+    the chunks are of runs rather than of rounds.
+    """
+    columns = parse(infile)
+    if design.rle:
+        columns = runs(*columns)
+    for start in range(0, max(len(columns[0]), 1), size):
+        data = memories(*(c[start:start + size] for c in columns),
+                        banks=design.banks)
+        data["state_accum"] = {
+            "data": [0],
+            "format": data["answer"]["format"],
+        }
+        yield data
+
+
+def boundaries(lines, design):
+    """Find the lines where a piece of the input can safely start.
+
+    Every game is independent, so that's every line.
+    """
+    return list(range(len(lines)))
+
+
+def merge(results, design):
+    """Combine the final memories from independent pieces of the input.
+    """
+    return sum(r["answer"][0] for r in results)
+
+
 if __name__ == "__main__":
-    json.dump(convert(sys.stdin), sys.stdout,
-              indent=2, sort_keys=True)
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    memfmt.add_arguments(parser)
+    parser.add_argument("--both", action="store_true",
+                        help="for a design that solves both parts")
+    parser.add_argument("--rle", action="store_true",
+                        help="for a design that reads run-length encoding")
+    parser.add_argument("--batch", type=int,
+                        help="for a design that solves a batch of inputs")
+    parser.add_argument("--banks", type=int, default=1,
+                        help="for a design with banked move memories")
+    parser.add_argument("--meta", action="store_true",
+                        help="print the value ranges in the input instead")
+    parser.add_argument("inputs", nargs="*",
+                        help="input files for a batch (default: stdin)")
+    opts = parser.parse_args()
+    memfmt.check_arguments(parser, opts)
+    if opts.meta:
+        print(json.dumps(meta(sys.stdin), sort_keys=True))
+    elif opts.inputs:
+        with contextlib.ExitStack() as stack:
+            infiles = [stack.enter_context(open(p)) for p in opts.inputs]
+            data = convert_batch(infiles, opts.batch or len(infiles),
+                                 opts.both, opts.rle, opts.banks)
+        memfmt.dump(data, opts.format, opts.output)
+    else:
+        memfmt.dump(convert(sys.stdin, opts.both, opts.rle, opts.batch,
+                            opts.banks),
+                    opts.format, opts.output)
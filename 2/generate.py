@@ -0,0 +1,55 @@
+"""Generate a synthetic puzzle input with its expected answers.
+
+Every round is one of the nine possible lines (`A X` through `C Z`),
+drawn from a configurable mix. A real input has 2500 rounds.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "common"))
+import synth  # noqa: E402
+
+REAL_ROUNDS = 2500
+
+
+def generate(rng, rounds, mix=None):
+    """Generate "their" and "our" move codes (0, 1, or 2) for each round.
+
+    `mix` holds relative weights for the nine pairs of codes, in the
+    order `A X`, `A Y`, `A Z`, `B X`, and so on. The default is uniform.
+    """
+    weights = np.asarray(mix or [1] * 9, dtype=float)
+    pairs = rng.choice(9, rounds, p=weights / weights.sum())
+    return pairs // 3, pairs % 3
+
+
+def answers(them, us):
+    # In part 1, `us` is our shape; in part 2, it's the outcome.
+    outcome = (us - them + 1) % 3
+    shape = (them + us - 1) % 3
+    return {
+        "part1": int((us + 1).sum() + (outcome * 3).sum()),
+        "part2": int((shape + 1).sum() + (us * 3).sum()),
+    }
+
+
+def lines(them, us):
+    for t, u in zip(them, us):
+        yield f"{'ABC'[t]} {'XYZ'[u]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    synth.add_arguments(parser)
+    parser.add_argument("--mix", type=float, nargs=9,
+                        metavar="WEIGHT",
+                        help="relative frequencies of the nine lines")
+    opts = parser.parse_args()
+
+    them, us = generate(synth.rng(opts),
+                        synth.count(REAL_ROUNDS, opts.scale), opts.mix)
+    synth.write(lines(them, us), answers(them, us), opts.output)
@@ -0,0 +1,84 @@
+"""A vectorized host-side reference solution.
+
+This works on the same memories that `convert.py` produces, so it can
+check the accelerator's answers and give us a software baseline for its
+throughput. It only needs NumPy, not the Calyx builder: the command line
+takes a design's generator arguments but only reads the options that
+change the answer.
+"""
+import argparse
+import sys
+
+import numpy as np
+
+import convert
+import memfmt
+import scoring
+
+
+def elements(data):
+    """Count the input elements (rounds) in the memories.
+
+    Run-length encoded memories hold more rounds than entries.
+    """
+    data = memfmt.join_banks(data, convert.BANKED)
+    count = data["count"]["data"][0]
+    if "run_length" in data:
+        return int(np.sum(data["run_length"]["data"][:count]))
+    return count
+
+
+def solve(data, design):
+    """Compute the answer from the memories for a design's options.
+
+    We gather every round's scores from the same look-up tables that the
+    accelerator's scorer uses, indexed by the concatenated pair of moves.
+    For a fused (`--both`) design, return the answers to both parts.
+    Run-length encoded (`--rle`) scores count once per round in the run.
+    Banked memories are joined back together first.
+    """
+    data = memfmt.join_banks(data, convert.BANKED)
+    count = data["count"]["data"][0]
+    them = np.asarray(data["them"]["data"][:count], dtype=np.int64)
+    us = np.asarray(data["us"]["data"][:count], dtype=np.int64)
+    if "run_length" in data:
+        weights = np.asarray(data["run_length"]["data"][:count],
+                             dtype=np.int64)
+    else:
+        weights = np.ones(count, dtype=np.int64)
+
+    if design.both:
+        return [score(them, us, weights, False),
+                score(them, us, weights, True)]
+    return score(them, us, weights, design.part == "part2")
+
+
+def score(them, us, weights, part2):
+    pair = (them << 2) | us
+    if part2:
+        shape = np.asarray(scoring.gen_part2_table())[pair]
+        outcome = np.asarray([scoring.LOSE_SCORE, scoring.DRAW_SCORE,
+                              scoring.WIN_SCORE])[us]
+    else:
+        shape = np.asarray(scoring.SHAPE_SCORE)[us]
+        outcome = np.asarray(scoring.gen_outcome_table())[pair]
+
+    return int(((shape + outcome) * weights).sum())
+
+
+def args_parser():
+    """Get a parser for the generator options that change the answer.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("part", nargs="?", default="part1",
+                        choices=["part1", "part2"])
+    parser.add_argument("--both", action="store_true")
+    parser.add_argument("--rle", action="store_true")
+    parser.add_argument("--banks", type=int, default=1)
+    return parser
+
+
+if __name__ == "__main__":
+    design, _ = args_parser().parse_known_args()
+    print(solve(convert.convert(sys.stdin, rle=design.rle,
+                                banks=design.banks), design))
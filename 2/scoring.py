@@ -0,0 +1,62 @@
+"""The rules of rock, paper, scissors, and the score tables they imply.
+
+The generator bakes these tables into the scorer components, and the
+NumPy reference solver looks up the same tables.
+"""
+
+ROCK = LOSE = 0  # A, X
+PAPER = DRAW = 1  # B, Y
+SCISSORS = WIN = 2  # C, Z
+
+WINS = {
+    (ROCK, SCISSORS),
+    (PAPER, ROCK),
+    (SCISSORS, PAPER),
+}
+SHAPE_SCORE = [1, 2, 3]
+LOSE_SCORE = 0
+DRAW_SCORE = 3
+WIN_SCORE = 6
+
+
+def gen_outcome_table():
+    """Generate a look-up table for outcome scores.
+
+    The table is indexed by the 4-bit *concatenated pair* of "their"
+    move and "our" move.
+    """
+    table = [0] * (2 ** 4)
+    for them in (ROCK, PAPER, SCISSORS):
+        for us in (ROCK, PAPER, SCISSORS):
+            idx = (them << 2) | us
+            if us == them:
+                score = DRAW_SCORE
+            elif (us, them) in WINS:
+                score = WIN_SCORE
+            else:
+                score = LOSE_SCORE
+            table[idx] = score
+    return table
+
+
+def gen_part2_table():
+    """Generate a look-up table for shape scores in part 2.
+
+    The key is the 4-bit pair of "their" move and the desired outcome
+    (LOSE, DRAW, or WIN). We pick the appropriate move and look up its
+    score value.
+    """
+    table = [0] * (2 ** 4)
+    for them in (ROCK, PAPER, SCISSORS):
+        for outcome in (LOSE, DRAW, WIN):
+            if outcome == DRAW:
+                us = them
+            elif outcome == WIN:
+                us = (them + 1) % 3
+            elif outcome == LOSE:
+                us = (them - 1) % 3
+            else:
+                assert False, "unknown outcome"
+            idx = (them << 2) | outcome
+            table[idx] = SHAPE_SCORE[us]
+    return table
@@ -1,105 +1,144 @@
 from functools import reduce
+import argparse
+import os
 import sys
 from calyx.builder import Builder, while_, if_, const, invoke
 from calyx import py_ast as ast
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "common"))
+from kernels import (  # noqa: E402
+    Accumulator, build_count, build_mem as build_kernel_mem,
+)
+from loops import build_for  # noqa: E402
+from multi import build_batch  # noqa: E402
+from parallelize import parallelize  # noqa: E402
+from readyvalid import build_stream  # noqa: E402
+from static import infer_static  # noqa: E402
+from tracing import build_trace, check_arguments  # noqa: E402
+from widths import bits  # noqa: E402
+
 MAX_CONTENTS = 16384
 MAX_RUCKSACKS = 512
 ITEM_WIDTH = 6
 LENGTH_WIDTH = 8
 SCORE_WIDTH = 32
+MAX_PRIORITY = 52
 
 RUCKSACK_IDX_WIDTH = (MAX_RUCKSACKS - 1).bit_length()
 CONTENTS_IDX_WIDTH = (MAX_CONTENTS - 1).bit_length()
 
+# Options that change how a design works but not what it computes, for
+# `common/tune.py` to explore. Each knob is a list of alternatives, which
+# can use the value ranges from `convert.py --meta`.
+TUNING_SPACE = [
+    ["", "--parallelize"],
+    ["", "--static"],
+    ["", "--max-rucksacks {rucksacks}"],
+    ["", "--filter cam --filter-capacity {max_distinct}"],
+]
+
 
 def build_mem(comp, name, width, size, is_external=True, is_ref=False):
+    """Add a memory with just enough address bits for its entries.
+
+    This is for the memories that fixed-width indices (or the item
+    values themselves) address. Memories that a counter walks up to
+    `size` use `kernels.build_mem`'s wider default instead, like the
+    other days' memories.
+    """
     idx_width = (size - 1).bit_length() if size > 1 else 1
-    comp.prog.import_("primitives/memories.futil")
-    inst = ast.CompInst("seq_mem_d1", [width, size, idx_width])
-    return comp.cell(name, inst, is_external=is_external, is_ref=is_ref)
+    return build_kernel_mem(comp, name, width, size, idx_width, is_external,
+                            is_ref)
 
 
-def build_item_loop(main, contents, item_idx, global_item_idx, item):
+def build_item_loop(main, contents, items, stream=None,
+                    item_width=ITEM_WIDTH):
     """Generate a loop *generator* for iterating over items.
+
+    The loops run for `items` iterations. The items come from the
+    `contents` memory, where consecutive loops walk consecutive items,
+    or, if it's given, from the `stream` of items. Return the underlying
+    `ForLoop`, the register that holds the current item, and a function
+    that generates a loop that skips items, which stream-based designs
+    need to consume the rest of a rucksack after exiting a loop early.
+    Items are `item_width` bits wide.
     """
-    # Reset the contents loop counter.
-    with main.group("reset_item") as reset_item:
-        item_idx.write_en = 1
-        item_idx.in_ = 0
-        reset_item.done = item_idx.done
-
-    # Increment for the item loop.
-    item_add = main.add("item_add", LENGTH_WIDTH)
-    with main.group("incr_item") as incr_item:
-        item_add.left = item_idx.out
-        item_add.right = 1
-        item_idx.write_en = 1
-        item_idx.in_ = item_add.out
-        incr_item.done = item_idx.done
-
-    # Increment for the *global* item index.
-    global_item_add = main.add("global_item_add", CONTENTS_IDX_WIDTH)
-    with main.group("incr_global_item") as incr_global_item:
-        global_item_add.left = global_item_idx.out
-        global_item_add.right = 1
-        global_item_idx.write_en = 1
-        global_item_idx.in_ = global_item_add.out
-        incr_global_item.done = global_item_idx.done
-
-    # Load the actual item value from rucksack contents.
-    with main.group("load_item") as load_item:
-        contents.read_en = 1
-        contents.addr0 = global_item_idx.out
-        item.write_en = contents.read_done
-        item.in_ = contents.out
-        load_item.done = item.done
+    if stream:
+        # Receiving an item from the stream advances it.
+        loop = build_for(main, "contents", items.out, LENGTH_WIDTH)
+        item = stream.regs["item"]
+        load_item = [stream.pop]
+    else:
+        # Prefetch the next item from the contents memory while the body
+        # works on the current one.
+        loop = build_for(main, "contents", items.out, LENGTH_WIDTH,
+                         [("item", contents, item_width)],
+                         CONTENTS_IDX_WIDTH)
+        item = loop.regs["item"]
+        load_item = []
 
     # Generate a control loop that iterates over the contents in a
-    # single rucksack/compartment. The supplied body runs after we load
-    # the item value (priority) and before we advance the iterator.
+    # single rucksack/compartment. The supplied body runs once the item
+    # value (priority) is available.
     def contents_loop(cond, cond_grp, body):
-        return [
-            reset_item,
-            while_(cond, cond_grp, [
-                load_item,
-                body,
-                {incr_item, incr_global_item},
-            ]),
-        ]
+        return loop.control([*load_item, body], cond, cond_grp)
+
+    # Skip the remaining items without resetting the loop counter.
+    def skip_loop(cond, cond_grp):
+        return loop.control(load_item, cond, cond_grp, reset=False)
 
-    return contents_loop
+    return loop, item, contents_loop, skip_loop
 
 
 def build_team_loop(main, rucksacks_per_team, contents, lengths, rucksacks,
-                    accum, filters, rucksack_idx):
+                    accum, filters, rucksack_idx, streams=None,
+                    compartments=None, item_width=ITEM_WIDTH):
     """Build a control program to process a single elf team.
 
     This produces an "unrolled loop" that processes all the contiguous
     rucksacks in a "team." That's 1 elf (two compartments) for Part 1 of
     the puzzle and 3 elves for Part 2. ("Team" is not the term used in
     the description, but "group" was already taken. :)
+
+    If `streams` is a pair of `lengths` and `contents` streams, we get
+    the input from those instead of from the interface memories.
+
+    If `compartments` is a pair of a filter and an accumulator, we also
+    check the compartments of every rucksack in the team (i.e., solve
+    Part 1) in the same pass.
+
+    The accumulators are `Accumulator`s, and the items are `item_width`
+    bits wide.
     """
+    lengths_stream, contents_stream = streams or (None, None)
+    halve = rucksacks_per_team == 1 or compartments is not None
+
     # Register for the contents loop limit. In compartment mode, divide
     # the rucksack length by 2 to get the *compartment* length.
     items = main.reg("items", LENGTH_WIDTH)
     with main.group("init_items") as init_items:
-        lengths.read_en = 1
-        lengths.addr0 = rucksack_idx.out
+        if streams:
+            length = lengths_stream.regs["length"].out
+            items.write_en = 1
+        else:
+            lengths.read_en = 1
+            lengths.addr0 = rucksack_idx.out
+            length = lengths.out
+            items.write_en = lengths.read_done
 
         # Halve the rucksack length to get the compartment length.
-        if rucksacks_per_team == 1:
+        if halve:
             rsh = main.cell(
                 "rsh",
                 ast.Stdlib().op("rsh", LENGTH_WIDTH, signed=False),
             )
-            rsh.left = lengths.out
+            rsh.left = length
             rsh.right = const(LENGTH_WIDTH, 1)  # Shift down 1 bit.
             val = rsh.out
         else:
-            val = lengths.out
+            val = length
 
-        items.write_en = lengths.read_done
         items.in_ = val
         init_items.done = items.done
 
@@ -117,21 +156,13 @@ def build_team_loop(main, rucksacks_per_team, contents, lengths, rucksacks,
         all_present.in_ = all_present_cond @ 1
         all_present.in_ = ~all_present_cond @ 0
 
-    # Generic loop structure for iterating over items.
-    item_idx = main.reg("item_idx", LENGTH_WIDTH)
-    global_item_idx = main.reg("global_item_idx", CONTENTS_IDX_WIDTH)
-    item = main.reg("item", ITEM_WIDTH)
-    contents_loop = build_item_loop(main, contents, item_idx,
-                                    global_item_idx, item)
-
-    # An exit check for the "populate" item loop.
-    item_lt = main.cell(
-        "item_lt",
-        ast.Stdlib().op("lt", LENGTH_WIDTH, signed=False),
+    # Generic loop structure for iterating over items, with an exit
+    # check for the "populate" item loop.
+    loop, item, contents_loop, skip_loop = build_item_loop(
+        main, contents, items, contents_stream, item_width,
     )
-    with main.comb_group("check_item") as check_item:
-        item_lt.left = item_idx.out
-        item_lt.right = items.out
+    global_item_idx = loop.addr
+    item_lt, check_item = loop.lt, loop.check
 
     # Control fragment: a loop to *populate* a filter (i.e., mark
     # contents but don't check them).
@@ -144,22 +175,15 @@ def build_team_loop(main, rucksacks_per_team, contents, lengths, rucksacks,
         )
 
     # Accumulator for duplicate item priorities.
-    accum_add = main.add("accum_add", SCORE_WIDTH)
-    pad = main.cell("pad", ast.CompInst("std_pad", [ITEM_WIDTH, SCORE_WIDTH]))
     with main.group("accum_priority") as accum_priority:
-        accum_add.left = accum.out
-        pad.in_ = item.out
-        accum_add.right = pad.out
-        accum.write_en = 1
-        accum.in_ = accum_add.out
-        accum_priority.done = accum.done
+        accum_priority.done = accum.add(item.out, item_width)
 
     # Next, an exit check for the "checker" loop, when we need an early
     # exit after the first collision is found.
     break_cond = main.cell("break_cond",
                            ast.Stdlib().op("wire", 1, signed=False))
     with main.comb_group("check_item_break") as check_item_break:
-        item_lt.left = item_idx.out
+        item_lt.left = loop.counter.out
         item_lt.right = items.out
         break_cond.in_ = (item_lt.out & ~all_present_cond) @ 1
         break_cond.in_ = ~(item_lt.out & ~all_present_cond) @ 0
@@ -179,44 +203,62 @@ def build_team_loop(main, rucksacks_per_team, contents, lengths, rucksacks,
         ],
     )
 
-    # Save the *next* global start index at the beginning of the
-    # outer loop: `next_idx = idx + items`
-    next_idx = main.reg("next_idx", CONTENTS_IDX_WIDTH)
-    pad = main.cell("pad_idx", ast.CompInst("std_pad", [LENGTH_WIDTH,
-                                                        CONTENTS_IDX_WIDTH]))
-    jump_add = main.add("jump_add", CONTENTS_IDX_WIDTH)
-    with main.group("save_next") as save_next:
-        jump_add.left = global_item_idx.out
-        pad.in_ = items.out
-
-        # Double the rucksack compartment size to get the full rucksack
-        # size.
-        if rucksacks_per_team == 1:
-            double = main.add("double", CONTENTS_IDX_WIDTH)
-            double.left = pad.out
-            double.right = pad.out
-            jump_add.right = double.out
-        else:
-            jump_add.right = pad.out
-
-        next_idx.write_en = 1
-        next_idx.in_ = jump_add.out
-        save_next.done = next_idx.done
-
-    # "Jump" to the start of the next rucksack in the contents memory.
-    with main.group("jump_global_item") as jump_global_item:
-        global_item_idx.write_en = 1
-        global_item_idx.in_ = next_idx.out
-        jump_global_item.done = global_item_idx.done
-
-    # Increment for rucksack loop.
-    rucksack_add = main.add("rucksack_add", RUCKSACK_IDX_WIDTH)
-    with main.group("incr_rucksack") as incr_rucksack:
-        rucksack_add.left = rucksack_idx.out
-        rucksack_add.right = 1
-        rucksack_idx.write_en = 1
-        rucksack_idx.in_ = rucksack_add.out
-        incr_rucksack.done = rucksack_idx.done
+    if streams:
+        # Receive the rucksack's length before processing it. There's no
+        # need to jump to the next rucksack, but we do need to consume
+        # any items left after a check loop exits early.
+        start_rucksack = [lengths_stream.pop, init_items]
+        check_loop = [check_loop, skip_loop(item_lt.out, check_item)]
+        next_rucksack = []
+    else:
+        # Save the *next* global start index at the beginning of the
+        # outer loop: `next_idx = idx + items`
+        next_idx = main.reg("next_idx", CONTENTS_IDX_WIDTH)
+        pad = main.cell("pad_idx",
+                        ast.CompInst("std_pad", [LENGTH_WIDTH,
+                                                 CONTENTS_IDX_WIDTH]))
+        jump_add = main.add("jump_add", CONTENTS_IDX_WIDTH)
+        with main.group("save_next") as save_next:
+            jump_add.left = global_item_idx.out
+            pad.in_ = items.out
+
+            # Double the rucksack compartment size to get the full
+            # rucksack size.
+            if halve:
+                double = main.add("double", CONTENTS_IDX_WIDTH)
+                double.left = pad.out
+                double.right = pad.out
+                jump_add.right = double.out
+            else:
+                jump_add.right = pad.out
+
+            next_idx.write_en = 1
+            next_idx.in_ = jump_add.out
+            save_next.done = next_idx.done
+
+        # "Jump" to the start of the next rucksack in the contents memory.
+        with main.group("jump_global_item") as jump_global_item:
+            global_item_idx.write_en = 1
+            global_item_idx.in_ = next_idx.out
+            jump_global_item.done = global_item_idx.done
+
+        # Increment for rucksack loop.
+        rucksack_add = main.add("rucksack_add", RUCKSACK_IDX_WIDTH)
+        with main.group("incr_rucksack") as incr_rucksack:
+            rucksack_add.left = rucksack_idx.out
+            rucksack_add.right = 1
+            rucksack_idx.write_en = 1
+            rucksack_idx.in_ = rucksack_add.out
+            incr_rucksack.done = rucksack_idx.done
+
+        start_rucksack = [init_items, save_next]
+        next_rucksack = [{incr_rucksack, jump_global_item}]
+
+    if compartments:
+        return build_fused_control(main, rucksacks_per_team, filters, item,
+                                   accum, all_present_cond, compartments,
+                                   contents_loop, item_lt.out, check_item,
+                                   start_rucksack, next_rucksack, item_width)
 
     # Final control for the "unrolled loop."
     team_control = []
@@ -224,10 +266,7 @@ def build_team_loop(main, rucksacks_per_team, contents, lengths, rucksacks,
         # Set up the contents register (the loop limit for processing
         # each set of contents), and record the place we'll jump for the
         # next rucksack.
-        team_control += [
-            init_items,
-            save_next,
-        ]
+        team_control += start_rucksack
 
         if rucksacks_per_team == 1:
             # With only a single rucksack, check both compartments. Our
@@ -245,90 +284,332 @@ def build_team_loop(main, rucksacks_per_team, contents, lengths, rucksacks,
             team_control.append(check_loop)
 
         # Advance to the next rucksack.
-        team_control.append(
-            {incr_rucksack, jump_global_item},
-        )
+        team_control += next_rucksack
 
     return team_control
 
 
-def build(rucksacks_per_team=1):
+def build_found(main, name, accum, present, item, item_width):
+    """Build the logic to add an item's priority to an accumulator once.
+
+    A flag register records whether we have already found the common
+    item. Return a group that clears the flag and a control statement
+    that checks the `present` condition and, for the first item where
+    it holds, updates the accumulator and sets the flag.
+    """
+    found = main.reg(f"{name}_found", 1)
+    with main.group(f"clear_{name}_found") as clear_found:
+        found.write_en = 1
+        found.in_ = 0
+        clear_found.done = found.done
+
+    is_new = main.cell(f"{name}_new",
+                       ast.Stdlib().op("wire", 1, signed=False))
+    with main.comb_group(f"check_{name}_new") as check_new:
+        is_new.in_ = (present & ~found.out) @ 1
+        is_new.in_ = ~(present & ~found.out) @ 0
+
+    with main.group(f"accum_{name}") as accum_found:
+        found.write_en = 1
+        found.in_ = 1
+        accum_found.done = accum.add(item.out, item_width)
+
+    return clear_found, if_(is_new.out, check_new, accum_found)
+
+
+def build_fused_control(main, rucksacks_per_team, filters, item, accum,
+                        all_present_cond, compartments, contents_loop,
+                        item_lt, check_item, start_rucksack, next_rucksack,
+                        item_width):
+    """Build the control for a team that also checks compartments.
+
+    Every rucksack is processed as two compartment-sized item loops. The
+    team filters see every item in both halves while the compartment
+    filter is populated by the first half and checked by the second.
+    Neither check can exit early, so we count each common item once
+    with a flag.
+    """
+    comp_filter, comp_accum = compartments
+    clear_team, count_team = build_found(main, "team", accum,
+                                         all_present_cond, item, item_width)
+    clear_comp, count_comp = build_found(main, "comp", comp_accum,
+                                         comp_filter.present, item,
+                                         item_width)
+
+    def use_filter(filt, set_):
+        return invoke(filt, in_value=item.out, in_set=const(1, set_),
+                      in_clear=const(1, 0))
+
+    team_control = [clear_team]
+    for i in range(rucksacks_per_team):
+        # Populate the team filters for every rucksack but the last,
+        # which checks them.
+        last = i == rucksacks_per_team - 1
+        team_step = [use_filter(filt, 0) for filt in filters] if last \
+            else [use_filter(filters[i], 1)]
+        team_count = [count_team] if last else []
+
+        team_control += start_rucksack
+        team_control += [
+            invoke(comp_filter, in_value=const(item_width, 0),
+                   in_set=const(1, 0), in_clear=const(1, 1)),
+            clear_comp,
+            contents_loop(item_lt, check_item, [
+                ast.ParComp([use_filter(comp_filter, 1), *team_step]),
+                *team_count,
+            ]),
+            contents_loop(item_lt, check_item, [
+                ast.ParComp([use_filter(comp_filter, 0), *team_step]),
+                count_comp,
+                *team_count,
+            ]),
+        ]
+        team_control += next_rucksack
+
+    return team_control
+
+
+def build(rucksacks_per_team=1, resumable=False, stream=False, both=False,
+          max_rucksacks=None, item_width=ITEM_WIDTH, filter_kind="markers",
+          filter_capacity=None, batch=None, trace=None):
     """Build the `main` component for AOC day 3.
 
     `rucksacks_per_team` dictates the number of different rucksacks
     (compartment pairs) we are looking for conflicts among. If this is
     1, then we look at *compartments* within a single rucksack: i.e., we
     chop each rucksack contents in half and treat them as separate.
+
+    With `resumable`, the running score is loaded from and saved to a
+    `state_accum` interface memory so a host can feed the input through
+    in chunks. The host must split the input on team boundaries, so a
+    partially processed team is carried over by simply sending its
+    rucksacks again with the next chunk.
+
+    With `stream`, the rucksack lengths and contents arrive on `lengths`
+    and `contents` ready/valid streams instead of in interface memories.
+    Several loops (and the skip loops) take turns consuming `contents`,
+    so these streams don't prefetch: each item arrives before the work
+    on it starts.
+
+    With `both`, the accelerator also checks the compartments of every
+    rucksack while it processes the teams, so it solves both parts of the
+    puzzle in one pass. The two answers go in a two-entry `answer`
+    memory.
+
+    With `max_rucksacks`, a bound on the number of rucksacks in the
+    input, the accumulators are only as wide as the total priority needs
+    to be (at most one common item per rucksack), instead of
+    `SCORE_WIDTH` bits.
+
+    `item_width` sets the width of the item IDs, for variants of the
+    puzzle with larger alphabets than the 52 priorities. `filter_kind`
+    picks the filter that remembers which items we have seen: either a
+    flag for every possible item (`"markers"`, see `build_filter`) or a
+    small CAM with room for `filter_capacity` distinct items (`"cam"`,
+    see `build_cam_filter`), which must be at least the number of
+    distinct items in any rucksack (`max_distinct` in `convert.py
+    --meta`). A CAM design has a one-entry `overflow` memory, which it
+    sets if any filter ran out of room, making the answer meaningless.
+
+    With `batch`, the accelerator solves that many independent inputs in
+    one run (see `common/multi.py`). Their rucksacks go one after
+    another in the memories, `rucksacks` has an entry for each input,
+    and each input's answers go in the next entries of `answer`. We
+    clear the accumulators between inputs.
+
+    With `trace`, the accelerator records the start and end cycles of
+    processing each team in a ring buffer of that many entries (see
+    `common/tracing.py`).
     """
+    assert not (resumable and stream), "streams are already unbounded"
+    assert not (batch and (resumable or stream)), \
+        "batches hold whole inputs in memory"
+    assert not (stream and item_width != ITEM_WIDTH), \
+        "streams carry priorities"
+    assert not (resumable and both), "fused designs are not resumable"
+    assert not both or rucksacks_per_team > 1, \
+        "fused designs need teams of rucksacks"
+    assert filter_kind != "cam" or filter_capacity, \
+        "CAM filters need a capacity"
     prog = Builder()
     main = prog.component("main")
 
     # Inputs & outputs.
-    contents = build_mem(main, "contents", ITEM_WIDTH, MAX_CONTENTS)
-    lengths = build_mem(main, "lengths", LENGTH_WIDTH, MAX_RUCKSACKS)
-    rucksacks = build_mem(main, "rucksacks", RUCKSACK_IDX_WIDTH, 1)
-    answer = build_mem(main, "answer", SCORE_WIDTH, 1)
+    if stream:
+        streams = (
+            build_stream(main, "lengths", [("length", LENGTH_WIDTH)]),
+            build_stream(main, "contents", [("item", item_width)]),
+        )
+        contents = lengths = rucksacks = rucksack_idx = None
+    else:
+        streams = None
+        contents = build_mem(main, "contents", item_width, MAX_CONTENTS)
+        lengths = build_mem(main, "lengths", LENGTH_WIDTH, MAX_RUCKSACKS)
+        rucksacks = build_kernel_mem(main, "rucksacks", RUCKSACK_IDX_WIDTH,
+                                     batch or 1)
+        rucksack_idx = main.reg("rucksack_idx", RUCKSACK_IDX_WIDTH)
+    answers = (2 if both else 1) * (batch or 1)
+    answer = build_kernel_mem(main, "answer", SCORE_WIDTH, answers)
+
+    # The loop over the inputs in a batch, which prefetches each input's
+    # number of rucksacks.
+    if batch:
+        inputs = build_batch(main, batch, rucksacks, RUCKSACK_IDX_WIDTH,
+                             answers.bit_length())
+    else:
+        inputs = None
+
+    # The widest a total priority can get. Wider items are arbitrary IDs
+    # rather than priorities.
+    if item_width == ITEM_WIDTH:
+        max_item = MAX_PRIORITY
+    else:
+        max_item = 2 ** item_width - 1
+    if max_rucksacks:
+        score_width = bits(max_rucksacks * max_item)
+    else:
+        score_width = SCORE_WIDTH
 
     # Filter subcomponents. We need one fewer filters than we have
     # chunks of components to process: the last one will merely check
     # the existing filters.
-    filter_def = build_filter(prog, ITEM_WIDTH)
+    if filter_kind == "cam":
+        filter_def = build_cam_filter(prog, item_width, filter_capacity)
+    else:
+        filter_def = build_filter(prog, item_width)
     num_filters = 1 if rucksacks_per_team == 1 else rucksacks_per_team - 1
     filters = [
         main.cell(f"filter{i}", filter_def)
         for i in range(num_filters)
     ]
 
+    # The fused design has an extra filter and accumulator for checking
+    # compartments.
+    if both:
+        compartments = (main.cell("comp_filter", filter_def),
+                        Accumulator(main, "comp_accum", score_width))
+    else:
+        compartments = None
+
     # Generate the primary logic for processing a team of elves.
-    accum = main.reg("accum", SCORE_WIDTH)
-    rucksack_idx = main.reg("rucksack_idx", RUCKSACK_IDX_WIDTH)
+    accum = Accumulator(main, "accum", score_width)
     team_control = build_team_loop(main, rucksacks_per_team,
                                    contents, lengths, rucksacks, accum,
-                                   filters, rucksack_idx)
+                                   filters, rucksack_idx, streams,
+                                   compartments, item_width)
 
     # Control fragment: "unrolled loop" to reset all the filters.
     reset_filters = ast.ParComp([
-        invoke(filt, in_value=const(ITEM_WIDTH, 0), in_set=const(1, 0),
+        invoke(filt, in_value=const(item_width, 0), in_set=const(1, 0),
                in_clear=const(1, 1))
         for filt in filters
     ])
+    team_body = [reset_filters] + team_control
+
+    # Report whether any CAM filter overflowed.
+    if filter_kind == "cam":
+        overflow_end = [build_overflow(
+            main, filters + ([compartments[0]] if both else []),
+        )]
+    else:
+        overflow_end = []
+
+    # Per-team latency tracing.
+    if trace:
+        tracer = build_trace(main, trace)
+        team_body = tracer.wrap(team_body)
+        trace_end = [tracer.save_count]
+    else:
+        trace_end = []
+
+    if stream:
+        # Keep going until we've processed the last rucksack length.
+        not_last = main.cell("not_last",
+                             ast.Stdlib().op("not", 1, signed=False))
+        with main.comb_group("more") as more:
+            not_last.in_ = streams[0].last.out
+        setup = []
+        loop = while_(not_last.out, more, team_body)
+    else:
+        # (Constant) register for rucksack loop limit. In a batch, the
+        # limit is the end of the current input's rucksacks.
+        if batch:
+            end_add = main.add("end_add", RUCKSACK_IDX_WIDTH)
+            with main.continuous:
+                end_add.left = rucksack_idx.out
+                end_add.right = inputs.loop.regs["count"].out
+            rucksacks_reg, init_rucksacks = build_count(
+                main, "rucksacks", RUCKSACK_IDX_WIDTH, port=end_add.out,
+            )
+        else:
+            rucksacks_reg, init_rucksacks = build_count(
+                main, "rucksacks", RUCKSACK_IDX_WIDTH, mem=rucksacks,
+            )
 
-    # (Constant) register for rucksack loop limit.
-    rucksacks_reg = main.reg("rucksacks_reg", RUCKSACK_IDX_WIDTH)
-    with main.group("init_rucksack") as init_rucksack:
-        rucksacks.read_en = 1
-        rucksacks.addr0 = 0
-        rucksacks_reg.write_en = rucksacks.read_done
-        rucksacks_reg.in_ = rucksacks.out
-        init_rucksack.done = rucksacks_reg.done
-
-    # Exit check for rucksack loop.
-    rucksack_lt = main.cell(
-        "rucksack_lt",
-        ast.Stdlib().op("lt", RUCKSACK_IDX_WIDTH, signed=False),
-    )
-    with main.comb_group("check_rucksack") as check_rucksack:
-        rucksack_lt.left = rucksack_idx.out
-        rucksack_lt.right = rucksacks_reg.out
+        # Exit check for rucksack loop.
+        rucksack_lt = main.cell(
+            "rucksack_lt",
+            ast.Stdlib().op("lt", RUCKSACK_IDX_WIDTH, signed=False),
+        )
+        with main.comb_group("check_rucksack") as check_rucksack:
+            rucksack_lt.left = rucksack_idx.out
+            rucksack_lt.right = rucksacks_reg.out
+        setup = [init_rucksacks]
+        loop = while_(rucksack_lt.out, check_rucksack, team_body)
 
     # Publish result back to interface memory.
-    with main.group("finish") as finish:
-        answer.write_en = 1
-        answer.addr0 = 0
-        answer.in_ = accum.out
-        finish.done = answer.write_done
+    addr = inputs.answer_idx.out if batch else 1 if both else 0
+    finish = [accum.publish("finish", answer, addr, SCORE_WIDTH)]
+
+    # The fused design also publishes the Part 1 answer.
+    if both:
+        addr = inputs.answer_idx.out if batch else 0
+        finish.insert(0, compartments[1].publish("finish_comp", answer, addr,
+                                                 SCORE_WIDTH))
+
+    # Carry the score between chunks.
+    if resumable:
+        state_accum = build_kernel_mem(main, "state_accum", SCORE_WIDTH, 1)
+        load_accum, save_accum = accum.state(state_accum, SCORE_WIDTH)
+        setup = [{*setup, load_accum}]
+        teardown = [*finish, save_accum]
+    else:
+        teardown = finish
 
     # Overall control program.
-    main.control += [
-        init_rucksack,
-        while_(rucksack_lt.out, check_rucksack,
-               [reset_filters] + team_control),
-        finish,
-    ]
+    if batch:
+        # Start each input from scratch.
+        clear_accums = [accum.clear()]
+        if both:
+            clear_accums.append(compartments[1].clear())
+        main.control += [
+            inputs.control([{*clear_accums, *setup}, loop], finish),
+            *overflow_end,
+            *trace_end,
+        ]
+    else:
+        main.control += [*setup, loop, *teardown, *overflow_end,
+                         *trace_end]
 
     return prog.program
 
 
+def build_overflow(main, filters):
+    """Generate a group that sets the `overflow` flag in its own
+    interface memory if any of the (CAM) `filters` ran out of room.
+    """
+    overflow = build_kernel_mem(main, "overflow", 1, 1)
+    overflowed = reduce(lambda l, r: l | r,
+                        (filt.overflow for filt in filters))
+    with main.group("finish_overflow") as finish_overflow:
+        overflow.write_en = 1
+        overflow.addr0 = 0
+        overflow.in_ = overflowed @ 1
+        overflow.in_ = ~overflowed @ 0
+        finish_overflow.done = overflow.write_done
+    return finish_overflow
+
+
 def build_filter(prog, width):
     filter = prog.component("filter")
 
@@ -416,5 +697,147 @@ def build_filter(prog, width):
     return filter
 
 
+def build_cam_filter(prog, width, capacity):
+    """Build a filter backed by a small content-addressable memory.
+
+    This has the same interface as `build_filter`, but instead of a flag
+    for every possible value, it holds up to `capacity` distinct values
+    in registers and compares the input against all of them at once. So
+    its area grows with the number of distinct items in a rucksack
+    rather than with the `2 ** width` alphabet, and clearing it only
+    has to drop the entries' valid flags, which takes a single cycle.
+
+    Entries fill up in order, so the valid entries are always a prefix
+    and the first free entry is the one right after the last valid one.
+    Setting a new value in a full filter can't store it, so it sets the
+    extra `overflow` output instead. Clearing the filter leaves that
+    flag set, so it reports an overflow anywhere in the input.
+    """
+    assert capacity >= 1
+    filter = prog.component("filter")
+
+    filter.input("value", width)
+    filter.input("set", 1)
+    filter.input("clear", 1)
+    filter.output("present", 1)
+    filter.output("overflow", 1)
+
+    keys = [filter.reg(f"key{i}", width) for i in range(capacity)]
+    valid = [filter.reg(f"valid{i}", 1) for i in range(capacity)]
+    eqs = [
+        filter.cell(f"eq{i}", ast.Stdlib().op("eq", width, signed=False))
+        for i in range(capacity)
+    ]
+
+    # Compare the value against every entry at once.
+    with filter.continuous:
+        for key, eq in zip(keys, eqs):
+            eq.left = key.out
+            eq.right = filter.this().value
+    hit = reduce(lambda l, r: l | r,
+                 (v.out & eq.out for v, eq in zip(valid, eqs)))
+
+    # Check whether the value has been seen before.
+    present_reg = filter.reg("present_reg", 1)
+    with filter.group("lookup") as lookup:
+        present_reg.write_en = 1
+        present_reg.in_ = hit @ 1
+        present_reg.in_ = ~hit @ 0
+        lookup.done = present_reg.done
+
+    # Store a new value in the first free entry, or flag an overflow if
+    # there isn't one. Like `set_marker`, this leaves the output
+    # register alone, so checks that follow a populate loop start from a
+    # clean slate. The first entry is valid after any insert (it's the
+    # free one if the filter was empty), so writing its flag every time
+    # gives us a done signal even when nothing changes.
+    overflow_reg = filter.reg("overflow_reg", 1)
+    with filter.group("insert") as insert:
+        for i, (key, v) in enumerate(zip(keys, valid)):
+            free = ~v.out if i == 0 else valid[i - 1].out & ~v.out
+            key.write_en = (free & ~hit) @ 1
+            key.in_ = filter.this().value
+            if i:
+                v.write_en = (free & ~hit) @ 1
+            else:
+                v.write_en = 1
+            v.in_ = 1
+        overflow_reg.write_en = (valid[-1].out & ~hit) @ 1
+        overflow_reg.in_ = 1
+        insert.done = valid[0].done
+
+    # Invalidate every entry at once (the keys can keep their stale
+    # values) and clear the output register.
+    with filter.group("invalidate") as invalidate:
+        for v in valid:
+            v.write_en = 1
+            v.in_ = 0
+        present_reg.write_en = 1
+        present_reg.in_ = 0
+        invalidate.done = present_reg.done
+
+    # Connect the output registers to the outputs.
+    with filter.continuous:
+        filter.this().present = present_reg.out
+        filter.this().overflow = overflow_reg.out
+
+    filter.control += \
+        if_(filter.this().clear, None, invalidate,
+            if_(filter.this().set, None, insert, lookup))
+
+    return filter
+
+
+def args_parser():
+    """Get the command-line interface, which host-side drivers also use
+    to find out how a design was configured.
+    """
+    parser = argparse.ArgumentParser(
+        description="Generate the AOC day 3 accelerator.",
+    )
+    parser.add_argument("rucksacks_per_team", type=int)
+    parser.add_argument("--resumable", action="store_true",
+                        help="carry state across chunks of the input")
+    parser.add_argument("--stream", action="store_true",
+                        help="receive the input on ready/valid streams")
+    parser.add_argument("--both", action="store_true",
+                        help="also check compartments to solve both parts")
+    parser.add_argument("--parallelize", action="store_true",
+                        help="run independent control statements in parallel")
+    parser.add_argument("--static", action="store_true",
+                        help="mark fixed-latency groups for static timing")
+    parser.add_argument("--max-rucksacks", type=int,
+                        help="size the datapath for up to this many rucksacks")
+    parser.add_argument("--item-width", type=int, default=ITEM_WIDTH,
+                        help="bits in each item ID (default: %(default)s)")
+    parser.add_argument("--filter", choices=["markers", "cam"],
+                        default="markers",
+                        help="how to remember the items we have seen")
+    parser.add_argument("--filter-capacity", type=int,
+                        help="distinct items a `cam` filter can hold "
+                        "(required for `cam`)")
+    parser.add_argument("--batch", type=int,
+                        help="solve this many inputs in each run")
+    parser.add_argument("--trace", type=int, metavar="N",
+                        help="record the last N iterations' latencies")
+    return parser
+
+
 if __name__ == '__main__':
-    build(int(sys.argv[1])).emit()
+    parser = args_parser()
+    opts = parser.parse_args()
+    check_arguments(parser, opts)
+    if opts.filter == "cam" and not opts.filter_capacity:
+        parser.error("--filter cam needs a --filter-capacity (at least "
+                     "max_distinct from convert.py --meta)")
+    program = build(opts.rucksacks_per_team, resumable=opts.resumable,
+                    stream=opts.stream, both=opts.both,
+                    max_rucksacks=opts.max_rucksacks,
+                    item_width=opts.item_width, filter_kind=opts.filter,
+                    filter_capacity=opts.filter_capacity,
+                    batch=opts.batch, trace=opts.trace)
+    if opts.parallelize:
+        parallelize(program)
+    if opts.static:
+        infer_static(program)
+    program.emit()
@@ -3,9 +3,23 @@
 The idea is to use the priority value of each item (which unambiguously
 identifies the item in 6 bits). We record the *size* of one each
 rucksack (so this is a sparse encoding, unlike Day 1).
+
+For a `--batch` design, several inputs go one after another in the
+memories, and `rucksacks` has one entry per input.
 """
-import sys
+import argparse
+import contextlib
 import json
+import os
+import string
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "common"))
+import bulk  # noqa: E402
+import memfmt  # noqa: E402
 
 MAX_CONTENTS = 16384
 MAX_RUCKSACKS = 512
@@ -13,36 +27,62 @@ ITEM_WIDTH = 6
 LENGTH_WIDTH = 8
 SCORE_WIDTH = 32
 
+# Generator options that change the layout of the memories, which
+# `convert` takes as keyword arguments.
+OPTIONS = ("both", "item_width", "filter", "batch")
+
 
 def char2pri(c):
     return ord(c) - ord('a') + 1 if c > 'Z' else \
         ord(c) - ord('A') + 27
 
 
-def convert(infile):
-    contents = []
-    lengths = []
+# Map every byte to its item priority, or 0 if it's not an item.
+PRIORITIES = np.zeros(256, dtype=np.int64)
+for c in string.ascii_letters:
+    PRIORITIES[ord(c)] = char2pri(c)
+
 
-    for line in infile:
-        line = line.strip()
-        vals = [char2pri(c) for c in line]
-        contents += vals
-        lengths.append(len(vals))
+def parse(infile):
+    """Read the item priorities and the length of every rucksack.
+    """
+    buf = bulk.read(infile)
+    starts, ends = bulk.lines(buf)
+    lengths = ends - starts
 
+    priorities = PRIORITIES[buf]
+    contents = priorities[priorities != 0]
+    assert len(contents) == lengths.sum(), "unknown item"
+    assert not (lengths % 2).any(), \
+        "rucksacks must have two compartments of the same size"
+
+    return contents, lengths
+
+
+def memories(contents, lengths, both=False, item_width=ITEM_WIDTH,
+             filter="markers"):
+    """Pad the data and wrap it up in memory descriptions.
+
+    With `both`, the `answer` memory has room for the answers to both
+    parts of the puzzle. `item_width` is the width of the `contents`
+    memory, for a design generated with a wider `--item-width`. A
+    design with `--filter cam` also gets its `overflow` flag.
+    """
     assert len(contents) <= MAX_CONTENTS
+    assert len(lengths) <= MAX_RUCKSACKS
 
-    return {
+    data = {
         # Inputs.
         "contents": {
-            "data": contents + [0] * (MAX_CONTENTS - len(contents)),
+            "data": np.pad(contents, (0, MAX_CONTENTS - len(contents))),
             "format": {
                 "numeric_type": "bitnum",
                 "is_signed": False,
-                "width": ITEM_WIDTH,
+                "width": item_width,
             }
         },
         "lengths": {
-            "data": lengths + [0] * (MAX_RUCKSACKS - len(lengths)),
+            "data": np.pad(lengths, (0, MAX_RUCKSACKS - len(lengths))),
             "format": {
                 "numeric_type": "bitnum",
                 "is_signed": False,
@@ -60,7 +100,7 @@ def convert(infile):
 
         # Output.
         "answer": {
-            "data": [0],
+            "data": [0, 0] if both else [0],
             "format": {
                 "numeric_type": "bitnum",
                 "is_signed": False,
@@ -68,8 +108,186 @@ def convert(infile):
             },
         },
     }
+    if filter == "cam":
+        data["overflow"] = {
+            "data": [0],
+            "format": {
+                "numeric_type": "bitnum",
+                "is_signed": False,
+                "width": 1,
+            },
+        }
+    return data
+
+
+def convert(infile, both=False, item_width=ITEM_WIDTH, filter="markers",
+            batch=None):
+    if batch:
+        return convert_batch([infile], batch, both=both,
+                             item_width=item_width, filter=filter)
+    return memories(*parse(infile), both=both, item_width=item_width,
+                    filter=filter)
+
+
+def convert_batch(infiles, size, both=False, item_width=ITEM_WIDTH,
+                  filter="markers"):
+    """Lay out several inputs for a design generated with `--batch`.
+
+    `size` is the design's batch size, which must be at least the number
+    of inputs. Each input's answers go in consecutive entries of the
+    `answer` memory.
+    """
+    assert 0 < len(infiles) <= size, "the inputs do not fit in the batch"
+    parsed = [parse(infile) for infile in infiles]
+    data = memories(*map(np.concatenate, zip(*parsed)), both=both,
+                    item_width=item_width, filter=filter)
+    counts = [len(lengths) for _, lengths in parsed]
+    data["rucksacks"]["data"] = np.pad(counts, (0, size - len(parsed)))
+    data["answer"]["data"] = data["answer"]["data"] * size
+    return data
+
+
+def meta(infile):
+    """Measure the sizes of the rucksacks in the input.
+
+    A design generated with `--max-rucksacks` set to our `rucksacks` has
+    a datapath that is just wide enough for this input, and a `cam`
+    filter needs room for `max_distinct` items.
+    """
+    contents, lengths = parse(infile)
+
+    # Count the distinct (rucksack, item) pairs for each rucksack.
+    rucksack = np.repeat(np.arange(len(lengths)), lengths)
+    pairs = np.unique((rucksack << ITEM_WIDTH) | contents)
+    distinct = np.bincount(pairs >> ITEM_WIDTH, minlength=1)
+
+    return {
+        "rucksacks": len(lengths),
+        "items": len(contents),
+        "max_length": int(lengths.max(initial=0)),
+        "max_distinct": int(distinct.max()),
+    }
+
+
+def streams(infile):
+    """Arrange the data as input streams for a `--stream` accelerator.
+
+    The `lengths` stream has one element per rucksack, and the
+    `contents` stream has every item in every rucksack.
+    """
+    contents, lengths = parse(infile)
+    assert len(lengths), "streams must have at least one element"
+
+    return {
+        "lengths": {
+            "length": {
+                "data": lengths,
+                "format": {
+                    "numeric_type": "bitnum",
+                    "is_signed": False,
+                    "width": LENGTH_WIDTH,
+                }
+            },
+        },
+        "contents": {
+            "item": {
+                "data": contents,
+                "format": {
+                    "numeric_type": "bitnum",
+                    "is_signed": False,
+                    "width": ITEM_WIDTH,
+                }
+            },
+        },
+    }
+
+
+def team_spans(lengths, team_size, max_rucksacks, max_contents):
+    """Group whole teams of rucksacks into spans that fit in memory.
+
+    Generate `(first, last)` rucksack index ranges. Every span starts
+    on a team boundary, so no team is ever split across spans.
+    """
+    start = 0
+    while start < len(lengths):
+        end = start
+        items = 0
+        while end < len(lengths):
+            team = lengths[end:end + team_size]
+            if (end + len(team) - start > max_rucksacks or
+                    items + sum(team) > max_contents):
+                break
+            end += len(team)
+            items += sum(team)
+        assert end > start, "a single team does not fit in memory"
+        yield start, end
+        start = end
+
+
+def chunks(infile, design, size=MAX_CONTENTS):
+    """Split the input into chunks for a `--resumable` accelerator.
+
+    `size` limits the number of items in each chunk. We only ever split
+    between teams, so the only carried state is the score in
+    `state_accum`, which starts at zero.
+    """
+    contents, lengths = parse(infile)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+
+    spans = team_spans(lengths, design.rucksacks_per_team,
+                       MAX_RUCKSACKS, size)
+    for first, last in spans:
+        data = memories(contents[offsets[first]:offsets[last]],
+                        lengths[first:last], item_width=design.item_width,
+                        filter=design.filter)
+        data["state_accum"] = {
+            "data": [0],
+            "format": data["answer"]["format"],
+        }
+        yield data
+
+
+def boundaries(lines, design):
+    """Find the lines where a piece of the input can safely start.
+
+    Pieces must contain whole teams.
+    """
+    return list(range(0, len(lines), design.rucksacks_per_team))
+
+
+def merge(results, design):
+    """Combine the final memories from independent pieces of the input.
+    """
+    return sum(r["answer"][0] for r in results)
 
 
 if __name__ == "__main__":
-    json.dump(convert(sys.stdin), sys.stdout,
-              indent=2, sort_keys=True)
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    memfmt.add_arguments(parser)
+    parser.add_argument("--both", action="store_true",
+                        help="for a design that solves both parts")
+    parser.add_argument("--item-width", type=int, default=ITEM_WIDTH,
+                        help="for a design with wider item IDs")
+    parser.add_argument("--filter", choices=["markers", "cam"],
+                        default="markers",
+                        help="for a design with that kind of filter")
+    parser.add_argument("--batch", type=int,
+                        help="for a design that solves a batch of inputs")
+    parser.add_argument("--meta", action="store_true",
+                        help="print the value ranges in the input instead")
+    parser.add_argument("inputs", nargs="*",
+                        help="input files for a batch (default: stdin)")
+    opts = parser.parse_args()
+    memfmt.check_arguments(parser, opts)
+    if opts.meta:
+        print(json.dumps(meta(sys.stdin), sort_keys=True))
+    elif opts.inputs:
+        with contextlib.ExitStack() as stack:
+            infiles = [stack.enter_context(open(p)) for p in opts.inputs]
+            data = convert_batch(infiles, opts.batch or len(infiles),
+                                 opts.both, opts.item_width, opts.filter)
+        memfmt.dump(data, opts.format, opts.output)
+    else:
+        memfmt.dump(convert(sys.stdin, opts.both, opts.item_width,
+                            opts.filter, opts.batch),
+                    opts.format, opts.output)
@@ -0,0 +1,84 @@
+"""Generate a synthetic puzzle input with its expected answers.
+
+Rucksacks come in teams of three. Each team has a badge item that all
+three rucksacks share, and each rucksack has one item type that appears
+in both of its compartments. Otherwise, the rucksacks draw from disjoint
+pools of item types, so those are the *only* common items for both
+parts of the puzzle. A real input has 300 rucksacks.
+"""
+import argparse
+import os
+import string
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "common"))
+import synth  # noqa: E402
+
+REAL_RUCKSACKS = 300
+TEAM_SIZE = 3
+
+# Item characters, indexed by priority.
+ITEMS = " " + string.ascii_lowercase + string.ascii_uppercase
+
+
+def generate(rng, teams, length=(8, 16)):
+    """Generate the rucksacks for some teams.
+
+    `length` is the range of *compartment* sizes. Return the list of
+    rucksacks (arrays of priorities), the item common to each
+    rucksack's compartments, and each team's badge.
+    """
+    rucksacks = []
+    commons = []
+    badges = []
+    for _ in range(teams):
+        types = rng.permutation(np.arange(1, len(ITEMS)))
+        badge = types[0]
+        badges.append(badge)
+
+        for pool in np.split(types[1:], TEAM_SIZE):
+            # One shared type and a private set for each compartment.
+            common = pool[0]
+            sides = np.array_split(pool[1:], 2)
+            size = rng.integers(length[0], length[1] + 1)
+            halves = [rng.choice(side, size) for side in sides]
+            for half in halves:
+                half[0] = common
+            halves[rng.integers(2)][1] = badge
+
+            rucksacks.append(np.concatenate([rng.permutation(h)
+                                             for h in halves]))
+            commons.append(common)
+
+    return rucksacks, commons, badges
+
+
+def answers(commons, badges):
+    return {
+        "part1": int(sum(commons)),
+        "part2": int(sum(badges)),
+    }
+
+
+def lines(rucksacks):
+    for rucksack in rucksacks:
+        yield "".join(ITEMS[p] for p in rucksack)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    synth.add_arguments(parser)
+    parser.add_argument("--length", type=int, nargs=2, default=(8, 16),
+                        metavar=("MIN", "MAX"),
+                        help="range of items per compartment")
+    opts = parser.parse_args()
+    assert 2 <= opts.length[0] <= opts.length[1] <= 127, \
+        "compartments must hold 2 to 127 items"
+
+    teams = synth.count(REAL_RUCKSACKS, opts.scale, TEAM_SIZE) // TEAM_SIZE
+    rucksacks, commons, badges = generate(synth.rng(opts), teams,
+                                          opts.length)
+    synth.write(lines(rucksacks), answers(commons, badges), opts.output)
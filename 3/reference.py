@@ -0,0 +1,90 @@
+"""A vectorized host-side reference solution.
+
+This works on the same memories that `convert.py` produces, so it can
+check the accelerator's answers and give us a software baseline for its
+throughput. It only needs NumPy, not the Calyx builder: the command line
+takes a design's generator arguments but only reads the options that
+change the answer.
+"""
+import argparse
+import sys
+
+import numpy as np
+
+import convert
+
+
+def elements(data):
+    """Count the input elements (items) in the memories.
+    """
+    rucksacks = data["rucksacks"]["data"][0]
+    return int(sum(data["lengths"]["data"][:rucksacks]))
+
+
+def segment_masks(items, starts, lengths):
+    """Get a bitmask of the item priorities in each segment, given the
+    segments' start indices and lengths.
+    """
+    bits = np.left_shift(np.uint64(1), items.astype(np.uint64))
+    masks = np.bitwise_or.reduceat(bits, np.minimum(starts, len(bits) - 1))
+    masks[lengths == 0] = 0
+    return masks
+
+
+def solve(data, design):
+    """Compute the answer from the memories for a design's options.
+
+    Every rucksack (or compartment) becomes a 64-bit mask of the
+    priorities it contains. Intersecting the masks for a team leaves
+    the common item, whose priority is the index of the remaining bit.
+    For a fused (`--both`) design, return the answers to both parts.
+    """
+    rucksacks = data["rucksacks"]["data"][0]
+    lengths = np.asarray(data["lengths"]["data"][:rucksacks],
+                         dtype=np.int64)
+    items = np.asarray(data["contents"]["data"][:lengths.sum()],
+                       dtype=np.int64)
+
+    if design.both:
+        return [score(items, lengths, 1),
+                score(items, lengths, design.rucksacks_per_team)]
+    return score(items, lengths, design.rucksacks_per_team)
+
+
+def score(items, lengths, rucksacks_per_team):
+    if not len(items):
+        return 0
+
+    # For part 1, each "team" is the two halves of one rucksack, which
+    # split at `length // 2` like the accelerator's compartments.
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    if rucksacks_per_team == 1:
+        team_size = 2
+        halves = lengths // 2
+        starts = np.stack([starts, starts + halves], axis=1).reshape(-1)
+        lengths = np.repeat(halves, 2)
+    else:
+        team_size = rucksacks_per_team
+
+    masks = segment_masks(items, starts, lengths)
+    masks = masks[:len(masks) - len(masks) % team_size]
+    common = np.bitwise_and.reduce(masks.reshape(-1, team_size), axis=1)
+
+    # Take the lowest set bit of each intersection.
+    common = common & (~common + np.uint64(1))
+    found = common != 0
+    return int(np.log2(common[found]).astype(np.int64).sum())
+
+
+def args_parser():
+    """Get a parser for the generator options that change the answer.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("rucksacks_per_team", type=int)
+    parser.add_argument("--both", action="store_true")
+    return parser
+
+
+if __name__ == "__main__":
+    design, _ = args_parser().parse_known_args()
+    print(solve(convert.convert(sys.stdin), design))
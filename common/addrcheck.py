@@ -0,0 +1,135 @@
+"""Check that the addresses in generated designs fit their memories.
+
+Every `seq_mem_d1` takes the width of its address as a parameter, but
+the registers, adders, and ports that drive those addresses get their
+widths somewhere else in the generator. The Calyx compiler rejects a
+mismatch, but only once something lowers the design. So this reads the
+generated Calyx program for each design in a list and reports every
+`addr0` assignment whose source is wider or narrower than the memory's
+address:
+
+    $ python3 ../common/addrcheck.py --args "3" --args "3 --batch 8"
+    {"args": "3", "mismatches": []}
+    {"args": "3 --batch 8", "mismatches": []}
+
+The programs come from the build cache (see `cache.py`), so this only
+needs the Calyx builder, not the rest of the toolchain.
+"""
+import argparse
+import json
+import re
+import shlex
+import sys
+
+import cache
+
+COMPONENT = re.compile(r"component\s+(\w+)\s*\((.*?)\)\s*->\s*\((.*?)\)",
+                       re.S)
+PORT = re.compile(r"(\w+)\s*:\s*(\d+)")
+CELL = re.compile(
+    r"^\s*(?:@\w+(?:\(\d+\))?\s+)*(?:ref\s+)?(\w+)\s*=\s*(\w+)\(([^)]*)\);",
+    re.M,
+)
+ADDRESS = re.compile(r"^\s*(\w+)\.addr0\s*=\s*(?:[^;?]*\?\s*)?([\w.']+);",
+                     re.M)
+CONSTANT = re.compile(r"(\d+)'[bdh]\w+")
+
+MEMORIES = ("seq_mem_d1", "comb_mem_d1")
+COMPARISONS = ("lt", "gt", "eq", "neq", "le", "ge")
+
+
+def components(text):
+    """Split a Calyx program into its components.
+
+    Yield the name, the port widths, and the text of each one.
+    """
+    starts = list(COMPONENT.finditer(text))
+    for match, end in zip(starts, [m.start() for m in starts[1:]] + [None]):
+        ports = {
+            name: int(width)
+            for sig in match.group(2, 3)
+            for name, width in PORT.findall(sig)
+        }
+        yield match.group(1), ports, text[match.end():end]
+
+
+def port_width(cell, port, signatures):
+    """Get the width of a cell's port, or None if we can't tell.
+
+    `cell` is the cell's primitive (or component) name and its
+    parameters, and `signatures` has the port widths of the program's
+    own components.
+    """
+    prim, params = cell
+    if prim in signatures:
+        return signatures[prim].get(port)
+    if port.endswith("done"):
+        return 1
+    if port != "out" or not params:
+        return None
+    op = prim[len("std_"):] if prim.startswith("std_") else prim
+    if op in COMPARISONS or op.startswith("s") and op[1:] in COMPARISONS:
+        return 1
+    if op in ("slice", "pad"):
+        return params[1]
+    if op == "cat":
+        return params[2]
+    return params[0]
+
+
+def check(text):
+    """Find the mismatched addresses in a Calyx program.
+
+    Return a description of each one.
+    """
+    comps = list(components(text))
+    signatures = {name: ports for name, ports, _ in comps}
+    mismatches = []
+    for comp, ports, body in comps:
+        cells = {
+            name: (prim, [int(p) for p in params.split(",") if p.strip()])
+            for name, prim, params in CELL.findall(body)
+        }
+        for mem, src in ADDRESS.findall(body):
+            prim, params = cells.get(mem, (None, []))
+            if prim not in MEMORIES:
+                continue
+            constant = CONSTANT.fullmatch(src)
+            if constant:
+                width = int(constant.group(1))
+            elif "." in src:
+                cell, port = src.split(".", 1)
+                width = port_width(cells[cell], port, signatures) \
+                    if cell in cells else None
+            else:
+                width = ports.get(src)
+            if width is not None and width != params[2]:
+                mismatches.append(
+                    f"{comp}: {mem}.addr0 is {params[2]} bits, "
+                    f"but {src} is {width}"
+                )
+    return sorted(set(mismatches))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--day", default=".",
+                        help="day directory containing accelgen.py")
+    parser.add_argument("--args", action="append", type=shlex.split,
+                        dest="variants", default=[],
+                        help="arguments for accelgen.py (repeatable)")
+    opts = parser.parse_args()
+
+    ok = True
+    for args in opts.variants or [[]]:
+        with open(cache.futil(opts.day, args)) as f:
+            mismatches = check(f.read())
+        ok &= not mismatches
+        print(json.dumps({"args": shlex.join(args),
+                          "mismatches": mismatches}, sort_keys=True),
+              flush=True)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
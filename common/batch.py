@@ -0,0 +1,270 @@
+"""Run one accelerator design on a batch of inputs.
+
+We compile the design once (via the build cache) and then run the same
+Verilator executable on the inputs. Results stream out as JSON lines,
+one per input, in the order the inputs were given:
+
+    $ python3 ../common/batch.py --args 3 inputs/*.txt
+    {"answer": 45000, "cycles": 1234, "input": "inputs/a.txt", ...}
+
+Inputs can be puzzle text files (which we convert with the day's
+`convert.py`), JSON data files, or `.dat` directories.
+
+An ordinary design solves one input per run, so every input still pays
+to start the simulator and load its memories. A design generated with
+`--batch B` solves up to B text inputs in each run instead (see
+`common/multi.py`), so we group the inputs and report the shared cycle
+count for each one, along with the number of inputs (`batch`) that
+shared it. Pass `--batch B` here (rather than in `--args`) to get that
+design for the given generator arguments:
+
+    $ python3 ../common/batch.py --args 3 --batch 8 inputs/*.txt
+"""
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import shlex
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cache
+import memfmt
+
+
+def load_module(day_dir, name):
+    """Import one of a day's Python modules (e.g., `convert`).
+
+    The module can import its siblings, just like when it runs as a
+    script from the day's directory.
+    """
+    path = Path(day_dir).resolve() / f"{name}.py"
+    spec = importlib.util.spec_from_file_location(
+        f"day{path.parent.name}_{name}", path,
+    )
+    mod = importlib.util.module_from_spec(spec)
+    sys.path.insert(0, str(path.parent))
+    try:
+        spec.loader.exec_module(mod)
+    finally:
+        sys.path.remove(str(path.parent))
+    return mod
+
+
+def load_options(day_dir, args):
+    """Parse a design's generator arguments.
+    """
+    return load_module(day_dir, "accelgen").args_parser().parse_args(args)
+
+
+def convert_options(converter, design):
+    """Get the keyword arguments for a day's `convert` that lay out the
+    memories the way a design expects.
+
+    Every converter takes `both`. Converters that take more options
+    list them in `OPTIONS`.
+    """
+    names = getattr(converter, "OPTIONS", ("both",))
+    return {name: getattr(design, name) for name in names}
+
+
+def check_overflow(memories):
+    """Make sure a run didn't set its design's `overflow` flag, if it
+    has one.
+
+    A design with bounded on-chip storage for something that depends on
+    the input (like day 3's `--filter cam`) sets the flag when the input
+    doesn't fit, and then its answer is meaningless.
+    """
+    assert not any(memories.get("overflow", ())), \
+        "the design overflowed; give it more capacity"
+
+
+def answer(memories):
+    """Get the answer from a run's memories.
+
+    A fused (`--both`) design produces a list of both parts' answers.
+    """
+    check_overflow(memories)
+    values = memories["answer"]
+    return values if len(values) > 1 else values[0]
+
+
+def answers(memories, size):
+    """Split the answers from a run of a `--batch` design by input.
+
+    Each input has the same number of consecutive `answer` entries.
+    """
+    check_overflow(memories)
+    values = memories["answer"]
+    parts = len(values) // size
+    return [answer({"answer": values[i * parts:(i + 1) * parts]})
+            for i in range(size)]
+
+
+def prepare(converter, input_path, data_dir, options=None):
+    """Get the memory images for one input into `data_dir`.
+
+    `options` are keyword arguments for the converter (see
+    `convert_options`). Return the names of the memories.
+    """
+    if os.path.isdir(input_path):
+        return memfmt.link_dat(input_path, data_dir)
+
+    if input_path.endswith(".json"):
+        with open(input_path) as f:
+            data = json.load(f)
+    else:
+        with open(input_path) as f:
+            data = converter.convert(f, **(options or {}))
+    memfmt.write_dat(data, data_dir)
+    return list(data)
+
+
+def simulate(exe, prepare_data):
+    """Simulate one run in a scratch directory.
+
+    `prepare_data(data_dir)` puts the memory images in place and returns
+    their names. Return the cycle count, the wall-clock simulation time,
+    and the final contents of the memories.
+    """
+    with tempfile.TemporaryDirectory() as data_dir:
+        names = prepare_data(data_dir)
+        start = time.perf_counter()
+        cycles = cache.simulate(exe, data_dir)
+        elapsed = time.perf_counter() - start
+        memories = memfmt.read_out(data_dir, names)
+    return cycles, elapsed, memories
+
+
+def simulate_data(exe, data):
+    """Simulate one run on an in-memory data dictionary.
+    """
+    def prepare_data(data_dir):
+        memfmt.write_dat(data, data_dir)
+        return list(data)
+    return simulate(exe, prepare_data)
+
+
+def run_one(exe, converter, input_path, options=None):
+    """Simulate a single input and summarize the result.
+
+    A `--batch` design gets a batch with just this input.
+    """
+    cycles, elapsed, memories = simulate(
+        exe,
+        lambda data_dir: prepare(converter, input_path, data_dir, options),
+    )
+    batch = (options or {}).get("batch")
+    return {
+        "input": input_path,
+        "answer": answers(memories, batch)[0] if batch else answer(memories),
+        "cycles": cycles,
+        "seconds": elapsed,
+    }
+
+
+def run_group(exe, converter, input_paths, options):
+    """Simulate a group of text inputs in one run of a `--batch` design.
+
+    Return a result for each input, which all share the run's cycles and
+    time.
+    """
+    options = dict(options)
+    size = options.pop("batch")
+
+    def prepare_data(data_dir):
+        with contextlib.ExitStack() as stack:
+            infiles = [stack.enter_context(open(p)) for p in input_paths]
+            data = converter.convert_batch(infiles, size, **options)
+        memfmt.write_dat(data, data_dir)
+        return list(data)
+
+    cycles, elapsed, memories = simulate(exe, prepare_data)
+    return [
+        {
+            "input": input_path,
+            "answer": value,
+            "batch": len(input_paths),
+            "cycles": cycles,
+            "seconds": elapsed,
+        }
+        for input_path, value in zip(input_paths, answers(memories, size))
+    ]
+
+
+def run_batch(day_dir, args, inputs, jobs=1):
+    """Generate results for every input, compiling the design only once.
+    """
+    exe = cache.model(day_dir, args)
+    converter = load_module(day_dir, "convert")
+    options = convert_options(converter, load_options(day_dir, args))
+    size = options.get("batch")
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        if size:
+            groups = [inputs[i:i + size] for i in range(0, len(inputs), size)]
+            for results in pool.map(
+                lambda g: run_group(exe, converter, g, options), groups,
+            ):
+                yield from results
+        else:
+            yield from pool.map(lambda p: run_one(exe, converter, p, options),
+                                inputs)
+
+
+def savings(day_dir, args, flag, inputs, label):
+    """Compare a design's cycle counts with and without an extra
+    generator flag (e.g., `--parallelize`) on every input.
+
+    The result for each input has the baseline `cycles`, the flagged
+    design's `<label>_cycles`, and whether the two agree on the answer.
+    """
+    converter = load_module(day_dir, "convert")
+    base_options = convert_options(converter, load_options(day_dir, args))
+    options = convert_options(converter,
+                              load_options(day_dir, args + [flag]))
+    base_exe = cache.model(day_dir, args)
+    exe = cache.model(day_dir, args + [flag])
+
+    for input_path in inputs:
+        base = run_one(base_exe, converter, input_path, base_options)
+        result = run_one(exe, converter, input_path, options)
+        yield {
+            "input": input_path,
+            "answer": result["answer"],
+            "match": result["answer"] == base["answer"],
+            "cycles": base["cycles"],
+            f"{label}_cycles": result["cycles"],
+            "saved": base["cycles"] - result["cycles"],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--day", default=".",
+                        help="day directory containing accelgen.py")
+    parser.add_argument("--args", default="", type=shlex.split,
+                        help="arguments for accelgen.py")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of simulations to run at once")
+    parser.add_argument("-b", "--batch", type=int,
+                        help="solve this many text inputs per run")
+    parser.add_argument("inputs", nargs="+")
+    opts = parser.parse_args()
+
+    args = opts.args
+    if opts.batch:
+        if any(p.endswith(".json") or os.path.isdir(p)
+               for p in opts.inputs):
+            parser.error("only text inputs can share a run")
+        args = args + ["--batch", str(opts.batch)]
+    for result in run_batch(opts.day, args, opts.inputs, opts.jobs):
+        print(json.dumps(result, sort_keys=True), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Vectorized decoding for the converters' puzzle input text.
+
+Instead of parsing the input line by line in Python, the converters get
+all of its bytes at once (mapped into memory when the input is a real
+file) as a NumPy array and decode them with array operations.
+"""
+import io
+import mmap
+
+import numpy as np
+
+NEWLINE = ord("\n")
+WHITESPACE = np.frombuffer(b" \t\r\n", dtype=np.uint8)
+ZERO = ord("0")
+
+
+def read(infile):
+    """Get the bytes of an input as a NumPy array.
+
+    `infile` can be a file object (including stdin) or, for pieces of
+    an input that are already in memory, any iterable of text lines.
+    """
+    try:
+        m = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        return np.frombuffer(m, dtype=np.uint8)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        # Not a file, or a file we can't map (e.g., a pipe or an empty
+        # file), so read it in bulk instead.
+        pass
+
+    if hasattr(infile, "buffer"):
+        return np.frombuffer(infile.buffer.read(), dtype=np.uint8)
+    return np.frombuffer("".join(infile).encode(), dtype=np.uint8)
+
+
+def lines(buf):
+    """Find the lines in a byte array.
+
+    Return arrays of start and end offsets for every line, excluding
+    the line terminators (`\\n` or `\\r\\n`) and any whitespace at
+    either end of the line, like `str.strip` would.
+    """
+    breaks = np.flatnonzero(buf == NEWLINE)
+    starts = np.concatenate(([0], breaks + 1))
+    ends = np.concatenate((breaks, [len(buf)]))
+
+    # A final newline doesn't start another line.
+    if starts[-1] == len(buf):
+        starts, ends = starts[:-1], ends[:-1]
+
+    # Move each end back past the whitespace before it and each start
+    # forward past the whitespace after it. The sentinels at either end
+    # of `content` stand in for a line with nothing but whitespace.
+    content = np.concatenate((
+        [-1], np.flatnonzero(~np.isin(buf, WHITESPACE)), [len(buf)],
+    ))
+    ends = np.maximum(
+        content[np.searchsorted(content, ends) - 1] + 1, starts,
+    )
+    starts = np.minimum(content[np.searchsorted(content, starts)], ends)
+    return starts, ends
+
+
+def integers(buf, starts, ends):
+    """Decode the nonempty decimal numbers in the given spans of bytes.
+    """
+    lengths = ends - starts
+    assert (lengths > 0).all(), "empty numbers"
+    firsts = np.cumsum(lengths) - lengths
+
+    # Each digit's offset from the start of its number, and its value.
+    offsets = np.arange(lengths.sum()) - np.repeat(firsts, lengths)
+    digits = buf[np.repeat(starts, lengths) + offsets].astype(np.int64) - ZERO
+    assert ((digits >= 0) & (digits <= 9)).all(), "invalid digits"
+
+    places = np.repeat(lengths, lengths) - offsets - 1
+    return np.add.reduceat(digits * 10 ** places, firsts)
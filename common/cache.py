@@ -0,0 +1,288 @@
+"""A content-addressed build cache for generated accelerators.
+
+Generating Calyx, lowering it to Verilog, and compiling a Verilator
+model are all pure functions of the generator's source code, its
+command-line arguments, and the version of the toolchain. So we hash
+those three things together and keep every artifact for a design in a
+directory named after the hash. Rerunning a design on a new input can
+then skip straight to simulation.
+
+Run this from one of the day directories. For example:
+
+    $ python3 ../common/cache.py futil -o part1.futil 1
+    $ python3 ../common/cache.py model 3
+    $ python3 ../common/cache.py run sample.json 3
+    $ python3 ../common/cache.py run sample.dat 3
+
+The arguments after the subcommand's own options are passed straight
+through to `accelgen.py`. Set `AOC_CACHE` to put the cache somewhere
+other than `~/.cache/aoc2022-calyx`.
+"""
+import argparse
+import ast
+import functools
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import memfmt
+
+COMMON_DIR = Path(__file__).resolve().parent
+CACHE_DIR = Path(os.environ.get(
+    "AOC_CACHE",
+    Path.home() / ".cache" / "aoc2022-calyx",
+))
+
+# Verilator simulation settings, matching `fud`'s defaults.
+TOP_MODULE = "main"
+CYCLE_LIMIT = 500_000_000
+
+
+def _output(cmd):
+    """Run a command and return its stripped stdout, or "" on failure.
+    """
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+    except FileNotFoundError:
+        return ""
+    return proc.stdout.strip() if proc.returncode == 0 else ""
+
+
+@functools.lru_cache(maxsize=None)
+def calyx_root():
+    return _output(["fud", "config", "global.root"])
+
+
+@functools.lru_cache(maxsize=None)
+def toolchain_version():
+    """Identify the installed Calyx compiler and Verilator.
+
+    We use the Git revision of the Calyx checkout that `fud` points to
+    (which covers both the compiler and the Python builder library) and
+    the version banner printed by Verilator.
+    """
+    root = calyx_root()
+    return "\n".join([
+        _output(["git", "-C", root, "rev-parse", "HEAD"]) if root else "",
+        _output(["verilator", "--version"]),
+    ])
+
+
+def local_imports(path, search):
+    """Find the source files a Python module imports from the `search`
+    directories, transitively, including the module itself.
+
+    Imports from anywhere else (the standard library, NumPy, or the
+    Calyx builder) are left out: the toolchain version covers the
+    builder. So are imports inside functions, like the ones that load
+    the simulation drivers for the command-line interfaces of modules
+    that the generators use.
+    """
+    found = {}
+    todo = [Path(path).resolve()]
+    while todo:
+        path = todo.pop()
+        if path in found:
+            continue
+        found[path] = source = path.read_bytes()
+        for node in ast.parse(source).body:
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and not node.level:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                for src_dir in search:
+                    dep = src_dir / f"{name.split('.')[0]}.py"
+                    if dep.exists():
+                        todo.append(dep.resolve())
+                        break
+    return found
+
+
+def design_key(day_dir, args):
+    """Compute the cache key for the design built by `accelgen.py args`.
+
+    We hash the generator and the modules it imports from the day's
+    directory and from `common/`, so editing a host-side script (like a
+    converter or a driver) doesn't invalidate any artifacts. Simulation
+    results aren't cached, so the converter never needs to be part of
+    the key.
+    """
+    day_dir = Path(day_dir).resolve()
+    sources = local_imports(day_dir / "accelgen.py", (day_dir, COMMON_DIR))
+    h = hashlib.sha256()
+    for path in sorted(sources):
+        h.update(f"{path.parent.name}/{path.name}".encode())
+        h.update(sources[path])
+    h.update(json.dumps(list(args)).encode())
+    h.update(toolchain_version().encode())
+    return h.hexdigest()
+
+
+def entry_dir(day_dir, args):
+    """Get (and create) the cache directory for a design.
+    """
+    path = CACHE_DIR / design_key(day_dir, args)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _produce(path, build):
+    """Create the file at `path` with `build(tmp_path)` unless it exists.
+
+    We build into a temporary file and rename it into place so that
+    concurrent runs (e.g., `turnt -j`) never observe a partial artifact.
+    """
+    if not path.exists():
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name)
+        os.close(fd)
+        try:
+            build(Path(tmp))
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+    return path
+
+
+def futil(day_dir, args):
+    """Get the path to the generated Calyx program for a design.
+    """
+    day_dir = Path(day_dir)
+
+    def build(tmp):
+        with open(tmp, "w") as f:
+            subprocess.run(
+                [sys.executable, "accelgen.py", *args],
+                cwd=day_dir, stdout=f, check=True,
+            )
+
+    return _produce(entry_dir(day_dir, args) / "main.futil", build)
+
+
+def verilog(day_dir, args):
+    """Get the path to the Verilog lowering of a design.
+    """
+    src = futil(day_dir, args)
+
+    def build(tmp):
+        subprocess.run(
+            ["fud", "e", str(src), "--to", "verilog", "-o", str(tmp)],
+            check=True,
+        )
+
+    return _produce(src.parent / "main.sv", build)
+
+
+def model(day_dir, args):
+    """Get the path to a compiled Verilator simulator for a design.
+
+    This uses the same testbench as `fud`'s Verilator stage, so the
+    resulting executable loads and dumps the interface memories as
+    `.dat` files in the directory given by its `+DATA=` argument.
+    """
+    src = verilog(day_dir, args)
+    testbench = Path(calyx_root()) / "fud" / "sim" / "testbench.cpp"
+
+    def build(tmp):
+        with tempfile.TemporaryDirectory(dir=src.parent) as mdir:
+            subprocess.run(
+                [
+                    "verilator", "-cc", "--trace", str(src),
+                    "--exe", str(testbench), "--build",
+                    "--top-module", TOP_MODULE, "--Mdir", mdir,
+                ],
+                stdout=subprocess.DEVNULL, check=True,
+            )
+            shutil.copy(Path(mdir) / f"V{TOP_MODULE}", tmp)
+
+    exe = _produce(src.parent / f"V{TOP_MODULE}", build)
+    exe.chmod(0o755)
+    return exe
+
+
+def simulate(exe, data_dir):
+    """Run a compiled model on the `.dat` images in `data_dir`.
+
+    Return the number of simulated cycles.
+    """
+    proc = subprocess.run(
+        [str(exe), "/dev/null", str(CYCLE_LIMIT), f"+DATA={data_dir}"],
+        capture_output=True, text=True, check=True,
+    )
+    match = re.search(r"(\d+) cycles", proc.stdout)
+    return int(match.group(1)) if match else None
+
+
+def run(day_dir, args, data_path):
+    """Simulate a design on some memory data.
+
+    The data can be either a JSON file or a directory of `.dat` images
+    (see `memfmt`). Produce the same structure as `fud e --to dat`.
+    """
+    exe = model(day_dir, args)
+    with tempfile.TemporaryDirectory() as data_dir:
+        if os.path.isdir(data_path):
+            names = memfmt.link_dat(data_path, data_dir)
+        else:
+            with open(data_path) as f:
+                data = json.load(f)
+            memfmt.write_dat(data, data_dir)
+            names = list(data)
+        cycles = simulate(exe, data_dir)
+        memories = memfmt.read_out(data_dir, names)
+    return {"cycles": cycles, "memories": memories}
+
+
+def _copy_if_changed(src, dest):
+    """Copy a file unless the destination is already identical.
+
+    Leaving an up-to-date file alone keeps its modification time, so
+    `make` doesn't consider anything downstream stale.
+    """
+    dest = Path(dest)
+    if dest.exists() and dest.read_bytes() == src.read_bytes():
+        return
+    shutil.copy(src, dest)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--day", default=".",
+                        help="day directory containing accelgen.py")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    for name in ("futil", "verilog", "model"):
+        p = sub.add_parser(name, help=f"print the path to the {name}")
+        p.add_argument("-o", "--output",
+                       help="copy the artifact here instead")
+        p.add_argument("args", nargs=argparse.REMAINDER)
+
+    p = sub.add_parser("run",
+                       help="simulate on a JSON file or .dat directory")
+    p.add_argument("data")
+    p.add_argument("args", nargs=argparse.REMAINDER)
+
+    opts = parser.parse_args()
+    if opts.cmd == "run":
+        json.dump(run(opts.day, opts.args, opts.data), sys.stdout,
+                  indent=2, sort_keys=True)
+        print()
+    else:
+        artifact = globals()[opts.cmd](opts.day, opts.args)
+        if opts.output:
+            _copy_if_changed(artifact, opts.output)
+        else:
+            print(artifact)
+
+
+if __name__ == "__main__":
+    main()
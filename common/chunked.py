@@ -0,0 +1,95 @@
+"""Solve inputs of any size by feeding them through a design in chunks.
+
+The accelerators' interface memories have a fixed capacity. A design
+generated with `--resumable` loads its running state from `state_*`
+memories at the start and saves it at the end, so we can run the same
+compiled design on one memory-sized chunk after another, handing the
+saved state from each run to the next:
+
+    $ python3 ../common/chunked.py --args "3 --resumable" full.txt
+    {"answer": 45000, "chunks": 7, "cycles": 123456, "input": "full.txt"}
+
+Each day's `convert.py` knows how to split its input into chunks (see
+its `chunks` function).
+"""
+import argparse
+import json
+import shlex
+
+import batch
+import cache
+
+
+def load_design(day_dir, args):
+    """Get a day's converter module and its generator's parsed options.
+    """
+    converter = batch.load_module(day_dir, "convert")
+    design = batch.load_options(day_dir, args)
+    assert getattr(design, "resumable", False), \
+        "chunked execution needs a --resumable design"
+    return converter, design
+
+
+def run_chunks(exe, converter, design, infile, size=None):
+    """Run every chunk of an input through a compiled design.
+
+    Return the memories from the final run (including the final state),
+    the total number of cycles, and the number of chunks.
+    """
+    state = {}
+    memories = {}
+    total_cycles = 0
+    count = 0
+    kwargs = {"size": size} if size else {}
+    for data in converter.chunks(infile, design, **kwargs):
+        # Hand over the state saved by the previous chunk.
+        for name, values in state.items():
+            data[name]["data"] = values
+
+        cycles, _, memories = batch.simulate_data(exe, data)
+        batch.check_overflow(memories)
+        state = {
+            name: memories[name] for name in data
+            if name.startswith("state_")
+        }
+        total_cycles += cycles
+        count += 1
+
+    return memories, total_cycles, count
+
+
+def run_chunked(day_dir, args, input_path, size=None):
+    """Solve one input, chunk by chunk, and summarize the result.
+    """
+    exe = cache.model(day_dir, args)
+    converter, design = load_design(day_dir, args)
+    with open(input_path) as f:
+        memories, cycles, count = run_chunks(exe, converter, design, f,
+                                             size)
+
+    return {
+        "input": input_path,
+        "answer": memories["answer"][0] if memories else 0,
+        "chunks": count,
+        "cycles": cycles,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--day", default=".",
+                        help="day directory containing accelgen.py")
+    parser.add_argument("--args", default="", type=shlex.split,
+                        help="arguments for accelgen.py")
+    parser.add_argument("--size", type=int,
+                        help="chunk size (default: the memory capacity)")
+    parser.add_argument("inputs", nargs="+")
+    opts = parser.parse_args()
+
+    for input_path in opts.inputs:
+        result = run_chunked(opts.day, opts.args, input_path, opts.size)
+        print(json.dumps(result, sort_keys=True), flush=True)
+
+
+if __name__ == "__main__":
+    main()
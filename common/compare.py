@@ -0,0 +1,96 @@
+"""Check accelerator answers against a host reference and compare speed.
+
+Each day has a vectorized NumPy solution in `reference.py` that works on
+the same memories `convert.py` produces. For every input and every
+design variant (a set of generator arguments), this runs both the
+reference and a simulation, checks that the answers agree, and reports
+how many input elements per second each one gets through:
+
+    $ python3 ../common/compare.py --args 1 --args "1 --stream" full.txt
+    {"args": "1", "match": true, "ref_rate": 1.2e8, "sim_rate": 3.4e4, ...}
+
+Variants simulate with the cached Verilator model, except for `--stream`
+designs, which use the Icarus harness in `stream.py`. The exit status is
+nonzero if any answer disagrees with the reference.
+"""
+import argparse
+import json
+import shlex
+import sys
+import timeit
+
+import batch
+import cache
+import stream
+
+
+def reference_rate(reference, data, design):
+    """Get the reference answer and its throughput in elements/second.
+
+    Small inputs take microseconds, so we time enough repetitions to
+    get a stable measurement.
+    """
+    timer = timeit.Timer(lambda: reference.solve(data, design))
+    number, seconds = timer.autorange()
+    return reference.solve(data, design), \
+        reference.elements(data) * number / seconds
+
+
+def compare(day_dir, variants, inputs):
+    """Generate a comparison for every input and every design variant.
+    """
+    converter = batch.load_module(day_dir, "convert")
+    reference = batch.load_module(day_dir, "reference")
+
+    for args in variants:
+        design = batch.load_options(day_dir, args)
+        options = batch.convert_options(converter, design)
+        if design.stream:
+            simulator = "icarus"
+            run = lambda path: stream.run_stream(day_dir, args, path)
+        else:
+            simulator = "verilator"
+            exe = cache.model(day_dir, args)
+            run = lambda path: batch.run_one(exe, converter, path, options)
+
+        for input_path in inputs:
+            with open(input_path) as f:
+                data = converter.convert(f, **options)
+            expected, ref_rate = reference_rate(reference, data, design)
+            result = run(input_path)
+            sim_rate = reference.elements(data) / result["seconds"]
+
+            yield {
+                "input": input_path,
+                "args": shlex.join(args),
+                "simulator": simulator,
+                "answer": result["answer"],
+                "expected": expected,
+                "match": result["answer"] == expected,
+                "elements": reference.elements(data),
+                "cycles": result["cycles"],
+                "sim_rate": sim_rate,
+                "ref_rate": ref_rate,
+                "slowdown": ref_rate / sim_rate,
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--day", default=".",
+                        help="day directory containing accelgen.py")
+    parser.add_argument("--args", action="append", type=shlex.split,
+                        dest="variants", default=[],
+                        help="arguments for accelgen.py (repeatable)")
+    parser.add_argument("inputs", nargs="+")
+    opts = parser.parse_args()
+
+    ok = True
+    for result in compare(opts.day, opts.variants or [[]], opts.inputs):
+        ok &= result["match"]
+        print(json.dumps(result, sort_keys=True), flush=True)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
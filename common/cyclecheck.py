@@ -0,0 +1,84 @@
+"""Check a design's cycle count against a saved baseline.
+
+This is meant to run as a Turnt environment, where the expected output
+is the cycle count saved next to the input (e.g., `sample.part1-cycles`
+next to `sample.part1`). Because Turnt compares outputs exactly, we
+print the *saved* count whenever the new count is within the tolerance,
+so small changes and improvements still pass. A regression past the
+tolerance prints the new count, and the test fails with a diff.
+
+To record a new baseline (for a new input or an intentional
+improvement), run with `--bless` (or `BLESS=1` via the Makefile) and let
+Turnt save the output:
+
+    $ BLESS=1 turnt --save -e part1-cycles sample.txt
+"""
+import argparse
+import shlex
+import sys
+
+import batch
+import cache
+
+
+def read_expected(path):
+    try:
+        with open(path) as f:
+            return int(f.read().strip())
+    except FileNotFoundError:
+        return None
+
+
+def check(cycles, expected, tolerance):
+    """Decide which cycle count to report.
+
+    Return the count to print and a message for the log, if any.
+    """
+    if expected is None:
+        return cycles, "no saved cycle count; bless to record one"
+
+    limit = expected * (1 + tolerance)
+    if cycles > limit:
+        return cycles, f"regression: {cycles} cycles > {expected} " \
+            f"(+{tolerance:.0%} allowed)"
+    if cycles < expected:
+        return expected, f"improvement: {cycles} cycles < {expected}; " \
+            "bless to record it"
+    return expected, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--day", default=".",
+                        help="day directory containing accelgen.py")
+    parser.add_argument("--args", default="", type=shlex.split,
+                        help="arguments for accelgen.py")
+    parser.add_argument("--expected", required=True,
+                        help="file with the saved cycle count")
+    parser.add_argument("--tolerance", type=float, default=0.05,
+                        help="allowed fractional increase "
+                        "(default: %(default)s)")
+    parser.add_argument("--bless", action="store_true",
+                        help="report the new count, to save it")
+    parser.add_argument("input")
+    opts = parser.parse_args()
+
+    converter = batch.load_module(opts.day, "convert")
+    options = batch.convert_options(
+        converter, batch.load_options(opts.day, opts.args),
+    )
+    exe = cache.model(opts.day, opts.args)
+    cycles = batch.run_one(exe, converter, opts.input, options)["cycles"]
+
+    if opts.bless:
+        print(cycles)
+        return
+    report, message = check(cycles, read_expected(opts.expected),
+                            opts.tolerance)
+    if message:
+        print(message, file=sys.stderr)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""Map/reduce kernels for the accelerator generators.
+
+Every day's accelerator has the same skeleton: it loads an element count
+from an interface memory into a register, loops over the elements of
+its input memories, *maps* each element to a value, and *reduces* the
+values into an accumulator register. A `finish` group publishes the
+accumulator to the `answer` memory, and `--resumable` designs load it
+from and save it to a `state_*` memory. This module generates those
+pieces, so the days only supply their maps and any improvement to the
+kernel applies to all of them.
+
+`build_map_reduce` has three knobs for trading area for speed:
+
+* `unroll`: Each iteration handles this many elements, or *lanes*, so
+  the map can run on all of them at once. The last iteration may have
+  fewer elements than lanes, and `reduce` ignores the lanes without one.
+* `banks`: The input memories are split into this many banks, with
+  element i at address i // banks of bank i % banks (see
+  `memfmt.split_banks`). Each iteration prefetches its elements in
+  unroll / banks rounds of one read from every bank.
+* `shape`: The shape of the adder trees that sum the lanes' values:
+  a `"chain"` that adds them one after another or a `"balanced"` tree
+  with logarithmic depth. `build_tree` builds other reductions (like
+  the top-K's in day 1) in the same shapes.
+"""
+from calyx.builder import const
+from calyx import py_ast as ast
+
+from loops import build_for
+from widths import fit
+
+SHAPES = ("balanced", "chain")
+
+
+def build_mem(comp, name, width, size, idx_width=None, is_external=True,
+              is_ref=False):
+    """Add a `seq_mem_d1` memory to a component.
+
+    By default, the addresses are `size.bit_length()` bits wide, which
+    leaves room for a counter that doubles as the address to reach
+    `size`.
+    """
+    comp.prog.import_("primitives/memories.futil")
+    inst = ast.CompInst("seq_mem_d1",
+                        [width, size, idx_width or size.bit_length()])
+    return comp.cell(name, inst, is_external=is_external, is_ref=is_ref)
+
+
+def build_count(comp, name, width, mem=None, port=None, src_width=None):
+    """Add a register for an element count and a group that loads it.
+
+    The count comes from the first entry of `mem` or, for an input in a
+    batch, from `port`. It is `src_width` bits wide there (by default,
+    `width`) and gets resized to the `width`-bit register. Return the
+    register, `{name}_reg`, and the group, `init_{name}`.
+    """
+    reg = comp.reg(f"{name}_reg", width)
+    src_width = src_width or width
+    with comp.group(f"init_{name}") as init:
+        if mem is None:
+            reg.write_en = 1
+            reg.in_ = fit(comp, f"{name}_fit", port, src_width, width)
+        else:
+            mem.addr0 = 0
+            mem.read_en = 1
+            reg.write_en = mem.read_done
+            reg.in_ = fit(comp, f"{name}_fit", mem.out, src_width, width)
+        init.done = reg.done
+    return reg, init
+
+
+class Accumulator:
+    """A register that holds a running total.
+
+    `reg` is the `width`-bit register itself. The methods generate the
+    logic around it that all the days need.
+    """
+    def __init__(self, comp, name, width):
+        self.comp = comp
+        self.name = name
+        self.width = width
+        self.reg = comp.reg(name, width)
+        self.adder = comp.add(f"{name}_add", width)
+        self.inputs = 0
+
+    @property
+    def out(self):
+        return self.reg.out
+
+    def add(self, value, value_width):
+        """Add a `value_width`-bit value to the total.
+
+        Call this in the group that does the update, and use the result
+        as the group's `done` signal.
+        """
+        value = fit(self.comp, f"{self.name}_in{self.inputs}", value,
+                    value_width, self.width)
+        self.inputs += 1
+        self.adder.left = self.reg.out
+        self.adder.right = value
+        self.reg.write_en = 1
+        self.reg.in_ = self.adder.out
+        return self.reg.done
+
+    def clear(self):
+        """Generate a group, `clear_{name}`, that zeroes the total.
+        """
+        with self.comp.group(f"clear_{self.name}") as clear:
+            self.reg.write_en = 1
+            self.reg.in_ = 0
+            clear.done = self.reg.done
+        return clear
+
+    def publish(self, name, mem, addr, mem_width):
+        """Generate a group that writes the total to entry `addr` of a
+        `mem_width`-bit memory.
+        """
+        with self.comp.group(name) as publish:
+            mem.write_en = 1
+            mem.addr0 = addr
+            mem.in_ = fit(self.comp, f"{name}_pad", self.reg.out,
+                          self.width, mem_width)
+            publish.done = mem.write_done
+        return publish
+
+    def state(self, mem, mem_width):
+        """Generate groups that load the total from and save it to the
+        first entry of a `mem_width`-bit memory, to carry it between
+        chunks. Return the two groups.
+        """
+        with self.comp.group(f"load_{self.name}") as load:
+            mem.addr0 = 0
+            mem.read_en = 1
+            self.reg.write_en = mem.read_done
+            self.reg.in_ = fit(self.comp, f"{self.name}_slice", mem.out,
+                               mem_width, self.width)
+            load.done = self.reg.done
+
+        with self.comp.group(f"save_{self.name}") as save:
+            mem.addr0 = 0
+            mem.write_en = 1
+            mem.in_ = fit(self.comp, f"{self.name}_state", self.reg.out,
+                          self.width, mem_width)
+            save.done = mem.write_done
+
+        return load, save
+
+
+def build_tree(values, combine, shape="balanced"):
+    """Reduce some values with a tree of binary operations.
+
+    `combine(i, left, right)` builds the `i`th operation, counting from
+    1, and returns its result. A `"chain"` combines the values in order,
+    so N values take N - 1 operations in a row, while a `"balanced"`
+    tree combines neighboring pairs level by level, so the longest path
+    only has about log2(N) of them.
+    """
+    assert shape in SHAPES, f"unknown shape {shape}"
+    values = list(values)
+    node = 1
+    if shape == "chain":
+        last = values[0]
+        for value in values[1:]:
+            last = combine(node, last, value)
+            node += 1
+        return last
+
+    while len(values) > 1:
+        level = []
+        for left, right in zip(values[::2], values[1::2]):
+            level.append(combine(node, left, right))
+            node += 1
+        if len(values) % 2:
+            level.append(values[-1])
+        values = level
+    return values[0]
+
+
+def summer(comp, name, width):
+    """Get a `combine` function for `build_tree` that adds `width`-bit
+    values with adders named `{name}{i}`.
+
+    Call it in the group (or continuous block) that uses the sum.
+    """
+    def combine(i, left, right):
+        add = comp.add(f"{name}{i}", width)
+        add.left = left
+        add.right = right
+        return add.out
+    return combine
+
+
+def build_reduce(comp, name, accum, values, width, valid=None,
+                 shape="balanced"):
+    """Generate a group, `name`, that adds some values to an
+    `Accumulator`.
+
+    `values` has a `width`-bit port for each lane. `valid`, if given,
+    is a function that drives and returns a port for each lane that
+    says whether to count its value (or `None` to always count it). A
+    single value goes straight into the accumulator; several are summed
+    by a tree of the given `shape`.
+
+    Everything the sum needs is driven from inside the group, so the
+    `--parallelize` pass can see that it reads the lanes' values.
+    """
+    with comp.group(name) as reduce:
+        if len(values) == 1:
+            reduce.done = accum.add(values[0], width)
+            return reduce
+
+        lanes = valid() if valid else [None] * len(values)
+        terms = []
+        for lane, (value, has) in enumerate(zip(values, lanes)):
+            value = fit(comp, f"{name}_fit{lane}", value, width,
+                        accum.width)
+            if has is not None:
+                gate = comp.cell(f"{name}_lane{lane}",
+                                 ast.Stdlib().op("wire", accum.width,
+                                                 signed=False))
+                gate.in_ = has @ value
+                gate.in_ = ~has @ 0
+                value = gate.out
+            terms.append(value)
+        total = build_tree(terms, summer(comp, f"{name}_sum", accum.width),
+                           shape)
+        reduce.done = accum.add(total, accum.width)
+    return reduce
+
+
+def lane_name(name, lane, lanes):
+    """Get the name for a lane's copy of a cell or group, out of `lanes`
+    lanes.
+    """
+    return name if lanes == 1 else f"{name}_{lane}"
+
+
+class MapReduce:
+    """The loop and lanes of a map/reduce kernel.
+
+    `lanes` has a dictionary for each lane that maps field names to the
+    registers that hold its current element while the body runs, and
+    `valid` is a function to call in a group that drives and returns a
+    port for each lane that says whether it has an element (or `None`
+    for lanes that always do). `loop` is the `ForLoop` over the
+    elements.
+    """
+    def __init__(self, comp, loop, lanes, valid, shape):
+        self.comp = comp
+        self.loop = loop
+        self.lanes = lanes
+        self.valid = valid
+        self.shape = shape
+
+    def reduce(self, name, accum, values, width):
+        """Generate a group, `name`, that adds every lane's `width`-bit
+        value to an `Accumulator` (see `build_reduce`).
+
+        Lanes without an element count as zero.
+        """
+        return build_reduce(self.comp, name, accum, values, width,
+                            self.valid, self.shape)
+
+    def control(self, body):
+        """Generate the loop over the elements with a body that handles
+        every lane at once.
+        """
+        return self.loop.control(body)
+
+
+def build_map_reduce(comp, name, count, count_width, fields, size,
+                     unroll=1, banks=1, shape="balanced",
+                     consecutive=False):
+    """Add a map/reduce kernel over elements in interface memories.
+
+    `count` is a port with the number of elements, which is
+    `count_width` bits wide (with room to add `unroll` to it).
+    `fields` is a list of `(field, width)` pairs for the memories to
+    walk, which have `size` entries each. They are named after the
+    fields, plus a bank number when there are several banks.
+
+    With `consecutive`, consecutive loops walk consecutive ranges of
+    the memories (see `build_for`), which only works one element at a
+    time.
+    """
+    assert unroll >= 1 and unroll & (unroll - 1) == 0, \
+        "the unroll factor must be a power of two"
+    assert 1 <= banks <= unroll and unroll % banks == 0, \
+        "the banks must evenly divide the lanes"
+    assert not (consecutive and unroll > 1), \
+        "only one element at a time can continue a range"
+    assert size % banks == 0
+
+    bank_size = size // banks
+    mems = {
+        field: [
+            build_mem(comp, field if banks == 1 else f"{field}{bank}",
+                      width, bank_size)
+            for bank in range(banks)
+        ]
+        for field, width in fields
+    }
+
+    # Lane j reads its fields from bank j % banks in round j // banks.
+    keys = []
+    loop_fields = []
+    for lane in range(unroll):
+        lane_keys = {}
+        for field, width in fields:
+            key = field if unroll == 1 else f"{field}{lane}"
+            lane_keys[field] = key
+            loop_fields.append((key, mems[field][lane % banks], width,
+                                lane // banks))
+        keys.append(lane_keys)
+
+    if unroll == 1:
+        bound = count
+    else:
+        # Round the number of iterations up.
+        shift = const(count_width, unroll.bit_length() - 1)
+        round_up = comp.add(f"{name}_round_up", count_width)
+        iters = comp.cell(f"{name}_iters",
+                          ast.Stdlib().op("rsh", count_width, signed=False))
+        with comp.continuous:
+            round_up.left = count
+            round_up.right = unroll - 1
+            iters.left = round_up.out
+            iters.right = shift
+        bound = iters.out
+
+    separate = consecutive or unroll > 1 or banks > 1
+    loop = build_for(comp, name, bound, count_width, loop_fields,
+                     bank_size.bit_length() if separate else None,
+                     unroll // banks)
+    lanes = [
+        {field: loop.regs[key] for field, key in lane_keys.items()}
+        for lane_keys in keys
+    ]
+
+    # While the body runs, the counter has already counted the current
+    # iteration, so there are `count - (counter - 1) * unroll` elements
+    # left for the lanes. Lane j has one if that's more than j. The
+    # reductions drive these in their groups.
+    if unroll == 1:
+        valid = None
+    else:
+        base = comp.cell(f"{name}_base",
+                         ast.Stdlib().op("lsh", count_width, signed=False))
+        end = comp.add(f"{name}_end", count_width)
+        left = comp.cell(f"{name}_left",
+                         ast.Stdlib().op("sub", count_width, signed=False))
+        has = [
+            comp.cell(f"{name}_valid{lane}",
+                      ast.Stdlib().op("gt", count_width, signed=False))
+            for lane in range(1, unroll)
+        ]
+
+        def valid():
+            base.left = loop.counter.out
+            base.right = shift
+            end.left = count
+            end.right = unroll
+            left.left = end.out
+            left.right = base.out
+            for lane, gt in enumerate(has, 1):
+                gt.left = left.out
+                gt.right = const(count_width, lane)
+            return [None] + [gt.out for gt in has]
+
+    return MapReduce(comp, loop, lanes, valid, shape)
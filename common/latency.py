@@ -0,0 +1,131 @@
+"""Trace the latency of every loop iteration and find the slow ones.
+
+A design's total cycle count hides the iterations (calorie values,
+rounds, or teams) that take disproportionately long. A design generated with
+`--trace N` keeps a free-running cycle counter and records the start and
+end cycles of each iteration of its outer loop in `trace_start` and
+`trace_end` interface memories. These work as a ring buffer of N
+entries (a power of two), so they hold the last N iterations. At the
+end, `trace_count` gets the total number of iterations.
+
+The generators add the instrumentation with `tracing.build_trace`. This
+module is the host side: it runs a traced design on some inputs and
+summarizes the latencies with a histogram and the worst offenders:
+
+    $ python3 ../common/latency.py --args "3 --trace 1024" full.txt
+    {"histogram": [...], "iterations": 2254, "max": 812, "worst": [...]}
+
+The instrumentation adds a few cycles to each iteration (outside the
+recorded span), so compare the latencies with each other rather than
+with the untraced design's total.
+"""
+import argparse
+import json
+import shlex
+
+import numpy as np
+
+import batch
+import cache
+
+# The width of the trace memories, matching `tracing.WIDTH`.
+WIDTH = 32
+
+
+def trace_memories(size):
+    """Get the initial (empty) trace memories for a design.
+    """
+    fmt = {"numeric_type": "bitnum", "is_signed": False, "width": WIDTH}
+    return {
+        "trace_start": {"data": [0] * size, "format": fmt},
+        "trace_end": {"data": [0] * size, "format": fmt},
+        "trace_count": {"data": [0], "format": fmt},
+    }
+
+
+def read_trace(memories):
+    """Get the index and latency of every iteration left in the ring
+    buffer, oldest first.
+    """
+    size = len(memories["trace_start"])
+    total = memories["trace_count"][0]
+    iterations = np.arange(max(total - size, 0), total)
+    slots = iterations % size
+    starts = np.asarray(memories["trace_start"], dtype=np.int64)[slots]
+    ends = np.asarray(memories["trace_end"], dtype=np.int64)[slots]
+    return iterations, (ends - starts) % (1 << WIDTH)
+
+
+def summarize(iterations, latencies, bins=10, worst=5):
+    """Summarize iteration latencies with a histogram and the slowest
+    iterations.
+    """
+    if not len(latencies):
+        return {"traced": 0}
+
+    counts, edges = np.histogram(latencies, bins=bins)
+    slowest = np.argsort(latencies, kind="stable")[::-1][:worst]
+    return {
+        "traced": len(latencies),
+        "mean": float(latencies.mean()),
+        "p50": int(np.percentile(latencies, 50, method="lower")),
+        "p99": int(np.percentile(latencies, 99, method="lower")),
+        "max": int(latencies.max()),
+        "histogram": [
+            {"cycles": [float(lo), float(hi)], "count": int(n)}
+            for lo, hi, n in zip(edges, edges[1:], counts)
+        ],
+        "worst": [
+            {"iteration": int(iterations[i]), "cycles": int(latencies[i])}
+            for i in slowest
+        ],
+    }
+
+
+def run_trace(day_dir, args, input_path):
+    """Simulate a traced design on one input and read back the trace.
+    """
+    converter = batch.load_module(day_dir, "convert")
+    design = batch.load_options(day_dir, args)
+    assert design.trace, "tracing needs a --trace design"
+    options = batch.convert_options(converter, design)
+    exe = cache.model(day_dir, args)
+
+    with open(input_path) as f:
+        if input_path.endswith(".json"):
+            data = json.load(f)
+        else:
+            data = converter.convert(f, **options)
+    data.update(trace_memories(design.trace))
+    cycles, _, memories = batch.simulate_data(exe, data)
+    return cycles, memories
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--day", default=".",
+                        help="day directory containing accelgen.py")
+    parser.add_argument("--args", default="", type=shlex.split,
+                        help="arguments for accelgen.py, with --trace")
+    parser.add_argument("--bins", type=int, default=10,
+                        help="histogram buckets (default: %(default)s)")
+    parser.add_argument("--worst", type=int, default=5,
+                        help="slowest iterations to list "
+                        "(default: %(default)s)")
+    parser.add_argument("inputs", nargs="+")
+    opts = parser.parse_args()
+
+    for input_path in opts.inputs:
+        cycles, memories = run_trace(opts.day, opts.args, input_path)
+        summary = summarize(*read_trace(memories), opts.bins, opts.worst)
+        summary.update(
+            input=input_path,
+            cycles=cycles,
+            answer=batch.answer(memories),
+            iterations=memories["trace_count"][0],
+        )
+        print(json.dumps(summary, sort_keys=True), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Counted `for` loops for the accelerator generators.
+
+Every day walks its input memories with the same hand-written machinery:
+a counter register, a comparison against the loop bound, an increment
+group, and a group that reads the current element. That last group puts
+the `seq_mem_d1` read latency on the critical path of every iteration.
+
+`build_for` generates all of this at once. When a loop walks memories,
+it *prefetches*: while the body works on element i (held in a register),
+the loop is already reading element i + 1 into a second register, so
+the body never waits for a memory read after the first element.
+"""
+from calyx.builder import while_, if_, as_control
+from calyx import py_ast as ast
+
+
+class ForLoop:
+    """The cells and groups for a counted loop.
+
+    `counter` is the register counting the iterations so far, `addr` is
+    the register that addresses the memories, `lt` is a comparator that
+    checks the counter against the bound when the `check` comb group is
+    active, and `regs` maps field names to the registers that hold the
+    current element while the body runs.
+    """
+    def __init__(self, counter, addr, lt, check, regs, reset, advance,
+                 prefetch):
+        self.counter = counter
+        self.addr = addr
+        self.lt = lt
+        self.check = check
+        self.regs = regs
+        self.reset = reset
+        self.advance = advance
+        self.prefetch = prefetch
+
+    def control(self, body, cond=None, cond_group=None, reset=True):
+        """Generate the control for the loop with a given body.
+
+        By default, the loop runs until the counter reaches the bound,
+        but `cond` and `cond_group` can supply a different exit check
+        (which should still involve `lt`). With `reset=False`, the loop
+        picks up where the last one exited instead of starting over.
+        That only works for loops that don't prefetch (like ones whose
+        body receives the elements from a stream): a loop that exits at
+        its bound hasn't fetched anything past it.
+        """
+        assert reset or self.prefetch is None, \
+            "a prefetching loop can't pick up where it exited"
+        if cond is None:
+            cond, cond_group = self.lt.out, self.check
+
+        if self.prefetch is None:
+            iteration = [self.advance, body]
+            start = [self.reset]
+        else:
+            iteration = [self.advance, ast.ParComp([
+                as_control(body),
+                self.prefetch,
+            ])]
+            start = [self.reset, self.prefetch]
+
+        return [
+            *(start if reset else []),
+            while_(cond, cond_group, iteration),
+        ]
+
+
+def build_for(comp, name, bound, width, fields=(), addr_width=None,
+              step=1):
+    """Add a loop that runs for `bound` iterations to a component.
+
+    `bound` is a port with the number of iterations and `width` is the
+    width of the counter.
+
+    `fields` is a list of `(field, mem, width)` triples for `seq_mem_d1`
+    memories to walk, one element per iteration. By default, the
+    counter itself is the address. With `addr_width`, the loop instead
+    gets a separate address register that advances along with the
+    counter but keeps its value when the loop resets, so consecutive
+    loops walk consecutive ranges of the memories.
+
+    To read several entries of a memory per iteration, a field can be a
+    `(field, mem, width, offset)` quadruple instead, which reads the
+    entry `offset` places past the address, and the address register
+    advances by `step` entries per iteration. The loop fetches the
+    fields at each offset in turn.
+    """
+    assert step == 1 or addr_width, "strides need an address register"
+    fields = [(*field, 0)[:4] for field in fields]
+
+    counter = comp.reg(f"{name}_idx", width)
+    if addr_width:
+        addr = comp.reg(f"{name}_addr", addr_width)
+    else:
+        addr = counter
+
+    with comp.group(f"reset_{name}") as reset:
+        counter.write_en = 1
+        counter.in_ = 0
+        reset.done = counter.done
+
+    # Exit check.
+    lt = comp.cell(f"{name}_lt", ast.Stdlib().op("lt", width, signed=False))
+    with comp.comb_group(f"check_{name}") as check:
+        lt.left = counter.out
+        lt.right = bound
+
+    # The registers for the current element and the prefetched one.
+    regs = {
+        field: comp.reg(f"{name}_{field}_reg", field_width)
+        for field, _, field_width, _ in fields
+    }
+    nexts = {
+        field: comp.reg(f"{name}_{field}_next", field_width)
+        for field, _, field_width, _ in fields
+    }
+
+    # Move to the next element: count it, move its prefetched values
+    # into place, and advance the address. All these registers are
+    # written in the same cycle.
+    add = comp.add(f"{name}_add", width)
+    with comp.group(f"advance_{name}") as advance:
+        add.left = counter.out
+        add.right = 1
+        counter.write_en = 1
+        counter.in_ = add.out
+        for field, reg in regs.items():
+            reg.write_en = 1
+            reg.in_ = nexts[field].out
+        if addr is not counter:
+            addr_add = comp.add(f"{name}_addr_add", addr_width)
+            addr_add.left = addr.out
+            addr_add.right = step
+            addr.write_en = 1
+            addr.in_ = addr_add.out
+        advance.done = counter.done
+
+    if not fields:
+        return ForLoop(counter, addr, lt, check, regs, reset, advance,
+                       None)
+
+    # Read the elements at the current address (plus each offset), if
+    # there are any. The memories all take the same number of cycles.
+    fetches = []
+    for offset in sorted({offset for *_, offset in fields}):
+        suffix = str(offset) if offset else ""
+        with comp.group(f"fetch_{name}{suffix}") as fetch:
+            if offset:
+                offset_add = comp.add(f"{name}_addr{offset}", addr_width)
+                offset_add.left = addr.out
+                offset_add.right = offset
+                at = offset_add.out
+            else:
+                at = addr.out
+
+            done = None
+            for field, mem, _, field_offset in fields:
+                if field_offset != offset:
+                    continue
+                mem.read_en = 1
+                mem.addr0 = at
+                nexts[field].write_en = mem.read_done
+                nexts[field].in_ = mem.out
+                reg = nexts[field]
+                done = reg.done if done is None else done & reg.done
+            fetch.done = done @ 1
+        fetches.append(fetch)
+    prefetch = if_(lt.out, check, fetches[0] if len(fetches) == 1
+                   else fetches)
+
+    return ForLoop(counter, addr, lt, check, regs, reset, advance,
+                   prefetch)
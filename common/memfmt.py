@@ -0,0 +1,189 @@
+"""Serialize memory data for the simulators.
+
+Every day's `convert.py` produces a dictionary in `fud`'s JSON data
+format, mapping memory names to their contents and numeric format. This
+module writes that dictionary out in one of several formats:
+
+* `json`: The pretty-printed format `fud` expects (the default).
+* `compact`: The same JSON, minus the whitespace. `fud` loads it
+  identically but it's much smaller and faster to parse.
+* `dat`: A directory with a `$readmemh` image (`<name>.dat`) for every
+  memory, ready for the RTL simulators to load without any further
+  conversion, alongside a `shape.json` file with the format metadata.
+
+Memory contents can be lists or NumPy arrays. We stream them out a
+chunk of values at a time, so big memories never exist as one big
+string (or list of Python integers) while we write them.
+"""
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+FORMATS = ("json", "compact", "dat")
+SHAPE_FILE = "shape.json"
+CHUNK_SIZE = 1 << 16
+
+# Stands in for memory contents in the JSON "skeleton" of the data.
+HOLE = "\0data\0"
+
+
+def add_arguments(parser):
+    """Add the format options to a converter's argument parser.
+    """
+    parser.add_argument("--format", choices=FORMATS, default="json",
+                        help="output format (default: %(default)s)")
+    parser.add_argument("-o", "--output",
+                        help="output file (or directory for `dat`)")
+
+
+def check_arguments(parser, opts):
+    """Reject format options that can't work together, with a usage
+    error from the converter's argument parser.
+    """
+    if opts.format == "dat" and not opts.output:
+        parser.error("the `dat` format needs an output directory (-o)")
+
+
+def _chunks(values):
+    """Split memory contents into lists of Python integers.
+    """
+    values = np.asarray(values)
+    for start in range(0, len(values), CHUNK_SIZE):
+        yield values[start:start + CHUNK_SIZE].tolist()
+
+
+def split_banks(data, names, banks):
+    """Split some memories into banks, for a design that reads them
+    several entries at a time (see `common/kernels.py`).
+
+    Entry i of memory `x` goes to entry i // banks of memory
+    `x{i % banks}`. Memories that aren't in `data` are skipped.
+    """
+    if banks == 1:
+        return data
+    data = dict(data)
+    for name in names:
+        if name not in data:
+            continue
+        mem = data.pop(name)
+        values = np.asarray(mem["data"])
+        assert len(values) % banks == 0, "banks must be the same size"
+        for bank in range(banks):
+            data[f"{name}{bank}"] = dict(mem, data=values[bank::banks])
+    return data
+
+
+def join_banks(data, names):
+    """Undo `split_banks`, for however many banks there are.
+    """
+    data = dict(data)
+    for name in names:
+        if name in data or f"{name}0" not in data:
+            continue
+        parts = []
+        while f"{name}{len(parts)}" in data:
+            parts.append(data.pop(f"{name}{len(parts)}"))
+        values = np.stack([np.asarray(p["data"]) for p in parts], axis=1)
+        data[name] = dict(parts[0], data=values.reshape(-1))
+    return data
+
+
+def write_dat(data, data_dir):
+    """Write a `$readmemh` image for every memory plus the shape file.
+    """
+    data_dir = Path(data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+
+    shape = {}
+    for name, mem in data.items():
+        with open(data_dir / f"{name}.dat", "w") as f:
+            for chunk in _chunks(mem["data"]):
+                f.write("".join(f"{value:x}\n" for value in chunk))
+        shape[name] = dict(mem["format"], shape=[len(mem["data"])])
+
+    with open(data_dir / SHAPE_FILE, "w") as f:
+        json.dump(shape, f, indent=2, sort_keys=True)
+
+
+def read_shape(data_dir):
+    with open(Path(data_dir) / SHAPE_FILE) as f:
+        return json.load(f)
+
+
+def link_dat(src_dir, dest_dir):
+    """Make the images in `src_dir` available in `dest_dir`.
+
+    Simulations write their results next to their inputs, so we run
+    each one in a scratch directory full of links to the real images.
+    Return the memory names.
+    """
+    shape = read_shape(src_dir)
+    for name in shape:
+        os.symlink(Path(src_dir, f"{name}.dat").resolve(),
+                   Path(dest_dir, f"{name}.dat"))
+    return list(shape)
+
+
+def read_out(data_dir, names):
+    """Read back the `$writememh` dumps from a simulation run.
+    """
+    memories = {}
+    for name in names:
+        values = []
+        with open(Path(data_dir) / f"{name}.out") as f:
+            for line in f:
+                line = line.split("//")[0].strip()
+                if line:
+                    values.append(int(line, 16))
+        memories[name] = values
+    return memories
+
+
+def write_json(data, f, pretty=True):
+    """Write memory data as JSON, streaming the memory contents.
+
+    The output is the same as `json.dump` with `sort_keys` and either an
+    indent of 2 (`pretty`) or no whitespace at all.
+    """
+    skeleton = {name: dict(mem, data=HOLE) for name, mem in data.items()}
+    if pretty:
+        text = json.dumps(skeleton, indent=2, sort_keys=True)
+        open_list, sep, close_list = "[\n      ", ",\n      ", "\n    ]"
+    else:
+        text = json.dumps(skeleton, separators=(",", ":"), sort_keys=True)
+        open_list, sep, close_list = "[", ",", "]"
+
+    # The holes appear in sorted order, just like the memories.
+    parts = text.split(json.dumps(HOLE))
+    for name, part in zip(sorted(data), parts):
+        f.write(part)
+        if not len(data[name]["data"]):
+            f.write("[]")
+            continue
+        f.write(open_list)
+        for i, chunk in enumerate(_chunks(data[name]["data"])):
+            if i:
+                f.write(sep)
+            f.write(sep.join(map(str, chunk)))
+        f.write(close_list)
+    f.write(parts[-1])
+
+
+def dump(data, fmt="json", output=None):
+    """Write converted memory data in the given format.
+    """
+    if fmt == "dat":
+        if not output:
+            raise ValueError("the `dat` format needs an output directory")
+        write_dat(data, output)
+        return
+
+    f = open(output, "w") if output else sys.stdout
+    try:
+        write_json(data, f, pretty=fmt != "compact")
+    finally:
+        if output:
+            f.close()
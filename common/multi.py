@@ -0,0 +1,67 @@
+"""Solve a batch of puzzle inputs in a single run.
+
+Every run of a design pays a fixed cost to start the simulator and load
+the memories, which dominates for small inputs. A design generated with
+`--batch B` takes up to B independent inputs at once instead. The host
+puts their data one after another in the usual interface memories, the
+memory that holds an input's size (like `count`) gets one entry per
+input, and the design writes each input's answers to consecutive
+entries of a bigger `answer` memory. Unused entries have a size of zero.
+
+Each day's `convert.py` lays out a batch with `convert_batch`, and
+`common/batch.py` groups its inputs into runs for these designs. The
+generators wrap their usual control in the loop from `build_batch`.
+"""
+from calyx.builder import const
+
+from loops import build_for
+from widths import bits
+
+
+class Batch:
+    """The cells and groups for looping over the inputs in a batch.
+
+    `loop` is the `ForLoop` over the inputs, whose `regs["count"]` holds
+    the current input's size while the body runs. `answer_idx` is the
+    register that addresses the `answer` memory, and the `next_answer`
+    group advances it.
+    """
+    def __init__(self, loop, answer_idx, next_answer):
+        self.loop = loop
+        self.answer_idx = answer_idx
+        self.next_answer = next_answer
+
+    def control(self, body, finish):
+        """Generate the control for the loop over the inputs.
+
+        `body` processes one input, and `finish` is a list of groups
+        that each write one of its answers to `answer` at `answer_idx`.
+        """
+        answers = [s for group in finish for s in (group, self.next_answer)]
+        return self.loop.control([*body, *answers])
+
+
+def build_batch(comp, size, counts, count_width, idx_width):
+    """Add a loop over a batch of `size` inputs to a component.
+
+    `counts` is the interface memory with each input's size, which is
+    `count_width` bits wide, and `idx_width` is the address width of the
+    `answer` memory. The loop's counter addresses `counts`, so that
+    memory needs `bits(size)` address bits, which is what
+    `kernels.build_mem` gives it by default.
+    """
+    width = bits(size)
+    loop = build_for(comp, "input", const(width, size), width,
+                     [("count", counts, count_width)])
+
+    # Each answer goes in the next entry.
+    answer_idx = comp.reg("answer_idx", idx_width)
+    add = comp.add("answer_add", idx_width)
+    with comp.group("next_answer") as next_answer:
+        add.left = answer_idx.out
+        add.right = 1
+        answer_idx.write_en = 1
+        answer_idx.in_ = add.out
+        next_answer.done = answer_idx.done
+
+    return Batch(loop, answer_idx, next_answer)
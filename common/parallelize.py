@@ -0,0 +1,222 @@
+"""Automatically turn `seq` blocks into `par` blocks where it's safe.
+
+The generators place `par` blocks by hand in a few spots, but it's easy
+to miss independent groups. This pass works on a whole builder
+`Program`: it finds the cells that each group reads and writes (from
+its assignments, following continuous assignments back to the cells
+that drive them) and then schedules the statements in every `seq` block
+as soon as possible, running statements in parallel when they don't
+conflict. Two statements conflict when one writes a cell that the other
+reads or writes, so the pass never reorders dependent statements or
+makes two statements share a cell's input ports. (Memory reads count as
+writes because they drive the address ports.)
+
+The generators apply it with `--parallelize`. The command-line interface
+simulates a design with and without the pass and reports the cycles
+saved on each input:
+
+    $ python3 ../common/parallelize.py --args 3 full.txt
+    {"cycles": 12345, "par_cycles": 11000, "saved": 1345, ...}
+"""
+import argparse
+import json
+import shlex
+
+from calyx import py_ast as ast
+
+
+class Effects:
+    """The sets of cells that a control statement reads and writes.
+    """
+    def __init__(self, reads=(), writes=()):
+        self.reads = set(reads)
+        self.writes = set(writes)
+
+    def __ior__(self, other):
+        self.reads |= other.reads
+        self.writes |= other.writes
+        return self
+
+    def conflicts(self, other):
+        return bool(self.writes & (other.reads | other.writes) or
+                    other.writes & self.reads)
+
+
+def port_cells(node):
+    """Get the names of the cells whose ports appear in an expression.
+
+    Component ports count as cells named `this.<port>`. Group holes and
+    constants don't involve any cells.
+    """
+    if isinstance(node, ast.CompPort):
+        yield node.id.name
+    elif isinstance(node, ast.ThisPort):
+        yield f"this.{node.id.name}"
+    elif isinstance(node, (ast.HolePort, ast.ConstantPort)):
+        return
+    elif isinstance(node, (list, tuple)):
+        for child in node:
+            yield from port_cells(child)
+    elif hasattr(node, "__dict__"):
+        # Guard expressions and the like.
+        for child in vars(node).values():
+            yield from port_cells(child)
+
+
+def continuous_drivers(comp):
+    """Map every cell that continuous assignments drive to the cells
+    whose ports those assignments read.
+    """
+    drivers = {}
+    for wire in comp.wires:
+        if not isinstance(wire, ast.Connect):
+            continue
+        reads = set(port_cells(wire.src)) | set(port_cells(wire.guard))
+        for cell in port_cells(wire.dest):
+            drivers.setdefault(cell, set()).update(reads)
+    return drivers
+
+
+def follow(cells, drivers):
+    """Add the cells that continuously drive some cells, transitively.
+
+    A group that reads the output of continuous logic (like an adder
+    tree or a loop bound) depends on everything that logic reads.
+    """
+    seen = set(cells)
+    todo = list(seen)
+    while todo:
+        for cell in drivers.get(todo.pop(), ()):
+            if cell not in seen:
+                seen.add(cell)
+                todo.append(cell)
+    return seen
+
+
+def group_effects(comp):
+    """Get the effects of every group (and comb group) in a component.
+    """
+    drivers = continuous_drivers(comp)
+    effects = {}
+    for wire in comp.wires:
+        if not isinstance(wire, (ast.Group, ast.CombGroup)):
+            continue
+        eff = Effects()
+        for conn in wire.connections:
+            eff.writes |= set(port_cells(conn.dest))
+            eff.reads |= set(port_cells(conn.src))
+            eff.reads |= set(port_cells(conn.guard))
+        eff.reads = follow(eff.reads, drivers)
+        effects[wire.id.name] = eff
+    return effects
+
+
+def control_effects(stmt, groups):
+    """Get the combined effects of a control statement.
+    """
+    if isinstance(stmt, ast.Enable):
+        return groups[stmt.stmt]
+
+    eff = Effects()
+    if isinstance(stmt, ast.Invoke):
+        eff.writes.add(stmt.id.name)
+        eff.reads |= set(port_cells([p for _, p in stmt.in_connects]))
+        eff.writes |= set(port_cells([p for _, p in stmt.out_connects]))
+    elif isinstance(stmt, (ast.SeqComp, ast.ParComp)):
+        for child in stmt.stmts:
+            eff |= control_effects(child, groups)
+    elif isinstance(stmt, (ast.If, ast.While)):
+        eff.reads |= set(port_cells(stmt.port))
+        if stmt.cond:
+            eff |= groups[stmt.cond.name]
+        if isinstance(stmt, ast.If):
+            eff |= control_effects(stmt.true_branch, groups)
+            eff |= control_effects(stmt.false_branch, groups)
+        else:
+            eff |= control_effects(stmt.body, groups)
+    return eff
+
+
+def schedule(stmts, groups):
+    """Group a sequence of statements into stages that can run in
+    parallel.
+
+    Each statement goes in the stage right after the last earlier
+    statement it conflicts with.
+    """
+    stages = []
+    placed = []  # (stage index, effects) for each earlier statement.
+    for stmt in stmts:
+        eff = control_effects(stmt, groups)
+        stage = max((i + 1 for i, other in placed if eff.conflicts(other)),
+                    default=0)
+        if stage == len(stages):
+            stages.append([])
+        stages[stage].append(stmt)
+        placed.append((stage, eff))
+    return stages
+
+
+class Stats:
+    def __init__(self):
+        self.statements = 0
+        self.stages = 0
+
+
+def rewrite(stmt, groups, stats):
+    """Parallelize a control statement and everything inside it.
+    """
+    if isinstance(stmt, ast.SeqComp):
+        stmts = [rewrite(s, groups, stats) for s in stmt.stmts]
+        stages = schedule(stmts, groups)
+        stats.statements += len(stmts)
+        stats.stages += len(stages)
+        stmts = [
+            stage[0] if len(stage) == 1 else ast.ParComp(stage)
+            for stage in stages
+        ]
+        return stmts[0] if len(stmts) == 1 else ast.SeqComp(stmts)
+
+    if isinstance(stmt, ast.ParComp):
+        stmt.stmts = [rewrite(s, groups, stats) for s in stmt.stmts]
+    elif isinstance(stmt, ast.If):
+        stmt.true_branch = rewrite(stmt.true_branch, groups, stats)
+        stmt.false_branch = rewrite(stmt.false_branch, groups, stats)
+    elif isinstance(stmt, ast.While):
+        stmt.body = rewrite(stmt.body, groups, stats)
+    return stmt
+
+
+def parallelize(program):
+    """Parallelize the control of every component in a program, in
+    place.
+
+    Return the number of statements in `seq` blocks before and after the
+    pass, i.e., the number of sequential steps we removed is the
+    difference.
+    """
+    stats = Stats()
+    for comp in program.components:
+        comp.controls = rewrite(comp.controls, group_effects(comp), stats)
+    return stats.statements, stats.stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--day", default=".",
+                        help="day directory containing accelgen.py")
+    parser.add_argument("--args", default="", type=shlex.split,
+                        help="arguments for accelgen.py")
+    parser.add_argument("inputs", nargs="+")
+    opts = parser.parse_args()
+
+    # The generators import this module for the pass itself, so we only
+    # load the simulation drivers when we need them.
+    import batch
+    for result in batch.savings(opts.day, opts.args, "--parallelize",
+                                opts.inputs, "par"):
+        print(json.dumps(result, sort_keys=True), flush=True)
+
+
+if __name__ == "__main__":
+    main()
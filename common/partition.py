@@ -0,0 +1,105 @@
+"""Solve one big input on many cores by partitioning it.
+
+We split the input text at places where that's semantically safe
+(between elves on day 1, anywhere on day 2, and between teams on day
+3), solve each piece with a `--resumable` design in its own process,
+and then merge the partial results:
+
+    $ python3 ../common/partition.py --args "3 --resumable" -j 16 huge.txt
+    {"answer": 45000, "cycles": 12345, "pieces": 16, ...}
+
+Each piece goes through `chunked.run_chunks`, so pieces can themselves
+be bigger than the accelerator's memories. The day's `convert.py`
+supplies the safe `boundaries` and the `merge` function. The reported
+`cycles` is the slowest piece's cycle count (i.e., the critical path
+with one accelerator per piece) and `total_cycles` is the sum.
+"""
+import argparse
+import json
+import os
+import shlex
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cache
+import chunked
+
+
+def cut(boundaries, total, pieces):
+    """Split `total` lines into at most `pieces` contiguous ranges.
+
+    The ranges start only at `boundaries` and have about the same size.
+    Return a list of `(start, end)` pairs.
+    """
+    cuts = [0]
+    for b in boundaries:
+        if len(cuts) == pieces:
+            break
+        if b > cuts[-1] and b >= total * len(cuts) / pieces:
+            cuts.append(b)
+    cuts.append(total)
+    return list(zip(cuts, cuts[1:]))
+
+
+def solve_piece(exe, day_dir, args, lines, size):
+    """Solve one piece of the input (in a worker process).
+    """
+    converter, design = chunked.load_design(day_dir, args)
+    return chunked.run_chunks(exe, converter, design, lines, size)
+
+
+def run_partitioned(day_dir, args, input_path, jobs, pieces=None,
+                    size=None):
+    """Solve one input with a pool of worker processes.
+    """
+    exe = cache.model(day_dir, args)
+    converter, design = chunked.load_design(day_dir, args)
+    with open(input_path) as f:
+        lines = f.readlines()
+    ranges = cut(converter.boundaries(lines, design), len(lines),
+                 pieces or jobs)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [
+            pool.submit(solve_piece, exe, day_dir, args, lines[a:b], size)
+            for a, b in ranges
+        ]
+        results = [f.result() for f in futures]
+    elapsed = time.perf_counter() - start
+
+    cycles = [c for _, c, _ in results]
+    return {
+        "input": input_path,
+        "answer": converter.merge([m for m, _, _ in results if m],
+                                  design),
+        "pieces": len(ranges),
+        "cycles": max(cycles),
+        "total_cycles": sum(cycles),
+        "seconds": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--day", default=".",
+                        help="day directory containing accelgen.py")
+    parser.add_argument("--args", default="", type=shlex.split,
+                        help="arguments for accelgen.py")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="number of worker processes")
+    parser.add_argument("--pieces", type=int,
+                        help="number of pieces (default: one per job)")
+    parser.add_argument("--size", type=int,
+                        help="chunk size (default: the memory capacity)")
+    parser.add_argument("inputs", nargs="+")
+    opts = parser.parse_args()
+
+    for input_path in opts.inputs:
+        result = run_partitioned(opts.day, opts.args, input_path,
+                                 opts.jobs, opts.pieces, opts.size)
+        print(json.dumps(result, sort_keys=True), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Ready/valid input streams for the accelerators.
+
+Instead of preloading every input into a fixed-size memory, a design
+generated with `--stream` consumes its input through *streams*: groups
+of input ports on `main` that follow a standard ready/valid handshake.
+A stream called `elem` with a 32-bit `calories` field looks like this:
+
+* `elem_valid` (input): the producer has an element available.
+* `elem_calories` (input): the element's data.
+* `elem_last` (input): this element is the final one.
+* `elem_ready` (output): the accelerator is accepting an element.
+
+An element transfers on every cycle where both `valid` and `ready` are
+high. On-chip storage is just one register per field (or two, for a
+stream that receives the next element while the design works on the
+current one), no matter how long the input is. `stream.py` simulates
+these designs.
+"""
+from calyx.builder import while_, if_, as_control
+from calyx import py_ast as ast
+
+
+class Stream:
+    """The cells and groups for one input stream.
+
+    `regs` maps field names to the registers that hold the current
+    element, `last` is a register holding that element's `last` flag,
+    and `pop` is a group that waits for and receives the next element.
+
+    For a prefetching stream, `pop` receives the next element into a
+    second set of registers while the body works on the current one,
+    and `advance` moves it into place. `not_last` is active when the
+    `more` comb group is and the current element isn't the last one.
+    """
+    def __init__(self, regs, last, pop, advance=None, not_last=None,
+                 more=None):
+        self.regs = regs
+        self.last = last
+        self.pop = pop
+        self.advance = advance
+        self.not_last = not_last
+        self.more = more
+
+    def control(self, body):
+        """Generate a loop that runs `body` on every element.
+
+        The loop receives the first element and then, while the body
+        works on each element, receives the next one (unless the current
+        element is the last), so the handshake is off the critical path
+        whenever the producer keeps up. This only works for prefetching
+        streams; other streams just expose `pop` for their users to
+        sequence before the work on each element.
+        """
+        assert self.advance is not None, "the stream doesn't prefetch"
+        iteration = [self.advance, ast.ParComp([
+            as_control(body),
+            if_(self.not_last.out, self.more, self.pop),
+        ])]
+        return [self.pop, while_(self.not_last.out, self.more, iteration)]
+
+
+def build_stream(comp, name, fields, prefetch=False):
+    """Add a ready/valid input stream to a component.
+
+    `fields` is a list of `(name, width)` pairs for the data that comes
+    with each element. With `prefetch`, the stream gets registers for
+    the next element too, so it can receive the next element while a
+    loop (see `Stream.control`) works on the current one.
+    """
+    comp.input(f"{name}_valid", 1)
+    comp.input(f"{name}_last", 1)
+    comp.output(f"{name}_ready", 1)
+    for field, width in fields:
+        comp.input(f"{name}_{field}", width)
+
+    regs = {
+        field: comp.reg(f"{name}_{field}_reg", width)
+        for field, width in fields
+    }
+    last = comp.reg(f"{name}_last_reg", 1)
+    if prefetch:
+        nexts = {
+            field: comp.reg(f"{name}_{field}_next", width)
+            for field, width in fields
+        }
+        last_next = comp.reg(f"{name}_last_next", 1)
+    else:
+        nexts, last_next = regs, last
+
+    # Accept exactly one element. All the registers are written in the
+    # same cycle, so `last_next.done` is high the cycle after the
+    # transfer. We drop `ready` in that cycle to avoid accepting a second
+    # element.
+    this = comp.this()
+    with comp.group(f"pop_{name}") as pop:
+        fire = getattr(this, f"{name}_valid") & ~last_next.done
+        setattr(this, f"{name}_ready", ~last_next.done @ 1)
+        for field, reg in nexts.items():
+            reg.write_en = fire @ 1
+            reg.in_ = getattr(this, f"{name}_{field}")
+        last_next.write_en = fire @ 1
+        last_next.in_ = getattr(this, f"{name}_last")
+        pop.done = last_next.done
+
+    if not prefetch:
+        return Stream(regs, last, pop)
+
+    # Move the received element into place, all in one cycle.
+    with comp.group(f"advance_{name}") as advance:
+        for field, reg in regs.items():
+            reg.write_en = 1
+            reg.in_ = nexts[field].out
+        last.write_en = 1
+        last.in_ = last_next.out
+        advance.done = last.done
+
+    not_last = comp.cell(f"{name}_not_last",
+                         ast.Stdlib().op("not", 1, signed=False))
+    with comp.comb_group(f"{name}_more") as more:
+        not_last.in_ = last.out
+
+    return Stream(regs, last, pop, advance, not_last, more)
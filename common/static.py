@@ -0,0 +1,150 @@
+"""Mark fixed-latency groups for static timing.
+
+Every group the generators build signals completion through a `done`
+port, so Calyx has to compile each one into a handshake with its own FSM
+states. Most of them take a fixed number of cycles, though: a register
+write with its `write_en` tied high always takes one cycle, and a
+`seq_mem_d1` read that feeds a register takes two. This pass works out
+those latencies from each group's assignments and records them as the
+group's `"static"` attribute, which lets Calyx schedule the groups (and
+any control made only of static groups) with counters instead of
+handshakes.
+
+The inference is conservative. A group gets a latency only when its
+`done` comes from register `done` or memory `read_done`/`write_done`
+ports whose enables are (transitively) driven unconditionally. Anything
+that waits on the outside world, like a stream `pop`, stays dynamic.
+
+The generators apply it with `--static`. The command-line interface
+simulates a design with and without the pass and reports the cycles
+saved on each input:
+
+    $ python3 ../common/static.py --args 3 full.txt
+    {"cycles": 12345, "static_cycles": 11000, "saved": 1345, ...}
+"""
+import argparse
+import json
+import shlex
+
+from calyx import py_ast as ast
+
+# The enable port that starts the operation behind each kind of `done`.
+ENABLES = {
+    "done": "write_en",  # std_reg
+    "read_done": "read_en",  # seq_mem_d1
+    "write_done": "write_en",  # seq_mem_d1
+}
+
+
+def port_key(port):
+    """Get a `(cell or group, port)` pair that identifies a port.
+    """
+    if isinstance(port, (ast.CompPort, ast.HolePort)):
+        return port.id.name, port.name
+    return None
+
+
+def is_high(port):
+    return isinstance(port, ast.ConstantPort) and port.value == 1
+
+
+def conjuncts(guard):
+    """Get the ports in a guard that is a conjunction of ports, or None
+    for any other kind of guard.
+    """
+    if isinstance(guard, ast.Atom):
+        return [guard.item]
+    elif isinstance(guard, ast.And):
+        left, right = conjuncts(guard.left), conjuncts(guard.right)
+        return None if left is None or right is None else left + right
+    return None
+
+
+def port_latency(assigns, port):
+    """Get the number of cycles until a `done` port goes high, or None
+    if it isn't fixed.
+    """
+    key = port_key(port)
+    if key is None or key[1] not in ENABLES:
+        return None
+
+    # The enable must have a single, unconditional driver.
+    enables = assigns.get((key[0], ENABLES[key[1]]), [])
+    if len(enables) != 1 or enables[0].guard is not None:
+        return None
+    src = enables[0].src
+    if is_high(src):
+        return 1
+
+    # Or it's enabled by another fixed-latency `done`, as when a
+    # register saves the result of a memory read.
+    before = port_latency(assigns, src)
+    return None if before is None else before + 1
+
+
+def group_latency(group):
+    """Get the number of cycles a group takes, or None if it isn't
+    fixed.
+    """
+    assigns = {}
+    for conn in group.connections:
+        assigns.setdefault(port_key(conn.dest), []).append(conn)
+
+    dones = assigns.get((group.id.name, "done"), [])
+    if len(dones) != 1:
+        return None
+    done = dones[0]
+
+    # Either `done = port` or `done = (a & b & ...) @ 1`.
+    if done.guard is None:
+        ports = [done.src]
+    elif is_high(done.src):
+        ports = conjuncts(done.guard) or []
+    else:
+        return None
+
+    # Every port must finish in the same cycle, or `done` never rises.
+    latencies = {port_latency(assigns, port) for port in ports}
+    if len(latencies) != 1 or None in latencies:
+        return None
+    return latencies.pop()
+
+
+def infer_static(program):
+    """Annotate every fixed-latency group in a program, in place.
+
+    Return the number of groups we annotated and the total number of
+    (non-combinational) groups.
+    """
+    static = total = 0
+    for comp in program.components:
+        for wire in comp.wires:
+            if not isinstance(wire, ast.Group):
+                continue
+            total += 1
+            latency = group_latency(wire)
+            if latency is not None:
+                wire.static_delay = latency
+                static += 1
+    return static, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--day", default=".",
+                        help="day directory containing accelgen.py")
+    parser.add_argument("--args", default="", type=shlex.split,
+                        help="arguments for accelgen.py")
+    parser.add_argument("inputs", nargs="+")
+    opts = parser.parse_args()
+
+    # The generators import this module for the pass itself, so we only
+    # load the simulation drivers when we need them.
+    import batch
+    for result in batch.savings(opts.day, opts.args, "--static",
+                                opts.inputs, "static"):
+        print(json.dumps(result, sort_keys=True), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Simulate designs that receive their input on ready/valid streams.
+
+A design generated with `--stream` consumes its input through the
+streams that `readyvalid.build_stream` adds to `main`. This harness
+feeds converted data into those streams with a generated Icarus Verilog
+testbench:
+
+    $ python3 ../common/stream.py --args "3 --stream" sample.txt
+    {"answer": 45000, "cycles": 123, "input": "sample.txt", ...}
+
+The harness gets the stream contents from the `streams` function in the
+day's `convert.py`.
+"""
+import argparse
+import json
+import re
+import shlex
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import batch
+import cache
+import memfmt
+
+TESTBENCH = """module tb;
+  logic clk = 0;
+  logic reset = 1;
+  logic go = 0;
+  logic done;
+  string data;
+  longint cycles = 0;
+{decls}
+  main dut (
+    .clk(clk),
+    .reset(reset),
+    .go(go),
+    .done(done){ports}
+  );
+
+  always #5 clk = ~clk;
+
+  initial begin
+    if (!$value$plusargs("DATA=%s", data))
+      $fatal(1, "missing +DATA argument");
+{loads}
+    repeat (5) @(posedge clk);
+    reset = 0;
+    go = 1;
+    while (!done) begin
+      @(posedge clk);
+      cycles++;
+    end
+    $display("Simulated %0d cycles", cycles);
+    $finish;
+  end
+endmodule
+"""
+
+STREAM_DECLS = """
+  // Stream `{name}`.
+  int {name}_idx = 0;
+  logic {name}_valid, {name}_ready, {name}_last;
+  assign {name}_valid = {name}_idx < {count};
+  assign {name}_last = {name}_idx == {count} - 1;
+  always @(posedge clk)
+    if (!reset && {name}_valid && {name}_ready)
+      {name}_idx <= {name}_idx + 1;
+"""
+
+FIELD_DECLS = """  logic [{msb}:0] {name}_{field}_mem [0:{count} - 1];
+  logic [{msb}:0] {name}_{field};
+  assign {name}_{field} = {name}_{field}_mem[{name}_idx];
+"""
+
+
+def testbench(streams):
+    """Generate a testbench that feeds the given streams into `main`.
+
+    `streams` maps stream names to dictionaries of fields in `fud`'s
+    JSON data format. Each field's data is loaded from a `.dat` file.
+    """
+    decls = []
+    ports = []
+    loads = []
+    for name, fields in streams.items():
+        count = len(next(iter(fields.values()))["data"])
+        decls.append(STREAM_DECLS.format(name=name, count=count))
+        ports += [f"{name}_valid", f"{name}_ready", f"{name}_last"]
+        for field, mem in fields.items():
+            decls.append(FIELD_DECLS.format(
+                name=name, field=field, count=count,
+                msb=mem["format"]["width"] - 1,
+            ))
+            ports.append(f"{name}_{field}")
+            loads.append(
+                f'    $readmemh({{data, "/{name}_{field}.dat"}}, '
+                f'{name}_{field}_mem);'
+            )
+
+    return TESTBENCH.format(
+        decls="".join(decls),
+        ports="".join(f",\n    .{p}({p})" for p in ports),
+        loads="\n".join(loads),
+    )
+
+
+def run_stream(day_dir, args, input_path):
+    """Simulate a `--stream` design on one input text file.
+
+    The testbench depends on the stream lengths, so we compile it (with
+    the cached Verilog for the design) on every run. Icarus compiles
+    small designs quickly, so this is cheap.
+    """
+    src = cache.verilog(day_dir, args)
+    converter = batch.load_module(day_dir, "convert")
+    design = batch.load_options(day_dir, args)
+    outputs = {"answer": 2 if design.both else 1}
+    if getattr(design, "filter", None) == "cam":
+        outputs["overflow"] = 1
+    with open(input_path) as f:
+        streams = converter.streams(f)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        memfmt.write_dat({
+            f"{name}_{field}": mem
+            for name, fields in streams.items()
+            for field, mem in fields.items()
+        }, tmp)
+        for name, size in outputs.items():
+            (tmp / f"{name}.dat").write_text("0\n" * size)
+
+        (tmp / "tb.sv").write_text(testbench(streams))
+        subprocess.run(
+            ["iverilog", "-g2012", "-o", str(tmp / "sim"),
+             str(tmp / "tb.sv"), str(src)],
+            check=True,
+        )
+        start = time.perf_counter()
+        proc = subprocess.run(
+            ["vvp", str(tmp / "sim"), f"+DATA={tmp}"],
+            capture_output=True, text=True, check=True,
+        )
+        elapsed = time.perf_counter() - start
+        match = re.search(r"(\d+) cycles", proc.stdout)
+        memories = memfmt.read_out(tmp, list(outputs))
+
+    return {
+        "input": input_path,
+        "answer": batch.answer(memories),
+        "cycles": int(match.group(1)) if match else None,
+        "seconds": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--day", default=".",
+                        help="day directory containing accelgen.py")
+    parser.add_argument("--args", default="", type=shlex.split,
+                        help="arguments for accelgen.py")
+    parser.add_argument("inputs", nargs="+")
+    opts = parser.parse_args()
+
+    for input_path in opts.inputs:
+        result = run_stream(opts.day, opts.args, input_path)
+        print(json.dumps(result, sort_keys=True), flush=True)
+
+
+if __name__ == "__main__":
+    main()
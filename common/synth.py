@@ -0,0 +1,57 @@
+"""Shared plumbing for the synthetic input generators.
+
+Each day's `generate.py` writes random (but valid) puzzle text whose
+size is a multiple of a real Advent of Code input, along with the
+expected answers to both parts. With `-o big.txt`, the answers go in
+`big.part1` and `big.part2`, which is where Turnt looks for the expected
+output, so every Turnt environment can check the results:
+
+    $ python3 generate.py --scale 100 --seed 7 -o big.txt
+    $ turnt -e part1-chunked big.txt
+
+Generation is deterministic for a given seed and set of options.
+"""
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+
+
+def add_arguments(parser):
+    """Add the common options to a generator's argument parser.
+    """
+    parser.add_argument("--seed", type=int, default=0,
+                        help="random seed (default: %(default)s)")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="size relative to a real input (default: 1)")
+    parser.add_argument("-o", "--output",
+                        help="output text file (answers go alongside it)")
+
+
+def rng(opts):
+    return np.random.default_rng(opts.seed)
+
+
+def count(real_size, scale, multiple=1):
+    """Scale a real input's size, rounding to a positive multiple.
+    """
+    return max(1, round(real_size * scale / multiple)) * multiple
+
+
+def write(lines, answers, output=None):
+    """Write the puzzle text and the expected answers.
+
+    `lines` is an iterable of text lines and `answers` maps part names
+    (`part1` and `part2`) to their answers. Without an output file, the
+    text goes to stdout and the answers go to stderr as JSON.
+    """
+    if output:
+        with open(output, "w") as f:
+            f.writelines(f"{line}\n" for line in lines)
+        for part, answer in answers.items():
+            Path(output).with_suffix(f".{part}").write_text(f"{answer}\n")
+    else:
+        sys.stdout.writelines(f"{line}\n" for line in lines)
+        json.dump(answers, sys.stderr, sort_keys=True)
+        sys.stderr.write("\n")
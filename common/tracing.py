@@ -0,0 +1,100 @@
+"""Instrument a design's main loop for latency tracing.
+
+A design generated with `--trace N` keeps a free-running cycle counter
+and records the start and end cycles of each iteration of its outer
+loop in a ring buffer of N entries, held in the `trace_start` and
+`trace_end` interface memories. At the end, `trace_count` gets the
+total number of iterations. `latency.py` runs these designs and
+summarizes the latencies.
+"""
+from calyx.builder import const
+from calyx import py_ast as ast
+
+from kernels import build_mem
+
+WIDTH = 32
+
+
+class Trace:
+    """The cells and groups for tracing loop iterations.
+
+    `mark` saves the cycle when an iteration starts, `record` writes the
+    iteration's start and end cycles to the ring buffer and counts it,
+    and `save_count` writes the total count to `trace_count`.
+    """
+    def __init__(self, mark, record, save_count):
+        self.mark = mark
+        self.record = record
+        self.save_count = save_count
+
+    def wrap(self, body):
+        """Instrument the body of a loop.
+        """
+        return [self.mark, body, self.record]
+
+
+def build_trace(comp, size):
+    """Add the tracing machinery for a ring buffer of `size` entries to
+    a component.
+    """
+    assert size >= 2 and size & (size - 1) == 0, \
+        "the trace size must be a power of two"
+    idx_width = (size - 1).bit_length()
+    starts = build_mem(comp, "trace_start", WIDTH, size, idx_width)
+    ends = build_mem(comp, "trace_end", WIDTH, size, idx_width)
+    count_mem = build_mem(comp, "trace_count", WIDTH, 1)
+
+    # Count every cycle.
+    cycle = comp.reg("trace_cycle", WIDTH)
+    cycle_add = comp.add("trace_cycle_add", WIDTH)
+    with comp.continuous:
+        cycle_add.left = cycle.out
+        cycle_add.right = const(WIDTH, 1)
+        cycle.write_en = 1
+        cycle.in_ = cycle_add.out
+
+    start = comp.reg("trace_begin", WIDTH)
+    with comp.group("trace_mark") as mark:
+        start.write_en = 1
+        start.in_ = cycle.out
+        mark.done = start.done
+
+    # The low bits of the iteration count address the ring buffer.
+    count = comp.reg("trace_iters", WIDTH)
+    count_add = comp.add("trace_iters_add", WIDTH)
+    slot = comp.cell("trace_slot",
+                     ast.Stdlib().slice(WIDTH, idx_width))
+    with comp.group("trace_record") as record:
+        slot.in_ = count.out
+        starts.addr0 = slot.out
+        starts.write_en = 1
+        starts.in_ = start.out
+        ends.addr0 = slot.out
+        ends.write_en = 1
+        ends.in_ = cycle.out
+
+        count_add.left = count.out
+        count_add.right = const(WIDTH, 1)
+        count.write_en = starts.write_done
+        count.in_ = count_add.out
+        record.done = count.done
+
+    with comp.group("trace_save") as save_count:
+        count_mem.addr0 = 0
+        count_mem.write_en = 1
+        count_mem.in_ = count.out
+        save_count.done = count_mem.write_done
+
+    return Trace(mark, record, save_count)
+
+
+def check_arguments(parser, opts):
+    """Reject generator options that would garble a trace, with a usage
+    error from the generator's argument parser.
+
+    The `--parallelize` pass can't see that the trace groups depend on
+    the loop body (they only share the free-running cycle counter, which
+    is a continuous assignment), so it would run them in parallel.
+    """
+    if opts.trace and opts.parallelize:
+        parser.error("--trace doesn't work with --parallelize")
@@ -0,0 +1,212 @@
+"""Explore a day's design space and find the best configurations.
+
+Each day's `accelgen.py` has a `TUNING_SPACE`: a list of knobs, each a
+list of alternative generator arguments that change how a design works
+but not what it computes. Arguments can refer to the value ranges that
+`convert.py --meta` reports for the input, like `--max-total
+{max_total}`. The tuner tries every combination of knobs on top of some
+fixed arguments (which pick the puzzle part) and measures:
+
+* `cycles`: the simulated cycle count on the given input.
+* `area`: a static estimate from the cells in the generated Calyx
+  program (see `area`).
+
+Results are cached next to each design in the build cache, so rerunning
+a sweep only simulates new points. The output has a JSON line for every
+point, fastest first, marking the ones on the Pareto front of cycles
+and area and the single `best` one (the fastest, then the smallest):
+
+    $ python3 ../common/tune.py --args 3 full.txt
+    {"args": "3 --static", "area": 300, "best": true, "cycles": 12345, ...}
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import re
+import shlex
+import tempfile
+
+import batch
+import cache
+
+# Relative area per bit of width (the first parameter) for each
+# primitive. Wires, pads, slices, and so on cost nothing.
+BIT_COSTS = {
+    "std_reg": 1,
+    "std_add": 1,
+    "std_sub": 1,
+    "std_lt": 1,
+    "std_gt": 1,
+    "std_eq": 1,
+    "std_neq": 1,
+    "std_le": 1,
+    "std_ge": 1,
+    "std_rsh": 1,
+    "std_lsh": 1,
+    "std_mult_pipe": 8,
+}
+FREE = {"std_wire", "std_pad", "std_slice", "std_cat", "std_not",
+        "std_and", "std_or", "std_const"}
+MEMORIES = {"seq_mem_d1", "std_mem_d1"}
+
+COMPONENT_RE = re.compile(r"^\s*component\s+(\w+)")
+CELL_RE = re.compile(r"^\s*((?:@\w+(?:\(\d+\))?\s+)*)(?:ref\s+)?"
+                     r"(\w+)\s*=\s*(\w+)\(([^)]*)\);")
+
+
+def points(space, meta):
+    """Generate the argument lists for every combination of knobs.
+    """
+    for choice in itertools.product(*space):
+        yield [
+            arg for option in choice
+            for arg in shlex.split(option.format(**meta))
+        ]
+
+
+def read_cells(futil_path):
+    """Get the cells of every component in a Calyx program.
+
+    Return a dictionary mapping each component's name to a list of
+    `(attributes, type, parameters)` for its cells.
+    """
+    comps = {}
+    cells = None
+    with open(futil_path) as f:
+        for line in f:
+            match = COMPONENT_RE.match(line)
+            if match:
+                cells = comps.setdefault(match.group(1), [])
+                continue
+            match = CELL_RE.match(line)
+            if match and cells is not None:
+                attrs, _, kind, params = match.groups()
+                params = [int(p) for p in params.split(",") if p.strip()]
+                cells.append((attrs, kind, params))
+    return comps
+
+
+def area(futil_path):
+    """Estimate the area of a generated design.
+
+    We add up per-bit costs for the primitives in every component,
+    counting instances of the design's own components by their
+    contents. Memories cost one per bit they hold, except for external
+    (interface) memories, which are the same for every configuration.
+    """
+    comps = read_cells(futil_path)
+    totals = {}
+
+    def comp_area(name):
+        if name not in totals:
+            total = 0
+            for attrs, kind, params in comps[name]:
+                if kind in comps:
+                    total += comp_area(kind)
+                elif kind in MEMORIES:
+                    if "@external" not in attrs:
+                        total += params[0] * params[1]
+                elif kind not in FREE:
+                    total += BIT_COSTS.get(kind, 1) * params[0]
+            totals[name] = total
+        return totals[name]
+
+    return comp_area("main")
+
+
+def _read_json(path, default):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def _write_json(path, data):
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name)
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def measure(day_dir, args, converter, input_path, digest):
+    """Get the cycles and answer for a design on an input, and its area,
+    reusing cached measurements.
+    """
+    results_path = cache.entry_dir(day_dir, args) / "tune.json"
+    results = _read_json(results_path, {})
+    if "area" not in results:
+        results["area"] = area(cache.futil(day_dir, args))
+    runs = results.setdefault("runs", {})
+    if digest not in runs:
+        options = batch.convert_options(
+            converter, batch.load_options(day_dir, args),
+        )
+        result = batch.run_one(cache.model(day_dir, args), converter,
+                               input_path, options)
+        runs[digest] = {k: result[k] for k in ("answer", "cycles")}
+    _write_json(results_path, results)
+
+    return dict(runs[digest], area=results["area"])
+
+
+def pareto(results):
+    """Mark the results that no other result beats on both cycles and
+    area.
+    """
+    for r in results:
+        r["pareto"] = not any(
+            o["cycles"] <= r["cycles"] and o["area"] <= r["area"] and
+            (o["cycles"], o["area"]) != (r["cycles"], r["area"])
+            for o in results
+        )
+
+
+def tune(day_dir, base_args, input_path):
+    """Measure every point in a day's design space on one input.
+
+    Return the results, fastest first.
+    """
+    converter = batch.load_module(day_dir, "convert")
+    space = batch.load_module(day_dir, "accelgen").TUNING_SPACE
+    with open(input_path) as f:
+        meta = converter.meta(f)
+    with open(input_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+
+    results = []
+    for point in points(space, meta):
+        args = base_args + point
+        result = measure(day_dir, args, converter, input_path, digest)
+        results.append(dict(result, args=shlex.join(args)))
+
+    # All configurations should compute the same thing as the first
+    # (default) one.
+    for r in results:
+        r["match"] = r["answer"] == results[0]["answer"]
+
+    pareto(results)
+    results.sort(key=lambda r: (r["cycles"], r["area"]))
+    best = next((r for r in results if r["match"]), None)
+    for r in results:
+        r["best"] = r is best
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--day", default=".",
+                        help="day directory containing accelgen.py")
+    parser.add_argument("--args", default="", type=shlex.split,
+                        help="fixed arguments for accelgen.py")
+    parser.add_argument("input", help="puzzle input to measure on")
+    opts = parser.parse_args()
+
+    for result in tune(opts.day, opts.args, opts.input):
+        print(json.dumps(result, sort_keys=True), flush=True)
+
+
+if __name__ == "__main__":
+    main()
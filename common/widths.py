@@ -0,0 +1,35 @@
+"""Size datapaths to the values they actually carry.
+
+By default, the generators use wide (usually 32-bit) registers and
+adders for running sums. When we know bounds on the input, which each
+`convert.py` reports with `--meta`, they can size these to the widths
+the values need instead. Narrower datapaths mean less area, shorter
+carry chains, and faster simulation. Interface memories keep their usual
+widths so the host side doesn't change, and values get resized on the
+way in and out.
+"""
+from calyx import py_ast as ast
+
+
+def bits(value):
+    """Get the number of bits we need to hold values up to `value`.
+    """
+    return max(value.bit_length(), 1)
+
+
+def fit(comp, name, port, width, dest_width):
+    """Resize a value from `width` bits to `dest_width` bits.
+
+    Call this in the group (or continuous block) that uses the result.
+    Narrower destinations truncate the value, so that's only safe when
+    the value is known to fit. Return the resized port, which is just
+    `port` when the widths already match.
+    """
+    if width == dest_width:
+        return port
+    if width < dest_width:
+        cell = comp.cell(name, ast.CompInst("std_pad", [width, dest_width]))
+    else:
+        cell = comp.cell(name, ast.Stdlib().slice(width, dest_width))
+    cell.in_ = port
+    return cell.out